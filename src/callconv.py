@@ -49,32 +49,51 @@ class call_iterator_t(ssa.ssa_contextual_iterator_t):
 
 class convention_t(object):
 
-  def __init__(self, function):
+  def __init__(self, function, summaries=None):
     self.function = function
+    self.summaries = summaries
     return
 
+  def callee_summary(self, call):
+    """ return the summary of the function called by 'call', if known. """
+    if self.summaries is None or type(call.fct) != value_t:
+      return
+    return self.summaries.get(call.fct.value)
+
 @add_calling_convention
 class live_locations(convention_t):
 
+  def stack_slots(self, context):
+    """ map each offset to the live stack locations of the form *(base - offset)
+        in this context, as (base, definition) pairs in the context order. """
+    slots = {}
+    for _def in context:
+      if type(_def) == deref_t and type(_def.op) == sub_t and type(_def.op.op2) == value_t:
+        slots.setdefault(_def.op.op2.value, []).append((_def.op.op1, _def))
+    return slots
+
   def process_live_stack_locations(self, context, call):
     """ find all live stack locations at the top of the stack in this context. """
 
     # top of stack
-    tos = call.stack.copy()
-    if not isinstance(tos, sub_t):
+    tos = call.stack
+    if not isinstance(tos, sub_t) or type(tos.op2) != value_t:
       # weird stack?
       return []
 
+    slots = self.stack_slots(context)
+
     args = []
+    offset = tos.op2.value
     while True:
       found = None
-      for _def in (context):
-        if _def.no_index_eq(deref_t(tos.copy())):
+      for base, _def in slots.get(offset, ()):
+        if base == tos.op1:
           found = _def
       if not found:
         break
       args.append(found)
-      tos.op2.value -= 4
+      offset -= 4
 
     return args
 
@@ -93,9 +112,15 @@ class live_locations(convention_t):
   def process(self):
     for ctx, stmt in call_iterator_t(self.function):
 
-      args = []
-      args += self.process_live_stack_locations(ctx, stmt.expr.op2)
-      args += self.process_live_registers(ctx, stmt)
+      summary = self.callee_summary(stmt.expr.op2)
+
+      stack = self.process_live_stack_locations(ctx, stmt.expr.op2)
+      regs = self.process_live_registers(ctx, stmt)
+      if summary:
+        stack = stack[:summary.params]
+        regs = [reg for reg in regs if reg.name in summary.reads]
+
+      args = stack + regs
 
       for arg in args:
         copy = arg.copy(with_definition=True)
@@ -151,6 +176,9 @@ class cdecl(live_locations):
   def process(self):
     for ctx, stmt in call_iterator_t(self.function):
       args = self.process_live_stack_locations(ctx, stmt.expr.op2)
+      summary = self.callee_summary(stmt.expr.op2)
+      if summary:
+        args = args[:summary.params]
       for arg in args:
         copy = arg.copy(with_definition=True)
         copy.definition = arg
@@ -0,0 +1,120 @@
+""" Call graph ordering.
+
+Callees are decompiled before their callers so that callers can use the
+summaries of their callees. Functions which call each other, directly or
+not, form a strongly connected component and are decompiled together.
+"""
+
+import Queue
+
+def strongly_connected_components(graph, key=None):
+  """ return the strongly connected components of 'graph', a dict of
+      function : [callee, ...] (tarjan's algorithm). a component is only
+      returned after all the components it calls, so callees come before
+      their callers. functions are visited, and components sorted, by
+      'key'. """
+  index = {}
+  lowlink = {}
+  stack = []
+  on_stack = set()
+  components = []
+  for root in sorted(graph.keys(), key=key):
+    if root in index:
+      continue
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    work = [(root, iter(graph[root]))]
+    while len(work) > 0:
+      name, callees = work[-1]
+      for callee in callees:
+        if callee not in index:
+          index[callee] = lowlink[callee] = len(index)
+          stack.append(callee)
+          on_stack.add(callee)
+          work.append((callee, iter(graph[callee])))
+          break
+        elif callee in on_stack:
+          lowlink[name] = min(lowlink[name], index[callee])
+      else:
+        work.pop()
+        if len(work) > 0:
+          caller = work[-1][0]
+          lowlink[caller] = min(lowlink[caller], lowlink[name])
+        if lowlink[name] == index[name]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member == name:
+              break
+          components.append(sorted(component, key=key))
+  return components
+
+class scheduler_t(object):
+  """ runs the components of a call graph on a process pool. a component
+      is started as soon as all the components it calls are done, so
+      independent components run in parallel while each caller still
+      sees the results of its callees. """
+
+  def __init__(self, graph, components):
+    self.components = components
+    owner = {name: i for i, component in enumerate(components) for name in component}
+
+    # component -> components it still waits for
+    self.waiting = {}
+    for i, component in enumerate(components):
+      self.waiting[i] = set(owner[callee] for name in component for callee in graph[name]) - set([i])
+
+    # component -> components which call it
+    self.callers = {i: [] for i in self.waiting}
+    for i in self.waiting:
+      for j in self.waiting[i]:
+        self.callers[j].append(i)
+
+    self.running = {} # component -> AsyncResult
+    self.done = Queue.Queue()
+    return
+
+  def start(self, pool, i, func, arguments):
+    self.running[i] = pool.apply_async(func, arguments(i),
+        callback=lambda result: self.done.put((i, result)))
+    return
+
+  def next_done(self, failed):
+    """ wait for a component to finish. a component whose worker raised
+        never reaches the callback, its result is failed(i, exception). """
+    while True:
+      for i, result in self.running.items():
+        if result.ready() and not result.successful():
+          del self.running[i]
+          try:
+            result.get()
+          except Exception as e:
+            return i, failed(i, e)
+      try:
+        # a plain get() cannot be interrupted with ctrl-c.
+        return self.done.get(True, 1)
+      except Queue.Empty:
+        pass
+
+  def run(self, pool, func, arguments, failed):
+    """ run func(*arguments(i)) on 'pool' for each component i, and yield
+        (i, result) as they finish. the callers of a component are only
+        started when the caller of run() asks for the next result, which
+        gives it a chance to record this one first. a failed component
+        counts as done, its callers still run. """
+    for i in sorted(self.waiting):
+      if len(self.waiting[i]) == 0:
+        self.start(pool, i, func, arguments)
+
+    for n in range(len(self.components)):
+      i, result = self.next_done(failed)
+      self.running.pop(i, None)
+      yield i, result
+      for caller in self.callers[i]:
+        self.waiting[caller].discard(i)
+        if len(self.waiting[caller]) == 0:
+          self.start(pool, caller, func, arguments)
+    return
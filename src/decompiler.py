@@ -1,3 +1,4 @@
+from collections import namedtuple
 
 import graph
 import ssa
@@ -11,6 +12,7 @@ from expressions import *
 
 import filters.controlflow
 import callconv
+import summary
 
 class function_block_t(object):
   def __init__(self, function, node):
@@ -60,12 +62,52 @@ class function_block_t(object):
     """ return a list of blocks where `block` leads to, based on gotos in `block` """
     return [self.function.blocks[ea] for ea in self.jump_from_ea]
 
+class blocks_t(dict):
+  """ the blocks of a function by address. counts its changes so the order
+      of the blocks can be cached, and takes the operands of removed blocks
+      out of the function's operand index. """
+
+  def __init__(self, function):
+    dict.__init__(self)
+    self.function = function
+    self.version = 0
+    return
+
+  def removed(self, block):
+    container = block.container
+    for stmt in container:
+      if stmt.container is container:
+        self.function.operand_index.detach_statement(stmt)
+    self.version += 1
+    return
+
+  def __setitem__(self, ea, block):
+    old = self.get(ea)
+    if old is not None and old is not block:
+      self.removed(old)
+    dict.__setitem__(self, ea, block)
+    self.version += 1
+    return
+
+  def __delitem__(self, ea):
+    self.removed(self[ea])
+    dict.__delitem__(self, ea)
+    return
+
+  def pop(self, ea, *default):
+    if ea in self:
+      self.removed(self[ea])
+    return dict.pop(self, ea, *default)
+
 class function_t(object):
   def __init__(self, graph):
     self.graph = graph
     self.arch = graph.arch
     self.ea = graph.ea
-    self.blocks = {ea: function_block_t(self, node) for ea, node in graph.nodes.iteritems()}
+    self.operand_index = operand_index_t(self)
+    self.blocks = blocks_t(self)
+    for ea, node in graph.nodes.iteritems():
+      self.blocks[ea] = function_block_t(self, node)
 
     self.uninitialized_stmt = statement_t(0, params_t())
     self.uninitialized = self.uninitialized_stmt.expr
@@ -113,7 +155,7 @@ class step_nothing_done(step_t):
 class step_basic_blocks(step_t):
   'Basic block information ready'
   def run(self):
-    self.decompiler.graph = graph.graph_t(self.ea, self.disasm)
+    self.decompiler.graph = graph.graph_t(self.ea, self.disasm, warnings=self.decompiler.warnings)
     self.decompiler.graph.find_control_flow()
     return
 
@@ -121,8 +163,10 @@ class step_ir_form(step_t):
   'Intermediate form is ready'
   def run(self):
     self.decompiler.graph.transform_ir()
+    if self.decompiler.summaries is not None:
+      summary.apply_summaries(self.decompiler.graph, self.decompiler.summaries)
     self.decompiler.function = function_t(self.decompiler.graph)
-    self.decompiler.ssa_tagger = ssa.ssa_tagger_t(self.decompiler.function)
+    self.decompiler.ssa_tagger = ssa.ssa_tagger_t(self.decompiler.function, self.decompiler.warnings)
     return
 
 class step_ssa_form_registers(step_t):
@@ -136,6 +180,10 @@ class step_stack_propagated(step_t):
   def run(self):
     p = propagator.stack_propagator_t(self.function)
     p.propagate()
+    for defn in p.inconsistent:
+      self.decompiler.warnings.append('%x: stack pointer %s@%u differs between the paths reaching it' % (
+        defn.parent_statement.ea, defn.name, defn.index))
+    self.decompiler.frame_size = p.frame_size()
     self.ssa_tagger.verify()
     return
 
@@ -173,7 +221,7 @@ class step_calls(step_t):
 
   def solve_call_parameters(self):
     cls = callconv.__conventions__[self.calling_convention]
-    resolver = cls(self.function)
+    resolver = cls(self.function, self.decompiler.summaries)
     resolver.process()
 
     # unlink all stack addresses, so we can eliminate assignments
@@ -194,6 +242,9 @@ class step_arguments_renamed(step_t):
 
     self.ssa_tagger.tag_arguments()
     self.ssa_tagger.verify()
+
+    if self.decompiler.summaries is not None:
+      self.decompiler.summaries.add(summary.summarize(self.decompiler))
     return
 
 class step_registers_pruned(step_t):
@@ -270,6 +321,69 @@ class step_combined(step_t):
 class step_decompiled(step_t):
   'Stack locations and registers are renamed'
 
+call_target_t = namedtuple('call_target_t', ['ea', 'target'])
+global_use_t = namedtuple('global_use_t', ['ea', 'kind'])
+
+class query_t(object):
+  """ a question about the function, answered with plain data as soon
+      as the decompiler reached `step`, so the steps after it never run. """
+
+  step = step_nothing_done
+
+  def __init__(self, decompiler):
+    self.decompiler = decompiler
+    return
+
+  def run(self):
+    pass
+
+class query_block_count(query_t):
+  'Number of basic blocks'
+  step = step_basic_blocks
+
+  def run(self):
+    return len(self.decompiler.graph.nodes)
+
+class query_call_targets(query_t):
+  'Call sites and their destination, None when indirect'
+  step = step_ir_form
+
+  def run(self):
+    calls = []
+    for call in operand_iterator_t(self.decompiler.function, klass=call_t):
+      target = call.fct.value if type(call.fct) == value_t else None
+      calls.append(call_target_t(call.parent_statement.ea, target))
+    return sorted(calls)
+
+class query_global_uses(query_t):
+  'Statements which read, write or take the address of a global'
+  step = step_ir_form
+
+  def __init__(self, decompiler, address):
+    query_t.__init__(self, decompiler)
+    self.address = address
+    return
+
+  def run(self):
+    uses = []
+    match = lambda op: type(op) == value_t and op.value == self.address
+    for op in operand_iterator_t(self.decompiler.function, filter=match):
+      if type(op.parent) != deref_t:
+        kind = 'address'
+      elif op.parent.is_def:
+        kind = 'write'
+      else:
+        kind = 'read'
+      uses.append(global_use_t(op.parent_statement.ea, kind))
+    return sorted(uses)
+
+class query_frame_size(query_t):
+  'Number of bytes of stack used below the return address'
+  step = step_stack_propagated
+
+  def run(self):
+    return self.decompiler.frame_size
+
 class decompiler_t(object):
   """ Decompiler. """
 
@@ -293,11 +407,22 @@ class decompiler_t(object):
     step_decompiled,
   ]
 
+  QUERIES = [
+    query_block_count,
+    query_call_targets,
+    query_global_uses,
+    query_frame_size,
+  ]
+
   def __init__(self, disasm, ea):
     self.ea = ea
     self.disasm = disasm
     self.calling_convention = 'live_locations'
 
+    # summary_t store for the functions called from this one, to which
+    # the summary of this function is added once it is known.
+    self.summaries = None
+
     self.step_generator = self.steps()
     self.current_step = None
     self.previous_steps = []
@@ -305,6 +430,11 @@ class decompiler_t(object):
     self.graph = None
     self.function = None
     self.ssa_tagger = None
+
+    # everything above belongs to this decompiler alone, several of them
+    # may be stepped in turn or from different threads. problems which do
+    # not stop the decompilation are reported here rather than printed.
+    self.warnings = []
     return
 
   def run_step(self, klass):
@@ -321,6 +451,18 @@ class decompiler_t(object):
         break
     return
 
+  def reached(self, step):
+    """ True if the given step was already performed. """
+    return any(type(done) == step for done in self.previous_steps)
+
+  def query(self, klass, *args):
+    """ answer a query_t, decompiling only as far as it requires. when
+        the decompiler is already past the query's step, the answer
+        describes the function as transformed by the later steps. """
+    if not self.reached(klass.step):
+      self.step_until(klass.step)
+    return klass(self, *args).run()
+
   def steps(self):
     """ this is a generator function which yields each decompilation steps
         as they are performed, which allows the caller can then observe the
@@ -105,7 +105,7 @@ class replaceable_t(object):
     """ get the nearest parent statement of this expression. """
     import statements
     obj = self
-    while obj:
+    while obj is not None:
       if not obj.__parent:
         break
       if isinstance(obj.__parent[0], statements.statement_t):
@@ -141,6 +141,21 @@ class replaceable_t(object):
     self.__parent = parent
     return
 
+  @property
+  def parent_key(self):
+    """ get the key under which this object is found in its parent. """
+    if self.__parent:
+      return self.__parent[1]
+    return
+
+  @property
+  def operand_index(self):
+    """ get the operand index of the function this object is attached to. """
+    stmt = self.parent_statement
+    if stmt and stmt.container:
+      return stmt.container.block.function.operand_index
+    return
+
   def replace(self, new):
     """ replace this object in the parent's operands list for a new object
         and return the old object (which is a reference to 'self'). """
@@ -149,16 +164,22 @@ class replaceable_t(object):
     k = self.__parent[1]
     old = self.__parent[0][k]
     assert old is self, "parent operand should have been this object ?!"
+    index = self.operand_index
     self.__parent[0][k] = new
     assert new.parent
     old.parent = None # unlink the old parent to maintain consistency.
+    if index:
+      index.detach(old)
     return old
 
   def pluck(self):
     """ remove the current expression from its current place in the tree """
+    index = self.operand_index
     k = self.__parent[1]
     self.__parent[0][k] = None
     self.__parent = None
+    if index:
+      index.detach(self)
     return self
 
 class regloc_t(assignable_t, replaceable_t):
@@ -390,11 +411,21 @@ class expr_t(replaceable_t):
       assert isinstance(value, replaceable_t), 'operand %s is not replaceable' % (repr(value), )
       assert value.parent is None, 'operand %s already has a parent? tried to assign into #%s of %s' % (value.__class__.__name__, str(key), self.__class__.__name__)
       value.parent = (self, key)
+    old = self.__operands[key]
     self.__operands[key] = value
+    index = self.operand_index
+    if index:
+      if old is not None and old is not value and old.parent is self:
+        index.detach(old)
+      if value is not None:
+        index.attach(value)
     return
 
   def remove(self, op):
+    index = self.operand_index
     self.__operands.remove(op)
+    if index:
+      index.detach(op)
     for i in range(len(self.__operands)):
       _op = self.__operands[i]
       _op.parent = (self, i)
@@ -417,16 +448,22 @@ class expr_t(replaceable_t):
   def iteroperands(self, depth_first=False, ltr=True):
     """ iterate over all operands, depth first, left to right """
 
-    if not depth_first:
-      yield self
-    ops = self.__operands if ltr else reversed(self.__operands)
-    for o in ops:
-      if not o:
+    # (operand, expanded) pairs; an operand is expanded once its own
+    # operands were pushed on the stack.
+    stack = [(self, False)]
+    while len(stack) > 0:
+      op, expanded = stack.pop()
+      if expanded or not isinstance(op, expr_t):
+        yield op
         continue
-      for _o in o.iteroperands(depth_first, ltr):
-        yield _o
-    if depth_first:
-      yield self
+      if depth_first:
+        stack.append((op, True))
+      else:
+        yield op
+      ops = reversed(op.__operands) if ltr else op.__operands
+      for o in ops:
+        if o:
+          stack.append((o, False))
     return
 
   def unlink(self):
@@ -129,49 +129,124 @@ class conditional_t(object):
       self.top, self.left, self.right, self.bottom)
 
   @staticmethod
-  def diff(priors, context):
-    prior = list(reversed(priors[context[-1]]))
-    ctx = list(reversed(context[:-1]))
-    for block in ctx:
-      if block not in prior:
+  def post_dominators(order, forward):
+    """ compute the immediate post-dominator of each block over the forward
+        edges only, which form a DAG. blocks are processed in postorder so
+        that every successor is done before its predecessors, which makes
+        a single pass sufficient. `None` stands for the function exit. """
+    number = {block: i for i, block in enumerate(order)}
+    number[None] = -1
+    ipdom = {}
+
+    def intersect(a, b):
+      while a is not b:
+        while number[a] > number[b]:
+          a = ipdom[a]
+        while number[b] > number[a]:
+          b = ipdom[b]
+      return a
+
+    for block in order:
+      succs = forward[block]
+      if len(succs) == 0:
+        ipdom[block] = None
         continue
-      i = prior.index(block)
-      left = list(reversed(prior[1:i]))
-      right = list(reversed(ctx[:ctx.index(block)]))
-      return conditional_t(block, left, right, prior[0])
-    return
+      pdom = succs[0]
+      for succ in succs[1:]:
+        pdom = intersect(pdom, succ)
+      ipdom[block] = pdom
+    return ipdom
 
   @staticmethod
-  def visit(function, block, conds, visited, context, priors):
-    if block in visited:
-      diff = conditional_t.diff(priors, context + [block])
-      if diff:
-        for cond in conds:
-          if cond.top is diff.top:
-            return
-        conds.append(diff)
-      return
-    context.append(block)
-    priors[block] = context[:]
-    if block not in visited:
-      visited.append(block)
-    if len(block.container) == 0:
-      return
-    stmt = block.container[-1]
-    if type(stmt) == goto_t and stmt.is_known():
-      next = function.blocks[stmt.expr.value]
-      conditional_t.visit(function, next, conds, visited, context[:], priors)
-    elif type(stmt) == branch_t:
-      next = function.blocks[stmt.true.value]
-      conditional_t.visit(function, next, conds, visited, context[:], priors)
-      next = function.blocks[stmt.false.value]
-      conditional_t.visit(function, next, conds, visited, context[:], priors)
-    return
+  def region(forward, rpo, start, bottom):
+    """ return all blocks reachable from `start` through forward edges
+        without going through `bottom`, in reverse postorder. """
+    if start is bottom:
+      return []
+    blocks = set([start])
+    stack = [start]
+    while len(stack) > 0:
+      block = stack.pop()
+      for next in forward[block]:
+        if next is bottom or next in blocks:
+          continue
+        blocks.add(next)
+        stack.append(next)
+    return sorted(blocks, key=lambda block: rpo[block])
+
+  @staticmethod
+  def leading_to(forward, blocks, bottom):
+    """ keep only the blocks from which `bottom` can be reached. `blocks`
+        must be in reverse postorder. """
+    reaching = set()
+    for block in reversed(blocks):
+      if any(next is bottom or next in reaching for next in forward[block]):
+        reaching.add(block)
+    return [block for block in blocks if block in reaching]
 
   @staticmethod
   def find(function):
+    """ find all if-then and if-then-else regions in the function.
+
+        the immediate post-dominator of each branch block is where both
+        sides join back together. only forward edges are considered, so
+        that joins through a loop's back edge are left to the loop
+        reconstruction. when both sides meet earlier than that (through
+        a goto), the first shared block is used as the join instead. """
+    successors = {}
+    for block in function.blocks.values():
+      successors[block] = iterators.block_successors(function, block)
+
+    order = iterators.block_postorder(function, successors)
+    rpo = {block: len(order) - i for i, block in enumerate(order)}
+
+    forward = {}
+    for block in order:
+      forward[block] = [next for next in successors[block] if rpo[next] > rpo[block]]
+
+    ipdom = conditional_t.post_dominators(order, forward)
+
+    # outer conditionals are found first, `claimed` tells which side
+    # of the innermost conditional each block belongs to.
     conditionals = []
-    conditional_t.visit(function, function.entry_block, conditionals, [], [], {})
+    claimed = {}
+    for top in reversed(order):
+      if len(set(successors[top])) != 2:
+        continue
+      true, false = successors[top]
+      if true not in forward[top] or false not in forward[top]:
+        continue
+      bottom = ipdom[top]
+      left = conditional_t.region(forward, rpo, true, bottom)
+      right = conditional_t.region(forward, rpo, false, bottom)
+      shared = set(left).intersection(right)
+      if len(shared) > 0:
+        join = min(shared, key=lambda block: rpo[block])
+        if join is true:
+          # the right side falls into the left side, only its first
+          # block is kept and the rest is joined with gotos.
+          right = right[:1]
+        elif join is false:
+          left = left[:1]
+        else:
+          bottom = join
+          left = conditional_t.region(forward, rpo, true, bottom)
+          left = conditional_t.leading_to(forward, left, bottom)
+          right = conditional_t.region(forward, rpo, false, bottom)
+          right = conditional_t.leading_to(forward, right, bottom)
+      if bottom is None:
+        continue
+      # a conditional may not reach into the other side of the
+      # conditional that contains it.
+      owner = claimed.get(top)
+      if any(block in claimed and claimed[block] != owner for block in left + right):
+        continue
+      cond = conditional_t(top, left, right, bottom)
+      for block in left:
+        claimed[block] = (cond, 'left')
+      for block in right:
+        claimed[block] = (cond, 'right')
+      conditionals.insert(0, cond)
     return conditionals
 
   @staticmethod
@@ -612,7 +687,10 @@ class controlflow_t(controlflow_common_t):
     return self.prioritizers[-1]
 
   def reconstruct(self):
-    self.reconstruct_forward(self.function.blocks.values())
+    # the entry block goes first, the remaining blocks are assembled into it.
+    entry = self.function.entry_block
+    blocks = [entry] + [block for block in self.function.blocks.values() if block is not entry]
+    self.reconstruct_forward(blocks)
     self.expand_branches()
     return
 
@@ -9,10 +9,21 @@ from expressions import *
 
 __all__ = []
 
-def simplifier(func):
-  __all__.append(func)
-
-@simplifier
+# dict of expression type : [filter, ...], in the order filters are declared.
+__dispatch__ = {}
+
+def simplifier(*types):
+  """ declare a filter which applies only to expressions of the given types. """
+  def register(func):
+    __all__.append(func)
+    for _type in types:
+      if _type not in __dispatch__:
+        __dispatch__[_type] = []
+      __dispatch__[_type].append(func)
+    return func
+  return register
+
+@simplifier(neq_t, eq_t, carry_t, b_not_t, b_or_t, b_and_t)
 def flags(expr):
   """ transform flags operations into simpler expressions such as lower-than
       or greater-than.
@@ -75,7 +86,7 @@ def flags(expr):
 
   return lower_t(op.pluck(), value_t(0, op.size))
 
-@simplifier
+@simplifier(add_t, sub_t)
 def add_sub(expr):
   """ Simplify nested math expressions when the second operand of
       each expression is a number literal.
@@ -112,7 +123,7 @@ def add_sub(expr):
 
   return
 
-@simplifier
+@simplifier(address_t, deref_t)
 def ref_deref(expr):
   """ remove nested deref_t and address_t that cancel each other
 
@@ -128,7 +139,7 @@ def ref_deref(expr):
 
   return
 
-@simplifier
+@simplifier(eq_t, neq_t, above_t, lower_t, aeq_t, leq_t)
 def equality_with_literals(expr):
   """ Applies commutativity of equality (==) sign
 
@@ -146,7 +157,7 @@ def equality_with_literals(expr):
 
   return
 
-@simplifier
+@simplifier(b_not_t, eq_t, lower_t, above_t)
 def negate(expr):
   """ transform negations into simpler, more readable forms
 
@@ -224,7 +235,7 @@ def negate(expr):
 
   return
 
-@simplifier
+@simplifier(b_or_t, b_and_t)
 def equalities(expr):
   """ equalities """
 
@@ -280,7 +291,7 @@ def equalities(expr):
 
   return
 
-@simplifier
+@simplifier(add_t, sub_t)
 def correct_signs(expr):
   """ substitute addition or substraction by its inverse depending on the operand sign
 
@@ -296,7 +307,7 @@ def correct_signs(expr):
 
   return
 
-@simplifier
+@simplifier(xor_t)
 def special_xor(expr):
   """ transform xor_t into a literal 0 if both operands to the xor are the same
 
@@ -308,7 +319,7 @@ def special_xor(expr):
 
   return
 
-@simplifier
+@simplifier(and_t)
 def special_and(expr):
   """ transform the and (&) operator into a simpler form in the special case
   that both operands are the same
@@ -321,10 +332,11 @@ def special_and(expr):
 
   return
 
-def once(expr, deep=False):
-  """ run all filters and return the first available simplification """
+def rewrite(expr):
+  """ run the filters for this type of expression and return the first
+      available simplification. """
 
-  for filter in __all__:
+  for filter in __dispatch__.get(type(expr), ()):
     newexpr = filter(expr)
     if newexpr:
       if expr.parent:
@@ -334,6 +346,15 @@ def once(expr, deep=False):
         expr.replace(newexpr)
       return newexpr
 
+  return
+
+def once(expr, deep=False):
+  """ run all filters and return the first available simplification """
+
+  newexpr = rewrite(expr)
+  if newexpr:
+    return newexpr
+
   if deep and isinstance(expr, expr_t):
     for op in expr.operands:
       newexpr = once(op, deep)
@@ -344,12 +365,42 @@ def once(expr, deep=False):
 
 def run(expr, deep=False):
   """ combine expressions until they cannot be combined any more.
-      return the new expression. """
-
-  while True:
-    newexpr = once(expr, deep=deep)
-    if not newexpr:
-      break
-    expr = newexpr
+      return the new expression.
+
+      with `deep`, operands are simplified before the expression which
+      contains them. when an expression is rewritten, only the new
+      expression is simplified again: the operands which were moved
+      into it are already as simple as they can be. """
+
+  if not deep:
+    while True:
+      newexpr = rewrite(expr)
+      if not newexpr:
+        break
+      expr = newexpr
+    return expr
+
+  # dict of id(expr) : expr, for expressions which cannot be simplified.
+  done = {}
+  stack = [(expr, False)]
+  while len(stack) > 0:
+    op, expanded = stack.pop()
+    if id(op) in done:
+      continue
+    if not expanded and isinstance(op, expr_t):
+      stack.append((op, True))
+      for _op in reversed(list(op.operands)):
+        if _op is not None and id(_op) not in done:
+          stack.append((_op, False))
+      continue
+    newexpr = rewrite(op)
+    if newexpr:
+      if op is expr:
+        expr = newexpr
+      # some filters modify an operand in place and return it.
+      done.pop(id(newexpr), None)
+      stack.append((newexpr, False))
+      continue
+    done[id(op)] = op
 
   return expr
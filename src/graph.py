@@ -1,5 +1,8 @@
 """ Holds the basic block representation prior to and during disassembly. """
 
+import bisect
+from collections import OrderedDict
+
 from expressions import *
 from statements import *
 
@@ -16,19 +19,24 @@ class node_t(object):
 
     self.jump_from = []
     self.jump_to = []
+    self.__jump_from = set()
+    self.__jump_to = set()
 
     self.falls_into = None
     self.is_return_node = False
+    self.leaves_function = False # True if control can leave the function other than by returning
 
     return
 
   def add_jump_from(self, node):
-    if node not in self.jump_from:
+    if node not in self.__jump_from:
+      self.__jump_from.add(node)
       self.jump_from.append(node)
     return
 
   def add_jump_to(self, node):
-    if node not in self.jump_to:
+    if node not in self.__jump_to:
+      self.__jump_to.add(node)
       self.jump_to.append(node)
     return
 
@@ -37,12 +45,15 @@ class node_t(object):
 
 class graph_t(object):
 
-  def __init__(self, ea, arch, follow_calls=True):
+  def __init__(self, ea, arch, follow_calls=True, warnings=None):
 
     self.ea = ea
     self.follow_calls = follow_calls
     self.arch = arch
 
+    # problems found while following the control flow, as strings.
+    self.warnings = warnings if warnings is not None else []
+
     self.func_items = self.arch.get_function_items(self.ea)
 
     self.nodes = {}
@@ -61,66 +72,81 @@ class graph_t(object):
 
     return '\n'.join(lines)
 
-  def jump_targets(self):
+  def decode_jumps(self):
+    """ return the set of return instructions and a dict of
+        jump instruction : [destination, ...] for the function. each
+        instruction is decoded only once. """
+
+    returns = set()
+    jumps = {}
+    for item in self.func_items:
+      if self.arch.is_return(item):
+        returns.add(item)
+      elif self.arch.has_jump(item):
+        jumps[item] = list(self.arch.jump_branches(item))
+    return returns, jumps
+
+  def jump_targets(self, jumps, items):
     """ find each point in the function which is the
     destination of a jump (conditional or not).
 
     jump destinations are the points that delimit new
     blocks. """
 
+    targets = set()
     for item in self.func_items:
-      if self.arch.has_jump(item):
-        for dest in self.arch.jump_branches(item):
-          if type(dest) == value_t and dest.value in self.func_items:
-            ea = dest.value
-            yield ea
-    return
+      for dest in jumps.get(item, ()):
+        if type(dest) == value_t and dest.value in items:
+          targets.add(dest.value)
+    return targets
 
   @property
   def entry_node(self):
     return self.nodes[self.ea]
 
   def find_control_flow(self):
+    """ split the function into nodes. each node is grown from its first
+        instruction, in address order, until it reaches a jump, a return
+        or the first instruction of another node. """
 
-    # find all jump targets
-    jump_targets = list(set(self.jump_targets()))
+    items = sorted(self.func_items)
+    item_set = set(items)
+    returns, jumps = self.decode_jumps()
 
-    # prepare first node
-    node = node_t(self.ea)
-    next_nodes = [node, ]
-    self.nodes[self.ea] = node
+    # find all jump targets
+    jump_targets = self.jump_targets(jumps, item_set)
 
     # create all empty nodes.
+    self.nodes[self.ea] = node_t(self.ea)
     for target in jump_targets:
-      if target in self.nodes.keys():
-        continue
-      node = node_t(target)
-      self.nodes[target] = node
-      next_nodes.append(node)
+      if target not in self.nodes:
+        self.nodes[target] = node_t(target)
 
-    while len(next_nodes) > 0:
+    for start in sorted(self.nodes.keys()):
 
-      # get next node
-      node = next_nodes.pop(0)
-      ea = node.ea
+      node = self.nodes[start]
+      ea = start
+      i = bisect.bisect_left(items, ea)
 
       while True:
         # append current ea to the node's locations array
         node.items.append(ea)
 
-        if self.arch.is_return(ea):
+        if ea in returns:
           node.is_return_node = True
           break
 
-        elif self.arch.has_jump(ea):
-          for dest in self.arch.jump_branches(ea):
+        elif ea in jumps:
+          for dest in jumps[ea]:
             if type(dest) != value_t:
-              print '%x: cannot follow jump to %s' % (ea, repr(dest))
+              self.warnings.append('%x: cannot follow jump to %s' % (ea, repr(dest)))
+              node.leaves_function = True
               continue
 
             ea_to = dest.value
-            if ea_to not in self.func_items:
-              print '%x: jumped outside of function to %x' % (ea, ea_to, )
+            if ea_to not in item_set:
+              self.warnings.append('%x: jumped outside of function to %x' % (ea, ea_to, ))
+              node.leaves_function = True
             else:
               tonode = self.nodes[ea_to]
               node.add_jump_to(tonode)
@@ -129,9 +155,14 @@ class graph_t(object):
 
         next_ea = self.arch.next_instruction_ea(ea)
 
-        if next_ea not in self.func_items:
-          print '%x: jumped outside of function: %x' % (ea, next_ea)
-          break
+        i += 1
+        if i == len(items) or items[i] != next_ea:
+          if next_ea not in item_set:
+            self.warnings.append('%x: jumped outside of function: %x' % (ea, next_ea))
+            node.leaves_function = True
+            break
+          # instructions overlap.
+          i = bisect.bisect_left(items, next_ea)
 
         ea = next_ea
 
@@ -149,17 +180,17 @@ class graph_t(object):
   def iternodes(self):
     """ iterate over all nodes in the order that they most logically follow each other. """
 
-    done = []
-    nodes = [self.entry_node, ]
+    done = set()
+    nodes = OrderedDict([(self.entry_node, None), ])
 
     while len(nodes) > 0:
 
-      node = nodes.pop(0)
+      node, _ = nodes.popitem(last=False)
 
       if node in done:
         continue
 
-      done.append(node)
+      done.add(node)
 
       yield node
 
@@ -167,8 +198,8 @@ class graph_t(object):
         if node not in done:
           if node in nodes:
             # re-add at the end
-            nodes.remove(node)
-          nodes.append(node)
+            del nodes[node]
+          nodes[node] = None
 
     return
 
@@ -189,6 +220,31 @@ class graph_t(object):
 
     return stmt
 
+  def remove_unreachable_nodes(self):
+    """ remove the nodes with statements which can no longer be reached
+        from the entry node, following the gotos and branches. """
+
+    reachable = set([self.ea])
+    todo = [self.ea]
+    while len(todo) > 0:
+      node = self.nodes[todo.pop()]
+      for stmt in node.statements:
+        if type(stmt) == goto_t and stmt.is_known():
+          targets = [stmt.expr.value]
+        elif type(stmt) == branch_t:
+          targets = [stmt.true.value, stmt.false.value]
+        else:
+          continue
+        for ea in targets:
+          if ea in self.nodes and ea not in reachable:
+            reachable.add(ea)
+            todo.append(ea)
+
+    for ea in self.nodes.keys():
+      if ea not in reachable and len(self.nodes[ea].statements) > 0:
+        del self.nodes[ea]
+    return
+
   def make_statement(self, ea, item):
     """ always return a statement from an expression or a statement. """
 
@@ -222,5 +278,88 @@ class graph_t(object):
       if node.falls_into:
         node.statements.append(goto_t(item, value_t(node.falls_into.ea, self.arch.address_size)))
 
+    self.prune_dead_flags()
+
+    return
+
+  def flag_definition(self, stmt):
+    """ return the flag assigned by this statement, or None. """
+    if isinstance(stmt.expr, assign_t) and isinstance(stmt.expr.op1, flagloc_t):
+      return stmt.expr.op1
+    return
+
+  def flag_uses(self, stmt):
+    """ return the set of flags read by this statement. """
+    _def = self.flag_definition(stmt)
+    uses = set()
+    for expr in stmt.expressions:
+      if expr is None:
+        continue
+      for op in expr.iteroperands():
+        if isinstance(op, flagloc_t) and op is not _def:
+          uses.add(op.which)
+    return uses
+
+  def prune_dead_flags(self):
+    """ remove assignments to flags which are never read. most instructions
+        set several flags and only a few of them are ever tested, removing
+        them here makes all following steps cheaper.
+
+        flags read at the start of a node are live at the end of each node
+        that leads to it. a node that leads nowhere without returning keeps
+        all its flags live. """
+
+    # flags read before being assigned in each node, and flags assigned in each node.
+    gen = {}
+    kill = {}
+    every = set()
+    for node in self.nodes.values():
+      gen[node] = set()
+      kill[node] = set()
+      for stmt in reversed(node.statements):
+        _def = self.flag_definition(stmt)
+        if _def is not None:
+          every.add(_def.which)
+          kill[node].add(_def.which)
+          gen[node].discard(_def.which)
+        gen[node].update(self.flag_uses(stmt))
+
+    live_in = {}
+    live_out = {}
+    for node in self.nodes.values():
+      if node.is_return_node or len(node.jump_to) > 0:
+        live_out[node] = set()
+      else:
+        live_out[node] = set(every)
+      live_in[node] = gen[node] | (live_out[node] - kill[node])
+
+    # propagate backwards until nothing changes.
+    pending = list(self.nodes.values())
+    while len(pending) > 0:
+      node = pending.pop()
+      for _from in node.jump_from:
+        new = live_in[node] - live_out[_from]
+        if len(new) == 0:
+          continue
+        live_out[_from].update(new)
+        new = new - kill[_from]
+        if len(new - live_in[_from]) > 0:
+          live_in[_from].update(new)
+          pending.append(_from)
+
+    for node in self.nodes.values():
+      live = set(live_out[node])
+      statements = []
+      for stmt in reversed(node.statements):
+        _def = self.flag_definition(stmt)
+        if _def is not None:
+          if _def.which not in live:
+            continue
+          live.discard(_def.which)
+        live.update(self.flag_uses(stmt))
+        statements.append(stmt)
+      statements.reverse()
+      node.statements = statements
+
     return
 
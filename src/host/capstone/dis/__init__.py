@@ -8,13 +8,11 @@ from . import intel
 def disassembler_for_arch(md):
 
   if md.arch == capstone.CS_ARCH_X86 and md.mode & capstone.CS_MODE_32:
-    print 'Architecture: 32-bit intel.'
     return (ir.IR_INTEL_x86, ir.intel.ir_intel_x86, intel.disassembler)
   elif md.arch == capstone.CS_ARCH_X86 and md.mode & capstone.CS_MODE_64:
-    print 'Architecture: 64-bit intel.'
     return (ir.IR_INTEL_x64, ir.intel.ir_intel_x64, intel.disassembler)
 
-  raise RuntimeError("Don't know which arch to choose for %s" % (repr(filetype), ))
+  raise RuntimeError("Don't know which arch to choose for %s" % (repr((md.arch, md.mode)), ))
 
 def create(md, code, ea=0):
   """
@@ -24,6 +22,17 @@ def create(md, code, ea=0):
   """
 
   ir_id, ir_cls, dis_cls = disassembler_for_arch(md)
+  return disassembler_class(ir_id, ir_cls, dis_cls)(ir_id, md, code, ea)
+
+# (ir_id, host class) -> composed disassembler class
+classes = {}
+
+def disassembler_class(ir_id, ir_cls, dis_cls):
+  """ compose the disassembler class once per architecture, its instances
+      share the tables built by the architecture support. """
+
+  if (ir_id, dis_cls) in classes:
+    return classes[(ir_id, dis_cls)]
 
   class disassembler(dis_cls, ir_cls): # disassembler (host) class must be left-most.
     def __init__(self, ir_id, md, code, ea):
@@ -35,7 +44,5 @@ def create(md, code, ea=0):
       ir_cls.__init__(self)
       return
 
-  dis = disassembler(ir_id, md, code, ea)
-
-  return dis
-
+  # another thread may compose the class at the same time, only one is kept.
+  return classes.setdefault((ir_id, dis_cls), disassembler)
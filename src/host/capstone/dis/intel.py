@@ -4,6 +4,10 @@ import capstone
 
 from expressions import *
 from statements import *
+from ir.intel import *
+
+# capstone register id -> (IR register index, name), by (arch, mode).
+register_tables = {}
 
 class disassembler(object):
 
@@ -11,9 +15,37 @@ class disassembler(object):
     self.strings = {}
     self.names = {}
     self.md.detail = True
+    self.registers = self.__register_table()
+    self.load(self.code, self.ea)
+    return
+
+  def load(self, code, ea):
+    self.code = code
+    self.ea = ea
     self.instructions = {i.address: i for i in self.md.disasm(self.code, self.ea)}
+    self.operand_templates = {} # (ea, n) -> decoded operand expression
+    return
+
+  def reset(self, code, ea=0):
+    """ reuse this instance for the function in 'code' at 'ea'. names and
+        strings are kept, they belong to the whole binary. """
+    self.load(code, ea)
+    self.clear_classes()
     return
 
+  def __register_table(self):
+    """ return the table translating capstone register ids into IR
+        register indexes and names, building it once per capstone mode. """
+    key = (self.md.arch, self.md.mode)
+    if key not in register_tables:
+      table = [(None, None)] * capstone.x86.X86_REG_ENDING
+      for which in range(1, capstone.x86.X86_REG_ENDING):
+        name = capstone._cs.cs_reg_name(self.md.csh, which)
+        if name:
+          table[which] = (self.get_regindex(name), name)
+      register_tables[key] = table
+    return register_tables[key]
+
   def add_name(self, ea, name):
     self.names[ea] = name
     return
@@ -52,28 +84,63 @@ class disassembler(object):
     """ return the instruction size. """
     return self.instructions[ea].size
 
-  def __reg_index(self, which):
-    """ returns the IR index of the register from the capstone index. """
-    name = capstone._cs.cs_reg_name(self.md.csh, which)
-    return self.get_regindex(name)
+  def classify(self, ea):
+    """ return the insn_class_t record for the instruction at 'ea',
+        based on capstone's instruction groups. only the jumps lifted by
+        generate_statements() are classified as conditional jumps. """
+    insn = self.instructions[ea]
+    next_ea = insn.address + insn.size
+    if insn.group(capstone.CS_GRP_RET):
+      return insn_class_t(FLOW_RETURN, (), next_ea, insn.size)
+    if insn.group(capstone.CS_GRP_CALL):
+      return insn_class_t(FLOW_CALL, (), next_ea, insn.size)
+    if insn.id in (capstone.x86.X86_INS_JMP, capstone.x86.X86_INS_LJMP):
+      # a far jump to ptr16:32 has the segment first, then the offset.
+      op = insn.operands[-1]
+      targets = (op.imm if op.type == capstone.x86.X86_OP_IMM else None, )
+      return insn_class_t(FLOW_JUMP, targets, next_ea, insn.size)
+    if insn.group(capstone.CS_GRP_JUMP) and insn.mnemonic in self.conditional_jumps:
+      op = insn.operands[0]
+      targets = (op.imm if op.type == capstone.x86.X86_OP_IMM else None, next_ea)
+      return insn_class_t(FLOW_CONDITIONAL_JUMP, targets, next_ea, insn.size)
+    # other jumps (loop, jecxz, ...) are not lifted into branches, like
+    # any other instruction they fall through.
+    return insn_class_t(FLOW_NORMAL, (), next_ea, insn.size)
+
+  def __regloc(self, which, size):
+    """ returns a register location from the capstone index. """
+    index, name = self.registers[which]
+    return regloc_t(index, size, name=name)
+
+  def get_operand_count(self, ea):
+    """ return the number of operands of the instruction at 'ea'. """
+    return len(self.instructions[ea].operands)
 
   def get_operand_expression(self, ea, n):
     """ return an expression representing the 'n'-th operand of the instruction at 'ea'. """
+    key = (ea, n)
+    if key not in self.operand_templates:
+      self.operand_templates[key] = self.__decode_operand(ea, n)
+    return self.operand_templates[key].copy()
+
+  def __decode_operand(self, ea, n):
+    """ build the expression for the 'n'-th operand of the instruction at 'ea'
+        from capstone's instruction details. """
 
     insn = self.instructions[ea]
     op = insn.operands[n]
 
     if op.type == capstone.x86.X86_OP_REG:
-      expr = regloc_t(self.__reg_index(op.reg), op.size*8, name=insn.reg_name(op.reg))
+      expr = self.__regloc(op.reg, op.size*8)
     elif op.type == capstone.x86.X86_OP_MEM:
 
       base, index, scale, disp = (None,)*4
 
       if op.mem.base:
-        base = regloc_t(self.__reg_index(op.mem.base), op.size*8, name=insn.reg_name(op.mem.base))
+        base = self.__regloc(op.mem.base, op.size*8)
 
       if op.mem.index:
-        index = regloc_t(self.__reg_index(op.mem.index), op.size*8, name=insn.reg_name(op.mem.index))
+        index = self.__regloc(op.mem.index, op.size*8)
 
       if op.mem.scale > 1:
         scale = value_t(op.mem.scale, op.size*8)
@@ -1,32 +1,49 @@
-import traceback
-
-available_disassemblers = {}
-
-try:
-  import idaapi # try importing ida's main module.
-  import ida.dis
-
-  print 'Using IDA backend.'
-  available_disassemblers['ida'] = ida.dis
-except ImportError as e:
-  pass
-except BaseException as e:
-  print repr(e)
-  traceback.print_exc()
-
-try:
-  import capstone # try importing capstone.
-  from .capstone import dis
-
-  print 'Using Capstone backend.'
-  available_disassemblers['capstone'] = dis
-except ImportError as e:
-  print repr(e)
-  traceback.print_exc()
-  pass
-except BaseException as e:
-  print repr(e)
-  traceback.print_exc()
-
-if len(available_disassemblers) == 0:
-  print 'No available backend.'
+""" host disassemblers, by name.
+
+a backend is imported the first time it is looked up, so that importing
+this module is cheap and quiet: worker processes only pay for the host
+they actually use, and missing backends are not reported unless asked for.
+"""
+
+import importlib
+
+# backend name -> module providing create()
+BACKENDS = {
+  'ida': 'host.ida.dis',
+  'capstone': 'host.capstone.dis',
+  # the offline host serves snapshots exported from IDA, it is always
+  # available but only used when given a snapshot.
+  'snapshot': 'host.snapshot.dis',
+}
+
+class backends_t(dict):
+  """ backend modules, imported on first use of available_disassemblers[name].
+      looking up a backend which cannot be imported raises ImportError. """
+
+  def __init__(self, modules):
+    dict.__init__(self)
+    self.modules = modules
+    return
+
+  def __missing__(self, name):
+    if name not in self.modules:
+      raise KeyError(name)
+    module = importlib.import_module(self.modules[name])
+    self[name] = module
+    return module
+
+  def __contains__(self, name):
+    """ return True if the backend can be imported. """
+    if dict.__contains__(self, name):
+      return True
+    try:
+      self[name]
+    except (KeyError, ImportError):
+      return False
+    return True
+
+  def names(self):
+    """ return the names of all backends which can be imported. """
+    return [name for name in sorted(self.modules.keys()) if name in self]
+
+available_disassemblers = backends_t(BACKENDS)
@@ -12,13 +12,11 @@ def disassembler_for_arch(arch_name=None):
     arch_name = idaapi.get_file_type_name()
 
   if '386' in arch_name:
-    print 'Architecture: 32-bit intel.'
     return (ir.IR_INTEL_x86, ir.intel.ir_intel_x86, intel.disassembler)
   elif 'x86-64' in arch_name:
-    print 'Architecture: 64-bit intel.'
     return (ir.IR_INTEL_x64, ir.intel.ir_intel_x64, intel.disassembler)
 
-  raise RuntimeError("Don't know which arch to choose for %s" % (repr(filetype), ))
+  raise RuntimeError("Don't know which arch to choose for %s" % (repr(arch_name), ))
 
 def create(arch_name=None):
   """ Find the correct disassembler module for this host.
@@ -29,6 +27,17 @@ def create(arch_name=None):
   """
 
   ir_id, ir_cls, dis_cls = disassembler_for_arch(arch_name)
+  return disassembler_class(ir_id, ir_cls, dis_cls)(ir_id)
+
+# (ir_id, host class) -> composed disassembler class
+classes = {}
+
+def disassembler_class(ir_id, ir_cls, dis_cls):
+  """ compose the disassembler class once per architecture, its instances
+      share the tables built by the architecture support. """
+
+  if (ir_id, dis_cls) in classes:
+    return classes[(ir_id, dis_cls)]
 
   class disassembler(dis_cls, ir_cls): # disassembler (host) class must be left-most.
     def __init__(self, ir_id):
@@ -37,7 +46,5 @@ def create(arch_name=None):
       ir_cls.__init__(self)
       return
 
-  dis = disassembler(ir_id)
-
-  return dis
-
+  # another thread may compose the class at the same time, only one is kept.
+  return classes.setdefault((ir_id, dis_cls), disassembler)
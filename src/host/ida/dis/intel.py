@@ -6,12 +6,61 @@ import idc
 
 from expressions import *
 from statements import *
+from ir.intel import *
 
 class disassembler(object):
 
   def __init__(self):
     self.registers_32 = ['eax', 'ecx', 'edx', 'ebx', 'esp', 'ebp', 'esi', 'edi']
     self.registers_64 = ['rax', 'rcx', 'rdx', 'rbx', 'rsp', 'rbp', 'rsi', 'rdi', 'r8', 'r9', 'r10', 'r11', 'r12']
+
+    # everything read from the database, see prefetch().
+    self.items = {} # function ea -> addresses of its instructions
+    self.mnemonics = {} # ea -> mnemonic
+    self.sizes = {} # ea -> instruction size
+    self.operand_templates = {} # ea -> [decoded operand expression or exception, ...]
+    self.names = {} # ea -> name or None
+    self.strings = {} # ea -> string or None
+    self.flags = {} # function ea -> function flags
+    return
+
+  def prefetch(self, ea):
+    """ read everything about the function at 'ea' from the database in a
+        single pass: its instructions, their mnemonics, sizes and operands,
+        and the names and strings they refer to. the decompilation is then
+        served from these tables. """
+
+    items = list(idautils.FuncItems(ea))
+    self.items[ea] = items
+
+    for item in items:
+      if item in self.sizes:
+        continue
+      self.fetch_instruction(item)
+      for op in self.operand_templates[item]:
+        if isinstance(op, BaseException):
+          continue
+        for value in op.iteroperands():
+          if type(value) == value_t and value.value not in self.names and idaapi.isEnabled(value.value):
+            self.get_ea_name(value.value)
+            self.get_string(value.value)
+
+    return items
+
+  def fetch_instruction(self, ea):
+    insn = idautils.DecodeInstruction(ea)
+    assert insn and insn.size > 0, '%x: no instruction' % (ea, )
+    self.sizes[ea] = insn.size
+    self.mnemonics[ea] = idc.GetMnem(ea)
+
+    operands = []
+    while len(operands) < len(insn.Operands) and insn[len(operands)].type != idaapi.o_void:
+      try:
+        operands.append(self.decode_operand(ea, insn[len(operands)]))
+      except BaseException as e:
+        # raised again if the decompiler uses this operand.
+        operands.append(e)
+    self.operand_templates[ea] = operands
     return
 
   def get_stack_register(self):
@@ -23,20 +72,61 @@ class disassembler(object):
   def get_leave_register(self):
     return 5 # ebp in ida.
 
+  def add_name(self, ea, name):
+    """ rename the location 'ea' in the database. """
+    idc.MakeNameEx(ea, name, idc.SN_NOWARN)
+    self.names[ea] = idc.Name(ea)
+    return
+
+  def add_string(self, ea, string):
+    """ define a string literal at 'ea' in the database. """
+    idc.MakeStr(ea, ea + len(string) + 1)
+    self.strings[ea] = idc.GetString(ea)
+    return
+
+  def forget_symbol(self, ea):
+    """ the name or string at 'ea' changed in the database, read it
+        again on next use. """
+    self.names.pop(ea, None)
+    self.strings.pop(ea, None)
+    return
+
+  def forget_function(self, ea):
+    """ the function at 'ea' is decompiled again: read its instructions,
+        their operands and the function flags from the database again,
+        they may have been edited since. names and strings are kept,
+        see forget_symbol(). """
+    for item in self.items.pop(ea, []):
+      self.mnemonics.pop(item, None)
+      self.sizes.pop(item, None)
+      self.operand_templates.pop(item, None)
+    self.flags.clear()
+    self.clear_classes()
+    return
+
   def get_ea_name(self, ea):
     """ return the name of this location, or None if no name is defined. """
-    return idc.Name(ea)
+    if ea not in self.names:
+      self.names[ea] = idc.Name(ea)
+    return self.names[ea]
 
   def get_string(self, ea):
     """ return the string starting at 'ea' or None if it is not a string. """
-    return idc.GetString(ea)
+    if ea not in self.strings:
+      self.strings[ea] = idc.GetString(ea)
+    return self.strings[ea]
 
   def function_does_return(self, ea):
     """ return False if the function does not return (ExitThread(), exit(), etc). """
-    if idc.GetFunctionFlags(call.fct.value) & idaapi.FUNC_NORET:
+    if self.get_function_flags(ea) & idaapi.FUNC_NORET:
       return False
     return True
 
+  def get_function_flags(self, ea):
+    if ea not in self.flags:
+      self.flags[ea] = idc.GetFunctionFlags(ea)
+    return self.flags[ea]
+
   def get_function_start(self, ea):
     """ return the address of the parent function, given any address inside that function. """
     func = idaapi.get_func(ea)
@@ -46,11 +136,15 @@ class disassembler(object):
 
   def get_function_items(self, ea):
     """ return all addresses that belong to the function at 'ea'. """
-    return list(idautils.FuncItems(ea))
+    if ea not in self.items:
+      self.prefetch(ea)
+    return list(self.items[ea])
 
   def get_mnemonic(self, ea):
     """ return textual mnemonic for the instruction at 'ea'. """
-    return idc.GetMnem(ea)
+    if ea not in self.mnemonics:
+      self.fetch_instruction(ea)
+    return self.mnemonics[ea]
 
   def get_regname(self, which):
     ### this is wrong until I can fix it.
@@ -60,9 +154,20 @@ class disassembler(object):
 
   def get_instruction_size(self, ea):
     """ return the instruction size. """
-    insn = idautils.DecodeInstruction(ea)
-    assert insn.size > 0, '%x: no instruction' % (ea, )
-    return insn.size
+    if ea not in self.sizes:
+      self.fetch_instruction(ea)
+    return self.sizes[ea]
+
+  def classify(self, ea):
+    """ return the insn_class_t record for the instruction at 'ea'. returns
+        and calls are recognized by ida, jumps by their mnemonic. """
+    if idaapi.is_ret_insn(ea):
+      size = self.get_instruction_size(ea)
+      return insn_class_t(FLOW_RETURN, (), ea + size, size)
+    if idaapi.is_call_insn(ea):
+      size = self.get_instruction_size(ea)
+      return insn_class_t(FLOW_CALL, (), ea + size, size)
+    return super(disassembler, self).classify(ea)
 
   def as_byte_value(self, value):
     if value < 0:
@@ -98,11 +203,23 @@ class disassembler(object):
 
     return types[op.dtyp]
 
+  def get_operand_count(self, ea):
+    """ return the number of operands of the instruction at 'ea'. """
+    if ea not in self.operand_templates:
+      self.fetch_instruction(ea)
+    return len(self.operand_templates[ea])
+
   def get_operand_expression(self, ea, n):
     """ return an expression representing the 'n'-th operand of the instruction at 'ea'. """
+    if ea not in self.operand_templates:
+      self.fetch_instruction(ea)
+    op = self.operand_templates[ea][n]
+    if isinstance(op, BaseException):
+      raise op
+    return op.copy()
 
-    insn = idautils.DecodeInstruction(ea)
-    op = insn[n]
+  def decode_operand(self, ea, op):
+    """ build the expression for the operand 'op' of the instruction at 'ea'. """
 
     if op.type == idaapi.o_reg:       #  General Register (al,ax,es,ds...)    reg
       sz = self.get_operand_size(op)
@@ -150,12 +267,10 @@ class disassembler(object):
   def get_call_expression(self, ea):
     """ get an expression representing a function call at this address. """
 
-    insn = idautils.DecodeInstruction(ea)
-
     fct = self.get_operand_expression(ea, 0)
 
     if type(fct) == value_t and \
-        idc.GetFunctionFlags(fct.value) & idaapi.FUNC_THUNK == idaapi.FUNC_THUNK:
+        self.get_function_flags(fct.value) & idaapi.FUNC_THUNK == idaapi.FUNC_THUNK:
 
       print '%x: call to function thunk %x' % (ea, fct.value)
 
@@ -190,7 +305,7 @@ class disassembler(object):
     # check if eax is a spoiled register for the target function.
     # if it is, change the expression into an assignment to eax
 
-    if type(fct) != value_t or not (idc.GetFunctionFlags(fct.value) & idaapi.FUNC_NORET):
+    if type(fct) != value_t or not (self.get_function_flags(fct.value) & idaapi.FUNC_NORET):
       expr = assign_t(self.resultreg.copy(), expr)
 
     return expr, spoils
@@ -0,0 +1,57 @@
+""" Export the database opened in IDA into a snapshot, which the
+offline host (host.snapshot) can decompile without IDA. Run from
+IDA's script prompt, or headless with:
+
+  idaq -A -S"export.py output.snapshot" input.idb
+"""
+
+import sys
+import traceback
+
+import idaapi
+import idautils
+import idc
+
+import host.dis
+from host.snapshot import snapshot_t, function_t, instruction_record
+
+def export_function(dis, snapshot, ea):
+  items = dis.get_function_items(ea)
+  flags = idc.GetFunctionFlags(ea)
+  snapshot.add_function(function_t(ea, idc.Name(ea), items,
+      flags & idaapi.FUNC_NORET != 0, flags & idaapi.FUNC_THUNK != 0))
+
+  for item in items:
+    if item not in snapshot.instructions:
+      snapshot.instructions[item] = instruction_record(dis, item)
+  return
+
+def export(filename):
+  """ export all the functions of the database to 'filename'. """
+
+  dis = host.dis.available_disassemblers['ida'].create()
+  arch = 'x86-64' if dis.address_size == 64 else 'x86'
+  snapshot = snapshot_t(arch)
+
+  for ea in idautils.Functions():
+    try:
+      export_function(dis, snapshot, ea)
+    except BaseException as e:
+      print '%x: could not export function: %s' % (ea, repr(e))
+      traceback.print_exc()
+
+  for ea, name in idautils.Names():
+    snapshot.names[ea] = name
+
+  for s in idautils.Strings():
+    snapshot.strings[s.ea] = str(s)
+
+  snapshot.save(filename)
+  print 'Exported %u functions to %s' % (len(snapshot.functions), filename)
+  return snapshot
+
+if __name__ == '__main__':
+  idaapi.autoWait()
+  export(idc.ARGV[1] if len(idc.ARGV) > 1 else idc.GetIdbPath() + '.snapshot')
+  if idaapi.cvar.batch:
+    idc.Exit(0)
@@ -2,6 +2,9 @@
 
 """
 
+import bisect
+import cgi
+
 import idc
 
 from output import c
@@ -13,151 +16,159 @@ except:
   print 'PySide not available'
   raise
 
-class token_fragment(object):
+# style of each kind of token, by css class.
+TOKEN_STYLES = {
+  c.GLOBAL: ('g', '#4aa3ff'), # light blue
+  c.KEYWORD: ('k', '#202dae'), # dark blue
+  c.NUMBER: ('n', '#00ac92'), # blue-green
+  c.STRING: ('s', '#007000'), # dark green
+  c.VAR: ('v', '#875b4e'), # brown
+}
 
-  def __init__(self, fragment, token):
-    self.fragment = fragment
-    self.token = token
-    return
+STYLESHEET = 'pre { font-family: "Liberation Mono", monospace; font-weight: bold; color: #000000; }\n' + \
+  ''.join(['.%s { color: %s; }\n' % style for style in TOKEN_STYLES.values()])
 
 class FlowBrowser(QtGui.QTextEdit):
 
   def __init__(self, parent=None):
 
     QtGui.QTextEdit.__init__(self, parent)
-    self.flow = None
+    self.function = None
 
     self.inserting = False
     self.cursorPositionChanged.connect(self.select_token)
 
-    self.__fragments = []
-    self.__textmap = {}
-    self.__current_highlight = None
+    self.buffer = None # token_buffer_t of the function being shown
+    self.starts = [] # position of the first character of each token
+    self.ends = [] # position after the last character of each token
+    self.ranges = {} # token text -> [(start, end), ...]
+    self.matches = {} # index of a matching token -> index of its counterpart
 
     return
 
   def select_token(self):
     """ callback for new selected element in the textedit box. """
 
-    if self.inserting:
+    if self.inserting or self.buffer is None:
         return
 
-    cursor = self.textCursor()
-    fmt = cursor.charFormat()
-    tok = fmt.property(QtGui.QTextFormat.UserProperty)
+    self.setExtraSelections([])
 
-    if self.__current_highlight:
-      brush = QtGui.QBrush(QtGui.QColor(0,0,0,0))
-      self.set_fragments_bg(self.__current_highlight, brush)
-      self.__current_highlight = None
+    # the token before the cursor, like the character format of the cursor.
+    position = self.textCursor().position()
+    i = bisect.bisect_left(self.ends, position)
+    if i >= len(self.ends) or position <= self.starts[i]:
+      return
 
     # avoid highlighting whitespaces
-    s = str(tok)
+    kind, s, ea = self.buffer.token(i)
     if s.strip() == '' or s in (';', '='):
       return
 
-    if type(tok) in (c.token_lmatch, c.token_rmatch):
-      other = tok.lmatch if type(tok) == c.token_rmatch else tok.rmatch
-      token_fragments = [tf for tf in self.__fragments if tf.token in (other, tok)]
-    elif s in self.__textmap:
-      token_fragments = self.__textmap[s]
+    if i in self.matches:
+      j = self.matches[i]
+      ranges = [(self.starts[i], self.ends[i]), (self.starts[j], self.ends[j])]
+    elif s in self.ranges:
+      ranges = self.ranges[s]
     else:
       return
 
     brush = QtGui.QBrush(QtGui.QColor(0xff,0xff,0x00,200))
-    self.set_fragments_bg(token_fragments, brush)
-    self.__current_highlight = token_fragments
+    self.highlight(ranges, brush)
 
     return
 
-  def set_fragments_bg(self, token_fragments, brush):
-    """ given a list of token_fragment objects, set a background brush color for all of them. """
+  def highlight(self, ranges, brush):
+    """ set a background brush for the given character ranges, without touching the document. """
 
-    for tf in token_fragments:
-      frag = tf.fragment
-      fmt = frag.charFormat()
-      fmt.setProperty(QtGui.QTextFormat.BackgroundBrush, brush)
-      tmpcursor = QtGui.QTextCursor(self.document())
-      tmpcursor.setPosition(frag.position())
-      tmpcursor.setPosition(frag.position() + frag.length(), QtGui.QTextCursor.KeepAnchor)
-      tmpcursor.setCharFormat(fmt)
+    selections = []
+    for start, end in ranges:
+      selection = QtGui.QTextEdit.ExtraSelection()
+      selection.cursor = QtGui.QTextCursor(self.document())
+      selection.cursor.setPosition(start)
+      selection.cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+      selection.format.setBackground(brush)
+      selections.append(selection)
+    self.setExtraSelections(selections)
 
     return
 
-  def token_color(self, token):
-    """ get a color according to token type """
-
-    if type(token) == c.token_global:
-      return QtGui.QColor(0x4a,0xa3,0xff,255) # light blue
-
-    if type(token) == c.token_keyword:
-      return QtGui.QColor(0x20,0x2d,0xae,255) # dark blue
+  def index(self, buf):
+    """ find the character range of each token. positions are counted in
+        characters, while the buffer's offsets are counted in bytes. """
+
+    self.starts = []
+    self.ends = []
+    self.ranges = {}
+    self.matches = {}
+
+    position = 0
+    lmatches = []
+    for i in range(len(buf)):
+      kind, s, ea = buf.token(i)
+      end = position + len(s.decode('utf-8'))
+      self.starts.append(position)
+      self.ends.append(end)
+      if kind == c.LMATCH:
+        lmatches.append(i)
+      elif kind == c.RMATCH:
+        j = lmatches.pop()
+        self.matches[i] = j
+        self.matches[j] = i
+      else:
+        self.ranges.setdefault(s, []).append((position, end))
+      position = end
 
-    if type(token) == c.token_number:
-      return QtGui.QColor(0x00,0xac,0x92,255) # blue-green
-
-    if type(token) == c.token_string:
-      return QtGui.QColor(0x00,0x70,0x00,255) # dark green
-
-    if type(token) == c.token_var:
-      return QtGui.QColor(0x87,0x5b,0x4e,255) # brown
-
-    return QtGui.QColor(0,0,0,255) # black
+    return
 
-  def insert_token(self, token):
-    """ insert a new token as in the document, with proper formatting. """
+  def html(self, buf):
+    """ the whole function as pre-formatted html. """
 
-    cursor = QtGui.QTextCursor(self.document())
-    cursor.movePosition(QtGui.QTextCursor.End)
+    parts = ['<pre>']
+    for i in range(len(buf)):
+      kind, s, ea = buf.token(i)
+      text = cgi.escape(s.decode('utf-8'))
+      if kind in TOKEN_STYLES:
+        parts.append('<span class="%s">%s</span>' % (TOKEN_STYLES[kind][0], text))
+      else:
+        parts.append(text)
+    parts.append('</pre>')
 
-    brush = QtGui.QBrush(self.token_color(token))
-    fmt = QtGui.QTextFormat(QtGui.QTextFormat.CharFormat)
-    fmt.setProperty(QtGui.QTextFormat.ForegroundBrush, brush)
+    return u''.join(parts)
 
-    fmt.setProperty(QtGui.QTextFormat.FontStyleHint, QtGui.QFont.Monospace)
-    fmt.setProperty(QtGui.QTextFormat.FontWeight, QtGui.QFont.Bold)
-    fmt.setProperty(QtGui.QTextFormat.FontFamily, "Liberation Mono")
+  def update(self, function, symbols=None):
+    """ show 'function'. names and strings are looked up through
+        'symbols', the session's symbol_cache_t. """
 
-    fmt.setProperty(QtGui.QTextFormat.UserProperty, token)
+    self.function = function
 
-    cursor.insertText(str(token), fmt.toCharFormat())
+    t = c.tokenizer(function, symbols=symbols)
+    self.buffer = t.buffer()
+    self.refresh()
 
     return
 
-  def update(self, function):
+  def refresh(self):
+    """ show the buffer again, after some of its tokens were rebound. """
 
-    self.function = function
-
-    t = c.tokenizer(function)
-    tokens = list(t.flow_tokens())
+    if self.buffer is None:
+      return
 
-    self.clear()
+    self.index(self.buffer)
 
-    # insert all tokens as text with proper colors
+    # build the whole document at once, staying where the user was.
+    scroll = self.verticalScrollBar().value()
     self.inserting = True
-    for tok in tokens:
-      self.insert_token(tok)
+    self.setExtraSelections([])
+    self.document().setDefaultStyleSheet(STYLESHEET)
+    self.setHtml(self.html(self.buffer))
     self.inserting = False
+    self.verticalScrollBar().setValue(scroll)
 
-    # build a map of which text fragments belong to which token.
-    doc = self.document()
-    block = doc.begin()
-    while block != doc.end():
-
-      for it in block:
-        frag = it.fragment()
-        fmt = frag.charFormat()
-        tok = fmt.property(QtGui.QTextFormat.UserProperty)
-
-        s = str(tok)
-
-        tf = token_fragment(frag, tok)
-        if s not in self.__textmap:
-            self.__textmap[s] = []
-        self.__textmap[s].append(tf)
-
-        self.__fragments.append(tf)
-
-      block = block.next()
+    return
 
+  def clear(self):
+    self.buffer = None
+    self.setExtraSelections([])
+    QtGui.QTextEdit.clear(self)
     return
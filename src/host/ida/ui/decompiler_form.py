@@ -7,9 +7,13 @@ import host.dis
 import host.ui
 
 import decompiler
+from expressions import *
+from iterators import operand_iterator_t
+from output import c
 
 import sys
 import traceback
+from collections import deque, OrderedDict
 
 import browser
 
@@ -22,17 +26,53 @@ except:
 
 sys.modules['__main__'].QtGui = QtGui # goddamit IDA..
 
-decompilation_phase = [
-  'Nothing done yet',
-  'Basic block information found',
-  'Intermediate representation form',
-  'Static Single Assignment form',
-  'Call information found',
-  'Locations renamed',
-  'Expressions propagated',
-  'Dead code pruned',
-  'Decompiled',
-]
+# milliseconds between two steps while there is work to do, and between
+# two checks of the cursor position while there is not.
+BUSY_INTERVAL = 0
+IDLE_INTERVAL = 250
+
+# number of fully decompiled functions kept around.
+CACHE_SIZE = 32
+
+class decompile_task_t(object):
+  """ decompilation of one function, advanced one step at a time.
+
+  IDA's database may only be accessed from its main thread, so tasks do
+  not run on a thread of their own: the form advances them from a timer,
+  which lets the user interface respond between two steps.
+  """
+
+  def __init__(self, ea, wanted_step, dis):
+    self.ea = ea
+    self.wanted_step = wanted_step
+    self.decompiler = decompiler.decompiler_t(dis, ea)
+    self.steps = self.decompiler.steps()
+    self.done = False
+    return
+
+  def advance(self):
+    """ perform the next step. returns the step, or None once the task is done. """
+    if self.done:
+      return
+    step = next(self.steps, None)
+    if step is None or type(step) == self.wanted_step:
+      self.done = True
+    return step
+
+class rename_hooks_t(idaapi.IDB_Hooks):
+  """ tells the form when a location is renamed in the database. """
+
+  def __init__(self, form):
+    idaapi.IDB_Hooks.__init__(self)
+    self.form = form
+    return
+
+  def renamed(self, ea, new_name, local_name):
+    try:
+      self.form.renamed(ea)
+    except:
+      traceback.print_exc()
+    return 0
 
 class DecompilerForm(idaapi.PluginForm):
 
@@ -40,6 +80,21 @@ class DecompilerForm(idaapi.PluginForm):
     idaapi.PluginForm.__init__(self)
     self.ea = ea
     self.__name = idc.Name(self.ea)
+
+    self.wanted_step = decompiler.step_decompiled
+    self.task = None # task for the function being shown
+    self.prefetch_task = None # task for a function which may be shown next
+    self.prefetch_queue = deque()
+    self.cache = OrderedDict() # ea -> decompiler_t, fully decompiled
+
+    # the session: one disassembler for all the functions shown in this
+    # form, and the names and strings they refer to.
+    self.dis = host.dis.available_disassemblers['ida'].create()
+    self.symbols = c.symbol_cache_t(self.dis)
+    self.hooks = None
+
+    self.timer = None
+    self.is_open = False
     return
 
   def OnCreate(self, form):
@@ -50,6 +105,15 @@ class DecompilerForm(idaapi.PluginForm):
       traceback.print_exc()
 
     self.populate_form()
+
+    self.timer = QtCore.QTimer(self.parent)
+    self.timer.timeout.connect(self.tick)
+    self.timer.start(IDLE_INTERVAL)
+
+    self.hooks = rename_hooks_t(self)
+    self.hooks.hook()
+
+    self.is_open = True
     return
 
   def Show(self):
@@ -66,10 +130,10 @@ class DecompilerForm(idaapi.PluginForm):
     self.editor = browser.FlowBrowser(self.parent)
     layout.addWidget(self.editor)
 
-    for phase in decompilation_phase:
-      self.phase_selection.addItem(phase)
+    for step in decompiler.decompiler_t.STEPS:
+      self.phase_selection.addItem(step.__doc__)
 
-    self.phase_selection.setCurrentIndex(decompiler.STEP_DECOMPILED)
+    self.phase_selection.setCurrentIndex(decompiler.decompiler_t.STEPS.index(self.wanted_step))
     self.phase_selection.currentIndexChanged.connect(self.phase_selected)
 
     self.parent.setLayout(layout)
@@ -77,22 +141,157 @@ class DecompilerForm(idaapi.PluginForm):
     return
 
   def phase_selected(self, index):
-    self.decompile(index)
+    self.decompile(decompiler.decompiler_t.STEPS[index])
+    return
+
+  def navigate(self, ea):
+    """ show the function at 'ea' instead, abandoning the current task. """
+    self.ea = ea
+    self.decompile(self.wanted_step)
+    return
+
+  def redecompile(self, ea):
+    """ decompile the function at 'ea' again, ignoring the cache: the user
+        asked for it, possibly after editing the database. """
+    self.cache.pop(ea, None)
+    if self.prefetch_task and self.prefetch_task.ea == ea:
+      self.prefetch_task = None
+    self.dis.forget_function(ea)
+    self.navigate(ea)
+    return
+
+  def decompile(self, wanted_step=decompiler.step_decompiled):
+    """ start decompiling the current function until 'wanted_step'. the
+        steps are performed from the timer, see tick(). """
+
+    self.wanted_step = wanted_step
+    self.task = None
+
+    if wanted_step == decompiler.step_decompiled:
+      if self.prefetch_task and self.prefetch_task.ea == self.ea:
+        # already on its way, take it over.
+        self.task, self.prefetch_task = self.prefetch_task, None
+      elif self.ea in self.cache:
+        self.show(self.cache[self.ea])
+        self.prefetch_callees(self.cache[self.ea])
+        return
+
+    if self.task is None:
+      self.task = decompile_task_t(self.ea, wanted_step, self.dis)
+    self.editor.clear()
+    self.schedule()
+    return
+
+  def schedule(self):
+    if self.timer is None:
+      return
+    busy = self.task is not None or self.prefetch_task is not None or len(self.prefetch_queue) > 0
+    self.timer.setInterval(BUSY_INTERVAL if busy else IDLE_INTERVAL)
+    return
+
+  def tick(self):
+    """ perform one step of the current task, or else of a prefetch
+        task, then return to the event loop. """
+
+    self.follow_cursor()
+
+    if self.task:
+      self.advance_task()
+    elif self.prefetch_task or len(self.prefetch_queue) > 0:
+      self.advance_prefetch()
+
+    self.schedule()
+    return
+
+  def follow_cursor(self):
+    """ the user navigated to another function: cancel the task for the
+        previous one and decompile the new one. """
+    func = idaapi.get_func(idc.here())
+    if func and func.startEA != self.ea:
+      self.navigate(func.startEA)
+    return
+
+  def advance_task(self):
+    task = self.task
+    try:
+      step = task.advance()
+    except:
+      traceback.print_exc()
+      self.task = None
+      return
+
+    if step is not None and task.decompiler.function is not None:
+      self.show(task.decompiler)
+
+    if task.done:
+      self.task = None
+      if task.wanted_step == decompiler.step_decompiled:
+        self.remember(task)
+        self.prefetch_callees(task.decompiler)
     return
 
-  def decompile(self, wanted_step=decompiler.STEP_DECOMPILED):
+  def advance_prefetch(self):
+    if self.prefetch_task is None:
+      ea = self.prefetch_queue.popleft()
+      if ea in self.cache:
+        return
+      self.prefetch_task = decompile_task_t(ea, decompiler.step_decompiled, self.dis)
+
+    task = self.prefetch_task
+    try:
+      task.advance()
+    except:
+      traceback.print_exc()
+      self.prefetch_task = None
+      return
+
+    if task.done:
+      self.prefetch_task = None
+      self.remember(task)
+    return
 
-    dis = host.dis.available_disassemblers['ida'].create()
-    d = decompiler.decompiler_t(dis, self.ea)
+  def prefetch_callees(self, dec):
+    """ queue the functions called from 'dec', which the user is likely
+        to look at next. """
+    self.prefetch_queue.clear()
+    for call in operand_iterator_t(dec.function, klass=call_t):
+      if type(call.fct) != value_t:
+        continue
+      func = idaapi.get_func(call.fct.value)
+      if func and func.startEA == call.fct.value and \
+          call.fct.value not in self.cache and call.fct.value not in self.prefetch_queue:
+        self.prefetch_queue.append(call.fct.value)
+    return
 
-    for step in d.steps():
-      print 'Decompiler step: %u - %s' % (step, decompilation_phase[step])
-      if step >= wanted_step:
-        break
+  def remember(self, task):
+    self.cache.pop(task.ea, None)
+    self.cache[task.ea] = task.decompiler
+    while len(self.cache) > CACHE_SIZE:
+      self.cache.popitem(last=False)
+    return
 
-    self.editor.update(d.flow)
+  def show(self, dec):
+    self.editor.update(dec.function, self.symbols)
+    return
 
+  def renamed(self, ea):
+    """ 'ea' was renamed in the database: bind its tokens again, and
+        show the function again if any of them is on screen. """
+    self.dis.forget_symbol(ea)
+    changed = self.symbols.renamed(ea)
+    if self.editor.buffer in changed:
+      self.editor.refresh()
     return
 
   def OnClose(self, form):
-    pass
+    self.is_open = False
+    if self.hooks:
+      self.hooks.unhook()
+      self.hooks = None
+    if self.timer:
+      self.timer.stop()
+      self.timer = None
+    self.task = None
+    self.prefetch_task = None
+    self.prefetch_queue.clear()
+    return
@@ -1,6 +1,10 @@
 import idaapi
 
+# the decompiler form currently open, if any.
+form = None
+
 def show_decompiler():
+  global form
   import idc
 
   import host
@@ -10,7 +14,6 @@ def show_decompiler():
   import sys
 
   import decompiler_form
-  reload(decompiler_form)
 
   try:
     ea = idc.here()
@@ -19,6 +22,13 @@ def show_decompiler():
     ea = func.startEA
     print 'Decompiling %x' % (ea, )
 
+    if form is not None and form.is_open:
+      # keep the prefetched functions of the open form, but not what
+      # it remembers of this one.
+      form.redecompile(ea)
+      return
+
+    reload(decompiler_form)
     form = decompiler_form.DecompilerForm(ea)
     form.Show()
   except:
@@ -0,0 +1,114 @@
+""" Offline host.
+
+A snapshot holds everything the decompiler asks of a host for a whole
+database: the instructions of each function with their decoded
+operands, and the names and strings it refers to. Snapshots are
+exported from IDA by host.ida.export and served by the disassembler in
+host.snapshot.dis, which lets decompilation run without IDA, on as
+many processes as needed.
+
+Snapshots are stored as gzip-compressed json.
+"""
+
+import gzip
+import json
+from collections import namedtuple
+
+from expressions import *
+
+VERSION = 1
+
+instruction_t = namedtuple('instruction_t', ['size', 'mnemonic', 'flow', 'targets', 'operands'])
+function_t = namedtuple('function_t', ['ea', 'name', 'items', 'noreturn', 'thunk'])
+
+# operators which can appear in decoded operands.
+BINARY_OPERATORS = {'+': add_t, '-': sub_t, '*': mul_t}
+
+def encode_expression(expr):
+  """ encode an operand expression into json-friendly lists. registers
+      are kept by name, so the host's register numbering does not matter. """
+  if type(expr) == regloc_t:
+    return ['r', expr.name, expr.size]
+  if type(expr) == value_t:
+    return ['v', expr.value, expr.size]
+  if type(expr) == deref_t:
+    return ['d', expr.size, encode_expression(expr.op)]
+  for operator, klass in BINARY_OPERATORS.iteritems():
+    if type(expr) == klass:
+      return [operator, encode_expression(expr.op1), encode_expression(expr.op2)]
+  raise ValueError('cannot encode operand of type %s' % (expr.__class__.__name__, ))
+
+def decode_expression(data, regindex):
+  """ build an operand expression from its encoding, 'regindex' gives
+      the index of a register from its name. """
+  tag = data[0]
+  if tag == 'r':
+    name = str(data[1])
+    return regloc_t(regindex(name), data[2], name=name)
+  if tag == 'v':
+    return value_t(data[1], data[2])
+  if tag == 'd':
+    return deref_t(decode_expression(data[2], regindex), data[1])
+  if tag in BINARY_OPERATORS:
+    return BINARY_OPERATORS[tag](decode_expression(data[1], regindex), decode_expression(data[2], regindex))
+  raise ValueError('cannot decode operand %s' % (repr(data), ))
+
+def instruction_record(dis, ea):
+  """ return the instruction_t for the instruction at 'ea', from any
+      other host's disassembler 'dis'. operands which cannot be encoded
+      are recorded as None, the offline host fails only when they are used. """
+  operands = []
+  for n in range(dis.get_operand_count(ea)):
+    try:
+      operands.append(encode_expression(dis.get_operand_expression(ea, n)))
+    except BaseException as e:
+      operands.append(None)
+  cls = dis.classify(ea)
+  return instruction_t(cls.size, dis.get_mnemonic(ea), cls.flow, cls.targets, operands)
+
+class snapshot_t(object):
+
+  def __init__(self, arch):
+    self.arch = arch # 'x86' or 'x86-64'
+    self.functions = {} # ea -> function_t
+    self.instructions = {} # ea -> instruction_t
+    self.names = {} # ea -> name
+    self.strings = {} # ea -> string
+    self.owners = {} # instruction ea -> ea of the function it belongs to
+    return
+
+  def add_function(self, function):
+    self.functions[function.ea] = function
+    for ea in function.items:
+      self.owners.setdefault(ea, function.ea)
+    return
+
+  def save(self, filename):
+    data = {
+      'version': VERSION,
+      'arch': self.arch,
+      'functions': [list(f) for f in sorted(self.functions.values())],
+      'instructions': [[ea] + list(self.instructions[ea]) for ea in sorted(self.instructions.keys())],
+      'names': sorted(self.names.items()),
+      # strings may hold any byte, latin-1 maps each of them to one character.
+      'strings': [(ea, s.decode('latin-1')) for ea, s in sorted(self.strings.items())],
+    }
+    with gzip.open(filename, 'wb') as f:
+      json.dump(data, f, separators=(',', ':'))
+    return
+
+  @staticmethod
+  def load(filename):
+    with gzip.open(filename, 'rb') as f:
+      data = json.load(f)
+    if data['version'] != VERSION:
+      raise RuntimeError('%s: unsupported snapshot version %s' % (filename, repr(data['version'])))
+
+    snapshot = snapshot_t(str(data['arch']))
+    for ea, name, items, noreturn, thunk in data['functions']:
+      snapshot.add_function(function_t(ea, str(name), items, noreturn, thunk))
+    for ea, size, mnemonic, flow, targets, operands in data['instructions']:
+      snapshot.instructions[ea] = instruction_t(size, str(mnemonic), flow, tuple(targets), operands)
+    snapshot.names = {ea: str(name) for ea, name in data['names']}
+    snapshot.strings = {ea: s.encode('latin-1') for ea, s in data['strings']}
+    return snapshot
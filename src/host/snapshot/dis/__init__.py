@@ -0,0 +1,45 @@
+import ir
+import ir.intel
+
+from . import intel
+
+def disassembler_for_arch(snapshot):
+
+  if snapshot.arch == 'x86':
+    return (ir.IR_INTEL_x86, ir.intel.ir_intel_x86, intel.disassembler)
+  elif snapshot.arch == 'x86-64':
+    return (ir.IR_INTEL_x64, ir.intel.ir_intel_x64, intel.disassembler)
+
+  raise RuntimeError("Don't know which arch to choose for %s" % (repr(snapshot.arch), ))
+
+def create(snapshot, ea):
+  """
+  Return a new instance of a disassembler made up of the generic
+  architecture support (from ir/*.py) and the offline host disassembler,
+  which serves the function at 'ea' from 'snapshot'.
+  """
+
+  ir_id, ir_cls, dis_cls = disassembler_for_arch(snapshot)
+  return disassembler_class(ir_id, ir_cls, dis_cls)(ir_id, snapshot, ea)
+
+# (ir_id, host class) -> composed disassembler class
+classes = {}
+
+def disassembler_class(ir_id, ir_cls, dis_cls):
+  """ compose the disassembler class once per architecture, its instances
+      share the tables built by the architecture support. """
+
+  if (ir_id, dis_cls) in classes:
+    return classes[(ir_id, dis_cls)]
+
+  class disassembler(dis_cls, ir_cls): # disassembler (host) class must be left-most.
+    def __init__(self, ir_id, snapshot, ea):
+      self.ir_id = ir_id
+      self.snapshot = snapshot
+      self.ea = ea
+      dis_cls.__init__(self)
+      ir_cls.__init__(self)
+      return
+
+  # another thread may compose the class at the same time, only one is kept.
+  return classes.setdefault((ir_id, dis_cls), disassembler)
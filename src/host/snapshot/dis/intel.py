@@ -0,0 +1,88 @@
+""" support for intel assembly exported from IDA into a snapshot. """
+
+from expressions import *
+from statements import *
+from ir.intel import *
+
+from host.snapshot import decode_expression
+
+class disassembler(object):
+
+  def __init__(self):
+    self.operand_templates = {} # (ea, n) -> decoded operand expression
+    return
+
+  def reset(self, snapshot, ea):
+    """ reuse this instance for the function at 'ea'. decoded operands
+        are kept as long as the snapshot is the same. """
+    if snapshot is not self.snapshot:
+      self.operand_templates = {}
+    self.snapshot = snapshot
+    self.ea = ea
+    self.clear_classes()
+    return
+
+  def add_name(self, ea, name):
+    self.snapshot.names[ea] = name
+    return
+
+  def add_string(self, ea, string):
+    self.snapshot.strings[ea] = string
+    return
+
+  def get_ea_name(self, ea):
+    """ return the name of this location, or None if no name is defined. """
+    return self.snapshot.names.get(ea)
+
+  def get_string(self, ea):
+    """ return the string starting at 'ea' or None if it is not a string. """
+    return self.snapshot.strings.get(ea)
+
+  def function_does_return(self, ea):
+    """ return False if the function does not return (ExitThread(), exit(), etc). """
+    function = self.snapshot.functions.get(ea)
+    return not (function and function.noreturn)
+
+  def get_function_start(self, ea):
+    """ return the address of the parent function, given any address inside that function. """
+    return self.snapshot.owners.get(ea)
+
+  def get_function_items(self, ea):
+    """ return all addresses that belong to the function at 'ea'. """
+    return list(self.snapshot.functions[ea].items)
+
+  def get_mnemonic(self, ea):
+    """ return textual mnemonic for the instruction at 'ea'. """
+    return self.snapshot.instructions[ea].mnemonic
+
+  def get_instruction_size(self, ea):
+    """ return the instruction size. """
+    return self.snapshot.instructions[ea].size
+
+  def classify(self, ea):
+    """ return the insn_class_t record for the instruction at 'ea', as
+        classified when the snapshot was exported. """
+    insn = self.snapshot.instructions[ea]
+    return insn_class_t(insn.flow, insn.targets, ea + insn.size, insn.size)
+
+  def get_operand_count(self, ea):
+    """ return the number of operands of the instruction at 'ea'. """
+    return len(self.snapshot.instructions[ea].operands)
+
+  def get_operand_expression(self, ea, n):
+    """ return an expression representing the 'n'-th operand of the instruction at 'ea'. """
+    key = (ea, n)
+    if key not in self.operand_templates:
+      data = self.snapshot.instructions[ea].operands[n]
+      if data is None:
+        raise RuntimeError('%x: operand %u could not be exported' % (ea, n))
+      self.operand_templates[key] = decode_expression(data, self.get_regindex)
+    return self.operand_templates[key].copy()
+
+  def get_call_expression(self, ea):
+    """ get an expression representing a function call at this address. """
+    fct = self.get_operand_expression(ea, 0)
+    expr = call_t(fct, self.stackreg.copy(), params_t())
+    if type(fct) != value_t or self.function_does_return(fct.value):
+      expr = assign_t(self.resultreg.copy(), expr)
+    return expr, []
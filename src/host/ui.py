@@ -2,9 +2,12 @@ import traceback
 
 try:
   import idaapi # try importing ida's main module.
+except ImportError as e:
+  idaapi = None # not running inside IDA.
 
-  print 'Using IDA backend.'
-  from .ida.ui import *
-except BaseException as e:
-  print repr(e)
-  traceback.print_exc()
+if idaapi:
+  try:
+    from .ida.ui import *
+  except BaseException as e:
+    print repr(e)
+    traceback.print_exc()
@@ -37,6 +37,16 @@ class ir_base(object):
     statement corresponding to the given location. """
     raise NotImplemented('base class must override this method')
 
+  def stack_cleanup(self, ea):
+    """ return the number of bytes popped off the stack by the return
+        instruction at 'ea', in addition to the return address. """
+    return 0
+
+  def registers_overlap(self, a, b):
+    """ return True if registers 'a' and 'b' share any bits. by default
+        a register only overlaps itself. """
+    return a.no_index_eq(b)
+
 
   ## following functions are typically implemented at the host level. they are used mostly to
   ## translate basic block instructions into the intermediate representation.
@@ -69,6 +79,10 @@ class ir_base(object):
     """ return the instruction size. """
     raise NotImplementedException('must be implemented by host-specific disassembler')
 
+  def get_operand_count(self, ea):
+    """ return the number of operands of the instruction at 'ea'. """
+    raise NotImplementedException('must be implemented by host-specific disassembler')
+
   def get_operand_expression(self, ea, n):
     """ return an expression representing the 'n'-th operand of the instruction at 'ea'. """
     raise NotImplementedException('must be implemented by host-specific disassembler')
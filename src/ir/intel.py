@@ -28,6 +28,18 @@ OF =    1 << 11 # overflow flag: set when the expression would overflow
 #~ VIF =   1 << 20 # virtual interrupt pending
 ID =    1 << 21 # able to use CPUID instruction
 
+# instruction flow kinds, as recorded in the classification table.
+FLOW_NORMAL = 0           # falls through to the next instruction
+FLOW_JUMP = 1             # unconditional jump (one branch)
+FLOW_CONDITIONAL_JUMP = 2 # conditional jump (two branches)
+FLOW_RETURN = 3           # breaks (terminates) the flow
+FLOW_CALL = 4             # call, falls through to the next instruction
+
+# classification record for a single instruction. 'targets' holds the
+# destination address of each branch, or None when the destination is
+# not a constant (i.e. jmp eax).
+insn_class_t = namedtuple('insn_class_t', ['flow', 'targets', 'next_ea', 'size'])
+
 SIZE_8 = 8
 SIZE_16 = 16
 SIZE_32 = 32
@@ -76,6 +88,109 @@ register_groups.append(('r13', 'r13d', 'r13w', 'r13b'))
 register_groups.append(('r14', 'r14d', 'r14w', 'r14b'))
 register_groups.append(('r15', 'r15d', 'r15w', 'r15b'))
 
+class register_file_t(object):
+  """ precomputed model of the register file.
+
+  each register gets a stable integer id, in the order in which it
+  appears in 'groups'. each group lists a full width register followed
+  by its sub-registers, from the widest to the narrowest. the tables
+  are built on first use, importing this module does not pay for them. """
+
+  TABLES = ('names', 'ids', 'sizes', 'parents', 'subregisters', 'masks')
+
+  def __init__(self, groups, registers):
+    self.groups = groups
+    self.registers = registers
+    return
+
+  def __getattr__(self, name):
+    # only called for missing attributes, i.e. before the tables are built.
+    if name not in self.TABLES:
+      raise AttributeError(name)
+    self.build()
+    return getattr(self, name)
+
+  def build(self):
+    names = [] # id -> name
+    ids = {} # name -> id
+    sizes = [] # id -> size in bits
+    parents = [] # id -> id of the register containing it, or None
+    subregisters = [] # id -> ids of the registers it contains
+    masks = [] # id -> bitmask of the ids of all overlapping registers
+
+    for group in self.groups:
+      chain = [] # ids of the registers containing the current one
+      for name in group:
+        which = len(names)
+        size = self.registers[name].size
+        while len(chain) > 0 and sizes[chain[-1]] <= size:
+          chain.pop()
+        names.append(name)
+        ids[name] = which
+        sizes.append(size)
+        parents.append(chain[-1] if len(chain) > 0 else None)
+        subregisters.append([])
+        masks.append(1 << which)
+        for parent in chain:
+          subregisters[parent].append(which)
+          masks[parent] |= 1 << which
+          masks[which] |= 1 << parent
+        chain.append(which)
+
+    # tables are only published once complete, another thread may be
+    # reading them as soon as they are set.
+    self.masks, self.subregisters, self.parents = masks, subregisters, parents
+    self.sizes, self.ids, self.names = sizes, ids, names
+    return
+
+  def __len__(self):
+    return len(self.names)
+
+  def full_register(self, which):
+    """ return the id of the widest register containing 'which'. """
+    while self.parents[which] is not None:
+      which = self.parents[which]
+    return which
+
+  def overlaps(self, a, b):
+    """ return True if writing to register 'a' changes register 'b'. """
+    return self.masks[a] & (1 << b) != 0
+
+register_file = register_file_t(register_groups, registers)
+
+# register ids as module constants: RAX, EAX, AX, AH, AL, ...
+for _which, _name in enumerate(_name for _group in register_groups for _name in _group):
+  globals()[_name.upper()] = _which
+
+# flag registers, numbered after the machine registers.
+SPECIAL_REGISTERS = 9000
+FLAG_REGISTERS = ('%eflags.expr', '%eflags.cf', '%eflags.pf', '%eflags.af', '%eflags.zf', '%eflags.sf', '%eflags.of')
+
+class arch_tables_t(object):
+  """ tables which depend only on the architecture and the host register
+  numbering. they are built once per disassembler class and shared by
+  all its instances; instructions are never added to them. """
+
+  def __init__(self, dis):
+    r = dis.get_stack_register()
+    self.stackreg = regloc_t(r, dis.address_size, name=dis.get_regname(r))
+    r = dis.get_leave_register()
+    self.leavereg = regloc_t(r, dis.address_size, name=dis.get_regname(r))
+    r = dis.get_result_register()
+    self.resultreg = regloc_t(r, dis.address_size, name=dis.get_regname(r))
+
+    self.flags = [flagloc_t(SPECIAL_REGISTERS + i, 1, name) for i, name in enumerate(FLAG_REGISTERS)]
+
+    self.flow_break = frozenset(['retn', 'ret']) # instructions that break (terminate) the flow
+    self.unconditional_jumps = frozenset(['jmp']) # unconditional jumps (one branch)
+    self.conditional_jumps = frozenset(['jo', 'jno', 'js', 'jns', 'jz', 'je', 'jnz', 'jne',
+            'jb', 'jnb', 'jbe', 'ja', 'jl', 'jge', 'jle', 'jg',
+            'jpe', 'jno']) # conditional jumps (two branches)
+    return
+
+# disassembler class -> arch_tables_t
+arch_tables = {}
+
 class ir_intel(ir_base):
 
   def __init__(self):
@@ -84,42 +199,50 @@ class ir_intel(ir_base):
 
     ir_base.__init__(self)
 
-    r = self.get_stack_register()
-    self.stackreg = regloc_t(r, self.address_size, name=self.get_regname(r))
-    r = self.get_leave_register()
-    self.leavereg = regloc_t(r, self.address_size, name=self.get_regname(r))
-    r = self.get_result_register()
-    self.resultreg = regloc_t(r, self.address_size, name=self.get_regname(r))
-
-    self.special_registers = 9000
-
-    self.eflags_expr = self.make_special_register('%eflags.expr')
-    self.cf = self.make_special_register('%eflags.cf')
-    self.pf = self.make_special_register('%eflags.pf')
-    self.af = self.make_special_register('%eflags.af')
-    self.zf = self.make_special_register('%eflags.zf')
-    self.sf = self.make_special_register('%eflags.sf')
-    self.of = self.make_special_register('%eflags.of')
-
-    self.flow_break = ['retn', 'ret' ] # instructions that break (terminate) the flow
-    self.unconditional_jumps = ['jmp', ] # unconditional jumps (one branch)
-    self.conditional_jumps = ['jo', 'jno', 'js', 'jns', 'jz', 'je', 'jnz', 'jne',
-            'jb', 'jnb', 'jbe', 'ja', 'jl', 'jge', 'jle', 'jg',
-            'jpe', 'jno'] # conditional jumps (two branches)
+    if type(self) not in arch_tables:
+      # another thread may get here first, only one set of tables is kept.
+      arch_tables.setdefault(type(self), arch_tables_t(self))
+    tables = arch_tables[type(self)]
+
+    self.stackreg = tables.stackreg
+    self.leavereg = tables.leavereg
+    self.resultreg = tables.resultreg
 
+    self.special_registers = list(FLAG_REGISTERS) # names, by id from SPECIAL_REGISTERS
+    self.eflags_expr, self.cf, self.pf, self.af, self.zf, self.sf, self.of = tables.flags
+
+    self.flow_break = tables.flow_break
+    self.unconditional_jumps = tables.unconditional_jumps
+    self.conditional_jumps = tables.conditional_jumps
+
+    self.clear_classes()
+    return
+
+  def clear_classes(self):
+    """ forget the classification of instructions, when this instance
+        is reused for another function. """
+    self.insn_ordinals = {} # address -> ordinal in insn_classes
+    self.insn_classes = [] # insn_class_t records, by instruction ordinal
     return
 
   def get_regindex(self, name):
-    if name.lower() in registers:
-      return registers.keys().index(name.lower())
+    return register_file.ids.get(name.lower())
 
   def get_regname(self, which):
-    if which < len(registers):
-      name = registers.keys()[which]
+    if which < len(register_file):
+      name = register_file.names[which]
     else:
       name = '#%u' % (which, )
     return name
 
+  def registers_overlap(self, a, b):
+    """ return True if registers 'a' and 'b' share any bits. """
+    if type(a) != regloc_t or type(b) != regloc_t:
+      return False
+    if a.which >= len(register_file) or b.which >= len(register_file):
+      return a.which == b.which
+    return register_file.overlaps(a.which, b.which)
+
   def get_stack_register(self):
     if self.ir_id == IR_INTEL_x86:
       return self.get_regindex('esp')
@@ -139,9 +262,11 @@ class ir_intel(ir_base):
       return self.get_regindex('rbp')
 
   def make_special_register(self, name):
-    reg = flagloc_t(self.special_registers, 1, name)
-    self.special_registers += 1
-    return reg
+    """ return a flag register for 'name', numbered after the flags. the
+        same name always gives the same register for this instance. """
+    if name not in self.special_registers:
+      self.special_registers.append(name)
+    return flagloc_t(SPECIAL_REGISTERS + self.special_registers.index(name), 1, name)
 
   def is_stackreg(self, reg):
     """ return True if the register is the stack register """
@@ -158,49 +283,77 @@ class ir_intel(ir_base):
             type(expr.op1) in (sub_t, add_t) and \
             self.is_stackreg(expr.op1.op1) and type(expr.op1.op2) == value_t
 
+  def classify(self, ea):
+    """ return the insn_class_t record for the instruction at 'ea'.
+        hosts which know better may override this method; this one
+        relies on the textual mnemonic. """
+    mnem = self.get_mnemonic(ea)
+    size = self.get_instruction_size(ea)
+    next_ea = ea + size
+    if mnem in self.flow_break:
+      return insn_class_t(FLOW_RETURN, (), next_ea, size)
+    if mnem in self.unconditional_jumps:
+      flow = FLOW_JUMP
+    elif mnem in self.conditional_jumps:
+      flow = FLOW_CONDITIONAL_JUMP
+    else:
+      return insn_class_t(FLOW_NORMAL, (), next_ea, size)
+    dest = self.get_operand_expression(ea, 0)
+    targets = (dest.value if type(dest) == value_t else None, )
+    if flow == FLOW_CONDITIONAL_JUMP:
+      targets += (next_ea, )
+    return insn_class_t(flow, targets, next_ea, size)
+
+  def get_class(self, ea):
+    """ return the classification record for the instruction at 'ea',
+        classifying it on first use. """
+    ordinal = self.insn_ordinals.get(ea)
+    if ordinal is None:
+      ordinal = len(self.insn_classes)
+      self.insn_classes.append(self.classify(ea))
+      self.insn_ordinals[ea] = ordinal
+    return self.insn_classes[ordinal]
+
   def is_conditional_jump(self, ea):
     """ return true if this instruction is a conditional jump. """
-    mnem = self.get_mnemonic(ea)
-    if mnem in self.conditional_jumps:
-      return True
-    return False
+    return self.get_class(ea).flow == FLOW_CONDITIONAL_JUMP
 
   def is_unconditional_jump(self, ea):
     """ return true if this instruction is a unconditional jump. """
-    mnem = self.get_mnemonic(ea)
-    if mnem in self.unconditional_jumps:
-      return True
-    return False
+    return self.get_class(ea).flow == FLOW_JUMP
 
   def is_return(self, ea):
     """ return True if this is a return instruction """
-    mnem = self.get_mnemonic(ea)
-    if mnem in self.flow_break:
-      return True
-    return False
+    return self.get_class(ea).flow == FLOW_RETURN
 
   def has_jump(self, ea):
     """ return true if this instruction is a jump """
-    return self.is_conditional_jump(ea) or self.is_unconditional_jump(ea)
+    return self.get_class(ea).flow in (FLOW_JUMP, FLOW_CONDITIONAL_JUMP)
 
   def next_instruction_ea(self, ea):
     """ return the address of the next instruction. """
-    size = self.get_instruction_size(ea)
-    assert size > 0, '%x: no instruction' % (ea, )
-    return ea + size
+    insn = self.get_class(ea)
+    assert insn.size > 0, '%x: no instruction' % (ea, )
+    return insn.next_ea
 
   def jump_branches(self, ea):
-    mnem = self.get_mnemonic(ea)
-    if mnem in self.unconditional_jumps:
-      dest = self.get_operand_expression(ea, 0)
-      yield dest
-    elif mnem in self.conditional_jumps:
-      dest = self.get_operand_expression(ea, 0)
-      yield dest
-      dest = self.next_instruction_ea(ea)
-      yield value_t(dest, self.address_size)
+    for target in self.get_class(ea).targets:
+      if target is None:
+        yield self.get_operand_expression(ea, 0)
+      else:
+        yield value_t(target, self.address_size)
     return
 
+  def stack_cleanup(self, ea):
+    """ return the number of bytes popped off the stack by the return
+        instruction at 'ea' (i.e. ret 8), in addition to the return address. """
+    if self.get_operand_count(ea) == 0:
+      return 0
+    op = self.get_operand_expression(ea, 0)
+    if type(op) == value_t:
+      return op.value
+    return 0
+
   def as_signed(self, v, size=None):
     if size is None:
       size = self.address_size
@@ -1,4 +1,190 @@
 
+from expressions import expr_t, value_t
+from statements import statement_t, goto_t, branch_t
+
+def flat_operands(expr, depth_first=False, ltr=True):
+  """ return a list of all operands of `expr`, in the same order as
+      `expr.iteroperands()`, walking the tree with an explicit stack. """
+  ops = []
+  # postorder is the reverse of a preorder walk which takes the
+  # operands in the opposite direction.
+  forward = ltr if not depth_first else not ltr
+  stack = [expr]
+  while len(stack) > 0:
+    op = stack.pop()
+    ops.append(op)
+    if not isinstance(op, expr_t):
+      continue
+    count = len(op)
+    keys = range(count - 1, -1, -1) if forward else range(count)
+    for key in keys:
+      _op = op[key]
+      if _op:
+        stack.append(_op)
+  if depth_first:
+    ops.reverse()
+  return ops
+
+def statement_operands(stmt):
+  """ return a list of (operand, parent, key) triples for all operands in
+      the expressions of `stmt`, depth first, left to right. """
+  triples = []
+  for expr in stmt.expressions:
+    stack = [(expr, expr.parent, expr.parent_key)]
+    while len(stack) > 0:
+      triple = stack.pop()
+      triples.append(triple)
+      op = triple[0]
+      if not isinstance(op, expr_t):
+        continue
+      for key in range(len(op) - 1, -1, -1):
+        _op = op[key]
+        if _op:
+          stack.append((_op, op, key))
+  return triples
+
+def block_successors(function, block):
+  """ return the blocks that `block` leads to, based on the goto or
+      branch at the end of its container. """
+  if len(block.container) == 0:
+    return []
+  stmt = block.container[-1]
+  if type(stmt) == goto_t and stmt.is_known():
+    eas = [stmt.expr.value]
+  elif type(stmt) == branch_t:
+    eas = [stmt.true.value, stmt.false.value]
+  else:
+    return []
+  return [function.blocks[ea] for ea in eas if ea in function.blocks]
+
+def block_postorder(function, successors):
+  """ iterative depth-first walk from the entry block, following the
+      true side of branches first. `successors` is a dict of block :
+      list of blocks. returns the blocks in postorder. """
+  order = []
+  seen = set([function.entry_block])
+  stack = [(function.entry_block, iter(successors[function.entry_block]))]
+  while len(stack) > 0:
+    block, it = stack[-1]
+    for next in it:
+      if next not in seen:
+        seen.add(next)
+        stack.append((next, iter(successors[next])))
+        break
+    else:
+      stack.pop()
+      order.append(block)
+  return order
+
+class operand_index_t(object):
+  """ keeps track of the operands attached to a function's tree by type,
+      so that all operands of a given type can be found without walking
+      the whole function. operands are added when they are attached to
+      the tree and removed as soon as they are plucked, replaced, or their
+      statement or block is taken out of the function. """
+
+  def __init__(self, function):
+    self.function = function
+
+    # dict of type : {id(operand): (operand, statement)}
+    self.operands = {}
+
+    # ordinals of the function's blocks, rebuilt when the blocks change.
+    self.blocks = {}
+    self.blocks_version = None
+    return
+
+  def subtree(self, expr):
+    """ return `expr` and everything below it, including expressions
+        which have no operands yet. """
+    ops = []
+    stack = [expr]
+    while len(stack) > 0:
+      op = stack.pop()
+      ops.append(op)
+      if isinstance(op, expr_t):
+        for _op in op.operands:
+          if _op is not None:
+            stack.append(_op)
+    return ops
+
+  def attach(self, expr):
+    stmt = expr.parent_statement
+    for op in self.subtree(expr):
+      _type = type(op)
+      if _type not in self.operands:
+        self.operands[_type] = {}
+      self.operands[_type][id(op)] = (op, stmt)
+    return
+
+  def detach(self, expr):
+    for op in self.subtree(expr):
+      ops = self.operands.get(type(op))
+      if ops:
+        ops.pop(id(op), None)
+    return
+
+  def attach_statement(self, stmt):
+    for expr in stmt.expressions or []:
+      if expr is not None and expr.parent is stmt:
+        self.attach(expr)
+    for container in stmt.containers:
+      for _stmt in container:
+        self.attach_statement(_stmt)
+    return
+
+  def detach_statement(self, stmt):
+    for expr in stmt.expressions or []:
+      if expr is not None and expr.parent is stmt:
+        self.detach(expr)
+    for container in stmt.containers:
+      for _stmt in container:
+        if _stmt.container is container:
+          self.detach_statement(_stmt)
+    return
+
+  def block_ordinals(self):
+    """ return a dict of id(block) : index of the block in the function. """
+    blocks = self.function.blocks
+    if self.blocks_version != blocks.version:
+      self.blocks = {id(block): i for i, block in enumerate(blocks.values())}
+      self.blocks_version = blocks.version
+    return self.blocks
+
+  def find(self, klass):
+    """ return all operands of type `klass`, in the same order as
+        `operand_iterator_t`. only the statements which hold such operands
+        are looked at. returns None when the function has nested
+        containers, in which case the tree must be walked instead. """
+    found = set()
+    statements = {}
+    for _type, ops in self.operands.iteritems():
+      if not issubclass(_type, klass):
+        continue
+      for key, (op, stmt) in ops.iteritems():
+        found.add(key)
+        statements[id(stmt)] = stmt
+
+    blocks = self.block_ordinals()
+    order = []
+    for stmt in statements.itervalues():
+      container = stmt.container
+      if container is None or container is not container.block.container:
+        return
+      block = blocks.get(id(container.block))
+      if block is None:
+        return
+      order.append(((block, container.ordinal(stmt)), stmt))
+    order.sort(key=lambda item: item[0])
+
+    result = []
+    for position, stmt in order:
+      for expr in list(stmt.expressions):
+        for op in flat_operands(expr):
+          if id(op) in found:
+            result.append(op)
+    return result
+
 class iterator_t(object):
   def __init__(self, function):
     self.function = function
@@ -16,17 +202,18 @@ class container_iterator_t(iterator_t):
         yield container
 
   def iter_container(self, container):
-    yield container
-    for stmt in container:
-      for _container in stmt.containers:
-        for __container in self.iter_container(_container):
-          yield __container
+    stack = [container]
+    while len(stack) > 0:
+      container = stack.pop()
+      yield container
+      for stmt in reversed(container[:]):
+        stack.extend(reversed(list(stmt.containers)))
     return
 
 class statement_iterator_t(iterator_t):
   def __iter__(self):
     for container in container_iterator_t(self.function):
-      for stmt in list(container.statements):
+      for stmt in container[:]:
         yield stmt
 
 class expression_iterator_t(iterator_t):
@@ -39,6 +226,8 @@ class operand_iterator_t(iterator_t):
   def __init__(self, function, depth_first=False, ltr=True, filter=None, klass=None):
     self.depth_first = depth_first
     self.ltr = ltr
+    self.klass = klass
+    self.filter_set = filter is not None
     if filter:
       self.filter = filter
     elif klass:
@@ -49,7 +238,15 @@ class operand_iterator_t(iterator_t):
     return
 
   def __iter__(self):
+    if self.klass and not self.filter_set and not self.depth_first and self.ltr and \
+          not issubclass(value_t, self.klass):
+      # branch destinations are not part of the operand index.
+      ops = self.function.operand_index.find(self.klass)
+      if ops is not None:
+        for op in ops:
+          yield op
+        return
     for expr in expression_iterator_t(self.function):
-      for op in expr.iteroperands(self.depth_first, self.ltr):
+      for op in flat_operands(expr, self.depth_first, self.ltr):
         if self.filter is None or self.filter(op):
           yield op
@@ -1,8 +1,11 @@
 import sys
 import re
+import json
 import binascii
 import traceback
 import argparse
+import multiprocessing
+import StringIO
 from collections import namedtuple, OrderedDict
 
 import capstone
@@ -10,15 +13,49 @@ import capstone
 import decompiler
 import host
 import host.dis
-import ssa
+import summary
+import callgraph
 import output.c
+import host.snapshot
+
+Function = namedtuple('Function', ['address', 'name', 'text', 'hex'])
+
+# snapshots loaded by this process, by file name.
+snapshots = {}
+
+def load_snapshot(filename):
+  if filename not in snapshots:
+    snapshots[filename] = host.snapshot.snapshot_t.load(filename)
+  return snapshots[filename]
+
+def decompile_component(arch, callconv, step, functions, summaries, snapshot=None):
+  """ process pool entry point: decompile the functions of one strongly
+      connected component, given the summaries of the functions it
+      calls. returns the text of each function and the new summaries. """
+  p = Cmdline({f.name: f for f in functions}, snapshot)
+  p.arch = arch
+  p.callconv = callconv
+  p.step_until = p.decompilation_steps[step]
+  for d in summaries:
+    p.summaries.add(summary.summary_t.from_dict(d))
+  texts = [p.function_text(f) for f in functions]
+  summaries = [p.summaries.get(f.address).as_dict() for f in functions if f.address in p.summaries]
+  return texts, summaries
 
 class Cmdline(object):
-  def __init__(self):
-    self.functions = self.objdump_load(self.read_stdin())
-    self.arch = 'x86'
+  def __init__(self, functions=None, snapshot=None):
+    self.snapshot_file = snapshot
+    self.snapshot = load_snapshot(snapshot) if snapshot else None
+    if functions is None and self.snapshot:
+      functions = self.snapshot_load(self.snapshot)
+    elif functions is None:
+      functions = self.objdump_load(self.read_stdin())
+    self.functions = functions
+    self.arch = self.snapshot.arch if self.snapshot else 'x86'
     self.callconv = 'cdecl'
     self.step_until = decompiler.step_decompiled
+    self.summaries = summary.summary_store_t()
+    self.dis = None
     return
 
   def objdump_to_hex(self, input):
@@ -28,27 +65,69 @@ class Cmdline(object):
 
   def objdump_load(self, data):
     parsed = re.findall(r'([a-f0-9]+) \<([^\>]+)\>\:\n((?:\s+[a-f0-9]+:(?:[\s\t](?:[a-f0-9]{2}))+[^\n]*)*\n)', data, flags=re.MULTILINE)
-    Function = namedtuple('Function', ['address', 'name', 'text', 'hex'])
     functions = {o[1]: Function(address=int(o[0], 16),name=o[1],text=o[2],hex=self.objdump_to_hex(o[2])) for o in parsed}
     return functions
 
-  def decompile_until(self, input):
-    ssa.ssa_context_t.index = 0
+  def snapshot_load(self, snapshot):
+    return {f.name: Function(address=f.ea, name=f.name, text='', hex='') for f in snapshot.functions.values()}
 
+  def capstone_md(self):
     if self.arch == 'x86':
-      md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
-      dis = host.dis.available_disassemblers['capstone'].create(md, input)
+      return capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
     elif self.arch == 'x86-64':
-      md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
-      dis = host.dis.available_disassemblers['capstone'].create(md, input)
+      return capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
+    raise RuntimeError('no such architecture: %s' % (self.arch, ))
+
+  def disassembler(self, function):
+    """ return the disassembler for 'function'. functions are decompiled
+        one at a time, so a single instance is reset for each of them. """
+    if self.dis is not None and self.snapshot:
+      self.dis.reset(self.snapshot, function.address)
+    elif self.dis is not None:
+      self.dis.reset(function.hex, function.address)
+    elif self.snapshot:
+      self.dis = host.dis.available_disassemblers['snapshot'].create(self.snapshot, function.address)
     else:
-      raise RuntimeError('no such architecture: %s' % (self.arch, ))
+      md = self.capstone_md()
+      self.dis = host.dis.available_disassemblers['capstone'].create(md, function.hex, function.address)
+    return self.dis
 
-    dec = decompiler.decompiler_t(dis, 0)
+  def decompile_until(self, function):
+    dec = decompiler.decompiler_t(self.disassembler(function), function.address)
     dec.calling_convention = self.callconv
+    dec.summaries = self.summaries
     dec.step_until(self.step_until)
     return dec
 
+  def call_targets(self, function):
+    """ return the names of the known functions called directly from
+        'function'. only the intermediate form is needed for this, which
+        is much cheaper than a full decompilation. """
+    names = {f.address: f.name for f in self.functions.values()}
+    dec = decompiler.decompiler_t(self.disassembler(function), function.address)
+    dec.calling_convention = self.callconv
+    targets = []
+    for call in dec.query(decompiler.query_call_targets):
+      if call.target in names and names[call.target] not in targets:
+        targets.append(names[call.target])
+    return targets
+
+  def call_graph(self):
+    """ return the call graph as a dict of function name to callee names.
+        a function which cannot be lifted is taken as a leaf, its error
+        is reported when it is decompiled. """
+    graph = {}
+    for name in self.functions:
+      try:
+        graph[name] = self.call_targets(self.functions[name])
+      except Exception as e:
+        graph[name] = []
+    return graph
+
+  def strongly_connected_components(self, graph):
+    """ return the components of the call graph, callees first. """
+    return callgraph.strongly_connected_components(graph, key=lambda name: self.functions[name].address)
+
   def read_stdin(self):
     data = ''
     while True:
@@ -61,25 +140,103 @@ class Cmdline(object):
       data += line
     return data
 
-  def print_function(self, function):
-    print '----------'
-    print '%x %s (%s)' % (function.address, function.name, self.step_until.__doc__)
+  def write_header(self, function, stream):
+    stream.write('----------\n')
+    stream.write('%x %s (%s)\n' % (function.address, function.name, self.step_until.__doc__))
+    return
+
+  def write_function(self, function, stream):
+    self.write_header(function, stream)
     try:
-      dec = self.decompile_until(function.hex)
-      print(''.join([str(o) for o in output.c.tokenizer(dec.function).tokens]))
+      dec = self.decompile_until(function)
+      for warning in dec.warnings:
+        sys.stderr.write('%s: %s\n' % (function.name, warning))
+      output.c.tokenizer(dec.function).write(stream)
+      stream.write('\n')
     except BaseException as e:
-      print 'Failed to decompile: %s' % repr(e)
+      stream.write('Failed to decompile: %s\n' % repr(e))
       traceback.print_exc()
     return
 
+  def function_text(self, function):
+    stream = StringIO.StringIO()
+    self.write_function(function, stream)
+    return stream.getvalue()
+
+  def failure_text(self, function, e):
+    stream = StringIO.StringIO()
+    self.write_header(function, stream)
+    stream.write('Failed to decompile: %s\n' % repr(e))
+    return stream.getvalue()
+
+  def print_function(self, function):
+    self.write_function(function, sys.stdout)
+    return
+
+  def query_text(self, function, query, *args):
+    """ answer 'query' for 'function' as one line of json. """
+    dec = decompiler.decompiler_t(self.disassembler(function), function.address)
+    dec.calling_convention = self.callconv
+    result = dec.query(query, *args)
+    if type(result) == list:
+      result = [r._asdict() for r in result]
+    return json.dumps({'address': function.address, 'name': function.name, 'result': result}, sort_keys=True)
+
+  def query_all(self, query, *args):
+    for function in sorted(self.functions.values(), key=lambda f: f.address):
+      print self.query_text(function, query, *args)
+    return
+
   def decompile_function(self, name):
     function = self.functions[name]
     self.print_function(function)
     return
 
-  def decompile_all(self):
-    for name, function in self.functions.iteritems():
-      self.print_function(function)
+  def decompile_all(self, jobs=1):
+    graph = self.call_graph()
+    components = self.strongly_connected_components(graph)
+    if jobs <= 1:
+      for component in components:
+        for name in component:
+          self.print_function(self.functions[name])
+      return
+    self.schedule(graph, components, jobs)
+    return
+
+  def schedule(self, graph, components, jobs):
+    """ decompile the components on a pool of 'jobs' processes, each
+        caller after its callees so that it sees their summaries. the
+        output is printed in the same order as a sequential run. """
+    step = self.step_until.__name__[len('step_'):]
+
+    def arguments(i):
+      functions = [self.functions[name] for name in components[i]]
+      callees = set(callee for name in components[i] for callee in graph[name])
+      summaries = [self.summaries.get(self.functions[name].address).as_dict() \
+          for name in callees if self.functions[name].address in self.summaries]
+      return (self.arch, self.callconv, step, functions, summaries, self.snapshot_file)
+
+    def failed(i, e):
+      # the functions of a component whose worker raised have no summaries.
+      return ([self.failure_text(self.functions[name], e) for name in components[i]], [])
+
+    sys.stdout.flush() # the workers must not inherit pending output.
+    pool = multiprocessing.Pool(jobs)
+    scheduler = callgraph.scheduler_t(graph, components)
+
+    texts = {}
+    printed = 0
+    for i, (text, summaries) in scheduler.run(pool, decompile_component, arguments, failed):
+      texts[i] = text
+      for d in summaries:
+        self.summaries.add(summary.summary_t.from_dict(d))
+      while printed in texts:
+        for text in texts.pop(printed):
+          sys.stdout.write(text)
+        printed += 1
+
+    pool.close()
+    pool.join()
     return
 
   @property
@@ -91,9 +248,16 @@ class Cmdline(object):
         steps[m.group(1)] = subclass
     return steps
 
-if __name__ == '__main__':
-  p = Cmdline()
+  @property
+  def queries(self):
+    queries = OrderedDict()
+    for subclass in decompiler.decompiler_t.QUERIES:
+      m = re.match(r'query_(.*)', subclass.__name__)
+      if m:
+        queries[m.group(1)] = subclass
+    return queries
 
+if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Decompiler')
   parser.add_argument('--arch', dest='arch', action='store',
                      default='x86',
@@ -107,11 +271,27 @@ if __name__ == '__main__':
   parser.add_argument('--fct', dest='function', action='store',
                      default=None,
                      help='name of target function')
+  parser.add_argument('--query', dest='query', action='store',
+                     default=None,
+                     help='print the answer to a query as json instead of decompiling, as NAME or NAME:ADDRESS')
+  parser.add_argument('--summaries', dest='summaries', action='store',
+                     default=None,
+                     help='file where callee summaries are loaded from and saved to')
+  parser.add_argument('--jobs', dest='jobs', action='store', type=int,
+                     default=1,
+                     help='number of processes used to decompile all functions (default: 1)')
+  parser.add_argument('--snapshot', dest='snapshot', action='store',
+                     default=None,
+                     help='decompile the functions of a snapshot exported from IDA instead of reading objdump output')
 
   args = parser.parse_args()
 
-  p.arch = args.arch
+  p = Cmdline(snapshot=args.snapshot)
+  if not args.snapshot:
+    p.arch = args.arch
   p.callconv = args.callconv
+  if args.summaries:
+    p.summaries = summary.summary_store_t(args.summaries)
 
   steps = p.decompilation_steps
   if args.step.isdigit():
@@ -124,13 +304,30 @@ if __name__ == '__main__':
       print '  %-30s %s' % (name, steps[name].__doc__)
     sys.exit(1)
 
-  if not args.function:
-    p.decompile_all()
-  elif args.function in p.functions:
-    p.decompile_function(args.function)
-  else:
+  if args.function and args.function not in p.functions:
     print 'argument --fct not valid, use one of:'
     print '   %s' % (', '.join([f.name for f in p.functions.values()]))
     sys.exit(1)
 
+  if args.query:
+    name, _, arg = args.query.partition(':')
+    queries = p.queries
+    if name not in queries:
+      print 'argument --query not valid, choose one of:'
+      for name in queries:
+        print '  %-30s %s' % (name, queries[name].__doc__)
+      sys.exit(1)
+    qargs = [int(arg, 0)] if arg else []
+    if args.function:
+      print p.query_text(p.functions[args.function], queries[name], *qargs)
+    else:
+      p.query_all(queries[name], *qargs)
+  elif args.function:
+    p.decompile_function(args.function)
+  else:
+    p.decompile_all(args.jobs)
+
+  if args.summaries:
+    p.summaries.save()
+
   sys.exit(0)
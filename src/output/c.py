@@ -1,5 +1,9 @@
 # coding=utf-8
 
+import array
+import bisect
+import weakref
+
 from expressions import *
 from statements import *
 from iterators import statement_iterator_t
@@ -18,6 +22,7 @@ class token(object):
   """ base class for tokens """
   def __init__(self, id):
     self.id = id
+    self.ea = None
     return
 
 class token_character(token):
@@ -110,18 +115,215 @@ class token_global(token):
   def __str__(self):
     return str(self.value)
 
+TOKEN_CLASSES = {
+  CHARACTER: token_character,
+  LMATCH: token_lmatch,
+  RMATCH: token_rmatch,
+  KEYWORD: token_keyword,
+  VAR: token_var,
+  STRING: token_string,
+  NUMBER: token_number,
+  GLOBAL: token_global,
+}
+
+# size of the text buffered by writer_t before it is written out.
+CHUNK_SIZE = 0x10000
+
+def token_text(kind, value):
+  """ the text of a token of the given kind. """
+  if kind == STRING:
+    return repr(value)
+  return str(value)
+
+class symbol_cache_t(object):
+  """ memo of the names and strings found at addresses, shared by all
+      the functions rendered in a session. buffers rendered with this
+      cache are re-rendered in place when a name or string changes. """
+
+  def __init__(self, arch):
+    self.arch = arch
+    self.names = {}
+    self.strings = {}
+    self.buffers = weakref.WeakSet()
+    return
+
+  def name(self, ea):
+    if ea not in self.names:
+      self.names[ea] = self.arch.get_ea_name(ea)
+    return self.names[ea]
+
+  def string(self, ea):
+    if ea not in self.strings:
+      self.strings[ea] = self.arch.get_string(ea)
+    return self.strings[ea]
+
+  def resolve(self, ea, strings=True, default=None):
+    """ return (kind, value) of the token for address 'ea': a string if
+        'strings' is set and there is one, a name, 'default' or else
+        a number. """
+    if strings:
+      s = self.string(ea)
+      if s:
+        return STRING, s
+    name = self.name(ea)
+    if name:
+      return GLOBAL, name
+    if default is not None:
+      return GLOBAL, default
+    return NUMBER, ea
+
+  def add_name(self, ea, name):
+    self.arch.add_name(ea, name)
+    return self.renamed(ea)
+
+  def add_string(self, ea, string):
+    self.arch.add_string(ea, string)
+    return self.renamed(ea)
+
+  def renamed(self, ea):
+    """ the name or string at 'ea' changed outside of this cache, i.e.
+        it was renamed in the host. returns the buffers whose text changed. """
+    self.names.pop(ea, None)
+    self.strings.pop(ea, None)
+    return [buf for buf in list(self.buffers) if len(buf.rebind(ea)) > 0]
+
+class sink_t(object):
+  """ receives tokens from the tokenizer. """
+
+  def add(self, kind, value, ea):
+    raise NotImplementedError('sink must override this method')
+
+  def add_symbol(self, kind, value, ea, symbol):
+    """ add the token resolved for 'symbol', which is the tuple
+        (address, strings, default) given to symbol_cache_t.resolve. """
+    self.add(kind, value, ea)
+    return
+
+class token_list_t(sink_t):
+  """ rich token objects, with left and right matching tokens linked
+      to each other. """
+
+  def __init__(self):
+    self.tokens = []
+    self.lmatches = []
+    return
+
+  def add(self, kind, value, ea):
+    tok = TOKEN_CLASSES[kind](value)
+    tok.ea = ea
+    if kind == LMATCH:
+      self.lmatches.append(tok)
+    elif kind == RMATCH:
+      ltok = self.lmatches.pop()
+      ltok.rmatch = tok
+      tok.lmatch = ltok
+    self.tokens.append(tok)
+    return
+
+class token_buffer_t(sink_t):
+  """ compact tokens, in parallel arrays: the kind of each token, the
+      offset where its text starts and the address of the statement it
+      comes from. token i spans offsets[i]:offsets[i+1] of the text.
+
+      tokens for addresses are placeholders which are bound again to
+      their name or string when it changes, see rebind(). """
+
+  def __init__(self, symbols):
+    self.symbols = symbols
+    self.kinds = array.array('B')
+    self.offsets = array.array('L', [0])
+    self.eas = []
+    self.parts = []
+    self.placeholders = {} # address -> [(token index, strings, default), ...]
+    symbols.buffers.add(self)
+    return
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def add(self, kind, value, ea):
+    text = token_text(kind, value)
+    self.kinds.append(kind)
+    self.offsets.append(self.offsets[-1] + len(text))
+    self.eas.append(ea)
+    self.parts.append(text)
+    return
+
+  def add_symbol(self, kind, value, ea, symbol):
+    address, strings, default = symbol
+    self.placeholders.setdefault(address, []).append((len(self.kinds), strings, default))
+    self.add(kind, value, ea)
+    return
+
+  def rebind(self, address):
+    """ render again the tokens for 'address'. returns the indexes of
+        the tokens which changed. """
+    changed = []
+    for i, strings, default in self.placeholders.get(address, []):
+      kind, value = self.symbols.resolve(address, strings, default)
+      text = token_text(kind, value)
+      if text != self.parts[i] or kind != self.kinds[i]:
+        self.kinds[i] = kind
+        self.parts[i] = text
+        changed.append(i)
+    if len(changed) > 0:
+      for i in range(changed[0], len(self.parts)):
+        self.offsets[i+1] = self.offsets[i] + len(self.parts[i])
+    return changed
+
+  def token(self, i):
+    """ return (kind, text, ea) for token 'i'. """
+    return self.kinds[i], self.parts[i], self.eas[i]
+
+  @property
+  def text(self):
+    return ''.join(self.parts)
+
+class writer_t(sink_t):
+  """ writes the text of tokens to a file-like object, in chunks of
+      about 'chunk_size' bytes. """
+
+  def __init__(self, stream, chunk_size=CHUNK_SIZE):
+    self.stream = stream
+    self.chunk_size = chunk_size
+    self.parts = []
+    self.size = 0
+    return
+
+  def add(self, kind, value, ea):
+    text = token_text(kind, value)
+    self.parts.append(text)
+    self.size += len(text)
+    if self.size >= self.chunk_size:
+      self.flush()
+    return
+
+  def flush(self):
+    if len(self.parts) > 0:
+      self.stream.write(''.join(self.parts))
+      self.parts = []
+      self.size = 0
+    return
+
 class tokenizer(object):
   """ Tokenizer class for C.
 
   This class transforms the syntax tree into a flat list of tokens.
+  Tokens are emitted into a sink: a list of rich token objects, a
+  compact token_buffer_t, or a writer_t which streams the text.
   """
 
-  def __init__(self, function, indent='   '):
+  def __init__(self, function, indent='   ', symbols=None):
     self.function = function
     self.arch = function.arch
     self.indent = indent
+    self.symbols = symbols or symbol_cache_t(self.arch)
+    # sorted addresses of all statements, to resolve labels by bisection.
+    self.statement_eas = sorted(set(stmt.ea for stmt in statement_iterator_t(function) if stmt.ea is not None))
     self.display_labels = self.display_labels()
     self.done_labels = None
+    self.sink = None # where tokens are emitted while rendering.
+    self.ea = None # address of the statement being rendered.
     return
 
   def display_labels(self):
@@ -132,77 +334,112 @@ class tokenizer(object):
       elif type(stmt) == branch_t:
         locations.append(stmt.true.value)
         locations.append(stmt.false.value)
-    return [self.adjusted_location(ea) for ea in locations]
+    return set(self.adjusted_location(ea) for ea in locations)
 
   def adjusted_location(self, ea):
-    eas = [stmt.ea for stmt in statement_iterator_t(self.function) if stmt.ea is not None and stmt.ea >= ea]
-    if len(eas) == 0:
+    """ the address of the first statement at or after 'ea'. """
+    i = bisect.bisect_left(self.statement_eas, ea)
+    if i == len(self.statement_eas):
       return ea
-    return min(eas)
-
-  @property
-  def tokens(self):
+    return self.statement_eas[i]
 
-    self.done_labels = []
+  def render(self, sink):
+    """ render the whole function into 'sink'. """
+    self.sink = sink
+    self.ea = None
+    self.done_labels = set()
 
-    name = self.arch.get_ea_name(self.function.ea)
-    if name is None:
-      name = 'func'
-    yield token_global(name)
+    self.symbol(self.function.ea, strings=False, default='func')
 
-    l,r = self.matching('(', ')')
-    yield l
+    self.emit(LMATCH, '(')
     args = list(self.function.arguments)
     for i in range(len(args)):
-      for tok in self.expression_tokens(args[i]):
-        yield tok
+      self.expression(args[i])
       if i < len(args)-1:
-        yield token_character(',')
-        yield token_character(' ')
-    yield r
-    yield token_character(' ')
+        self.emit(CHARACTER, ',')
+        self.emit(CHARACTER, ' ')
+    self.emit(RMATCH, ')')
+    self.emit(CHARACTER, ' ')
 
-    l,r = self.matching('{', '}')
-    yield l
-    yield token_character('\n')
+    self.emit(LMATCH, '{')
+    self.emit(CHARACTER, '\n')
 
     for ea in sorted(self.function.blocks.keys()):
       block = self.function.blocks[ea]
-      for tok in self.statement_tokens(block.container, indent=1):
-        yield tok
+      self.statement(block.container, indent=1)
+
+    self.emit(RMATCH, '}')
+
+    self.sink = None
+    return sink
+
+  @property
+  def tokens(self):
+    """ rich token objects for the whole function. """
+    return iter(self.render(token_list_t()).tokens)
+
+  def buffer(self):
+    """ compact tokens for the whole function. """
+    return self.render(token_buffer_t(self.symbols))
+
+  def write(self, stream, chunk_size=CHUNK_SIZE):
+    """ stream the text of the whole function to 'stream'. """
+    writer = writer_t(stream, chunk_size)
+    self.render(writer)
+    writer.flush()
+    return
+
+  def text(self):
+    """ the text of the whole function. """
+    return self.buffer().text
 
-    yield r
+  def expression_tokens(self, obj):
+    """ rich token objects for a single expression. """
+    self.sink = token_list_t()
+    self.ea = None
+    self.expression(obj)
+    tokens, self.sink = self.sink.tokens, None
+    return iter(tokens)
 
+  def statement_tokens(self, obj, indent=0):
+    """ rich token objects for a single statement. """
+    self.sink = token_list_t()
+    self.ea = None
+    if self.done_labels is None:
+      self.done_labels = set()
+    self.statement(obj, indent)
+    tokens, self.sink = self.sink.tokens, None
+    return iter(tokens)
+
+  def emit(self, kind, value):
+    self.sink.add(kind, value, self.ea)
+    return
+
+  def symbol(self, address, strings=True, default=None):
+    """ emit the token for 'address', which is looked up through the
+        symbol cache and may be bound again later. """
+    kind, value = self.symbols.resolve(address, strings, default)
+    self.sink.add_symbol(kind, value, self.ea, (address, strings, default))
     return
 
   def regname(self, which):
     """ returns the register name without index """
     return self.arch.get_regname(which)
 
-  def matching(self, lchar, rchar):
-    ltok = token_lmatch(lchar)
-    rtok = token_rmatch(rchar)
-    ltok.rmatch = rtok
-    rtok.lmatch = ltok
-    return ltok, rtok
-
   def parenthesize(self, obj):
     """ parenthesize objects as needed. """
 
     if type(obj) not in (regloc_t, flagloc_t, value_t, var_t, stack_var_t, arg_t) or \
           (type(obj) in (regloc_t, flagloc_t) and obj.index is not None):
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj):
-        yield tok
-      yield r
+      self.emit(LMATCH, '(')
+      self.expression(obj)
+      self.emit(RMATCH, ')')
     else:
-      for tok in self.expression_tokens(obj):
-        yield tok
+      self.expression(obj)
 
     return
 
-  def expression_tokens(self, obj):
+  def expression(self, obj):
 
     if type(obj) in (regloc_t, flagloc_t):
       if obj.name:
@@ -211,354 +448,313 @@ class tokenizer(object):
         name = '#%u' % obj.which
       if obj.index is not None:
         name += '@%u' % obj.index
-      yield token_var(name)
+      self.emit(VAR, name)
       return
 
     if type(obj) in (deref_t, ):
-      yield token_character(obj.operator)
-      for tok in self.parenthesize(obj.op):
-        yield tok
+      self.emit(CHARACTER, obj.operator)
+      self.parenthesize(obj.op)
       if obj.index is not None:
-        yield token_character('@%u' % (obj.index, ))
+        self.emit(CHARACTER, '@%u' % (obj.index, ))
       return
 
     if type(obj) == value_t:
-      s = self.arch.get_string(obj.value)
-      if s:
-        yield token_string(s)
-        return
-      s = self.arch.get_ea_name(obj.value)
-      if s:
-        yield token_global(s)
-        return
-      yield token_number(obj.value)
+      self.symbol(obj.value)
       return
 
     if isinstance(obj, var_t):
       name = obj.name
       if obj.index is not None:
         name += '@%u' % obj.index
-      yield token_var(name)
+      self.emit(VAR, name)
       return
 
     if type(obj) == arg_t:
       name = obj.name
       if obj.index is not None:
         name += '@%u' % obj.index
-      yield token_var(name)
+      self.emit(VAR, name)
       return
 
     if type(obj) == call_t:
       if type(obj.fct) == value_t:
-        name = self.arch.get_ea_name(obj.fct.value)
-        if name:
-          yield token_global(name)
-        else:
-          yield token_number(obj.fct.value)
+        self.symbol(obj.fct.value, strings=False)
       else:
-        for tok in self.parenthesize(obj.fct):
-          yield tok
+        self.parenthesize(obj.fct)
 
-      l, r = self.matching('(', ')')
-      yield l
+      self.emit(LMATCH, '(')
       if obj.params is not None:
-        params = list(self.expression_tokens(obj.params))
-        for tok in params[:-2]:
-          yield tok
-      yield r
+        params = list(obj.params.operands)
+        for i in range(len(params)):
+          if i > 0:
+            self.emit(CHARACTER, ',')
+            self.emit(CHARACTER, ' ')
+          self.expression(params[i])
+      self.emit(RMATCH, ')')
 
       return
 
     if type(obj) == params_t:
       for param in obj.operands:
-        for tok in self.expression_tokens(param):
-          yield tok
-        yield token_character(',')
-        yield token_character(' ')
+        self.expression(param)
+        self.emit(CHARACTER, ',')
+        self.emit(CHARACTER, ' ')
       return
 
     if type(obj) in (not_t, b_not_t, address_t, neg_t, preinc_t, predec_t):
-      yield token_character(obj.operator)
-      for tok in self.parenthesize(obj.op):
-        yield tok
+      self.emit(CHARACTER, obj.operator)
+      self.parenthesize(obj.op)
       return
 
     if type(obj) in (postinc_t, postdec_t):
-      for tok in self.parenthesize(obj.op):
-        yield tok
-      yield token_character(obj.operator)
+      self.parenthesize(obj.op)
+      self.emit(CHARACTER, obj.operator)
       return
 
     if type(obj) in (assign_t, add_t, sub_t, mul_t, div_t, shl_t, shr_t, xor_t, and_t, \
                       or_t, b_and_t, b_or_t, eq_t, neq_t, leq_t, aeq_t, lower_t, above_t):
-      for tok in self.expression_tokens(obj.op1):
-        yield tok
-      yield token_character(' ')
-      yield token_character(obj.operator)
-      yield token_character(' ')
-      for tok in self.expression_tokens(obj.op2):
-        yield tok
+      self.expression(obj.op1)
+      self.emit(CHARACTER, ' ')
+      self.emit(CHARACTER, obj.operator)
+      self.emit(CHARACTER, ' ')
+      self.expression(obj.op2)
       return
 
     if type(obj) == ternary_if_t:
-      for tok in self.parenthesize(obj.op1):
-        yield tok
-      yield token_character(' ')
-      yield token_character(obj.operator1)
-      yield token_character(' ')
-      for tok in self.parenthesize(obj.op2):
-        yield tok
-      yield token_character(' ')
-      yield token_character(obj.operator2)
-      yield token_character(' ')
-      for tok in self.parenthesize(obj.op3):
-        yield tok
+      self.parenthesize(obj.op1)
+      self.emit(CHARACTER, ' ')
+      self.emit(CHARACTER, obj.operator1)
+      self.emit(CHARACTER, ' ')
+      self.parenthesize(obj.op2)
+      self.emit(CHARACTER, ' ')
+      self.emit(CHARACTER, obj.operator2)
+      self.emit(CHARACTER, ' ')
+      self.parenthesize(obj.op3)
       return
 
     if type(obj) == sign_t:
-      yield token_keyword('SIGN')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.op):
-        yield tok
-      yield r
+      self.emit(KEYWORD, 'SIGN')
+      self.emit(LMATCH, '(')
+      self.expression(obj.op)
+      self.emit(RMATCH, ')')
       return
 
     if type(obj) == overflow_t:
-      yield token_keyword('OVERFLOW')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.op):
-        yield tok
-      yield r
+      self.emit(KEYWORD, 'OVERFLOW')
+      self.emit(LMATCH, '(')
+      self.expression(obj.op)
+      self.emit(RMATCH, ')')
       return
 
     if type(obj) == parity_t:
-      yield token_keyword('PARITY')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.op):
-        yield tok
-      yield r
+      self.emit(KEYWORD, 'PARITY')
+      self.emit(LMATCH, '(')
+      self.expression(obj.op)
+      self.emit(RMATCH, ')')
       return
 
     if type(obj) == adjust_t:
-      yield token_keyword('ADJUST')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.op):
-        yield tok
-      yield r
+      self.emit(KEYWORD, 'ADJUST')
+      self.emit(LMATCH, '(')
+      self.expression(obj.op)
+      self.emit(RMATCH, ')')
       return
 
     if type(obj) == carry_t:
-      yield token_keyword('CARRY')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.op):
-        yield tok
-      yield r
+      self.emit(KEYWORD, 'CARRY')
+      self.emit(LMATCH, '(')
+      self.expression(obj.op)
+      self.emit(RMATCH, ')')
       return
 
     if type(obj) == phi_t:
-      yield token_keyword('Φ')
-      l, r = self.matching('(', ')')
-      yield l
+      self.emit(KEYWORD, 'Φ')
+      self.emit(LMATCH, '(')
       for op in obj.operands:
-        for tok in self.expression_tokens(op):
-          yield tok
-        yield token_character(',')
-        yield token_character(' ')
-      yield r
+        self.expression(op)
+        self.emit(CHARACTER, ',')
+        self.emit(CHARACTER, ' ')
+      self.emit(RMATCH, ')')
       return
 
     if obj is None:
-      yield token_keyword('None')
+      self.emit(KEYWORD, 'None')
       return
 
     raise ValueError('cannot display object of type %s' % (obj.__class__.__name__, ))
 
-  def statement_tokens(self, obj, indent=0):
+  def statement(self, obj, indent=0, inline=False):
+    """ 'inline' continues the current line instead of indenting,
+        unless a label had to be emitted first. """
+    ea = self.ea
+    if isinstance(obj, statement_t) and obj.ea is not None:
+      self.ea = obj.ea
+    self.statement_body(obj, indent, inline)
+    self.ea = ea
+    return
+
+  def statement_body(self, obj, indent, inline=False):
 
     if isinstance(obj, statement_t) and obj.ea is not None:
       if obj.ea in self.display_labels and obj.ea not in self.done_labels:
-        yield token_global('loc_%x' % (obj.ea, ))
-        yield token_character(':')
-        yield token_character('\n')
-        self.done_labels.append(obj.ea)
+        self.emit(GLOBAL, 'loc_%x' % (obj.ea, ))
+        self.emit(CHARACTER, ':')
+        self.emit(CHARACTER, '\n')
+        self.done_labels.add(obj.ea)
+        inline = False
 
     if type(obj) == statement_t:
-      yield token_character(self.indent * indent)
-      for tok in self.expression_tokens(obj.expr):
-        yield tok
-      yield token_character(';')
+      self.emit(CHARACTER, self.indent * indent)
+      self.expression(obj.expr)
+      self.emit(CHARACTER, ';')
       return
 
     if type(obj) == container_t:
       for stmt in obj:
-        for tok in self.statement_tokens(stmt, indent):
-          yield tok
-        yield token_character('\n')
+        self.statement(stmt, indent)
+        self.emit(CHARACTER, '\n')
       return
 
     if type(obj) == if_t:
-      yield token_character(self.indent * indent)
-      yield token_keyword('if')
-      yield token_character(' ')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.expr):
-        yield tok
-      yield r
-      yield token_character(' ')
-
-      l, r = self.matching('{', '}')
-      yield l
-      yield token_character('\n')
-      for tok in self.statement_tokens(obj.then_expr, indent+1):
-        yield tok
-      yield token_character(self.indent * indent)
-      yield r
-
-      if obj.else_expr:
-        yield token_character('\n')
-        yield token_character(self.indent * indent)
-        yield token_keyword('else')
-        yield token_character(' ')
-
-        if len(obj.else_expr) == 1 and type(obj.else_expr[0]) == if_t:
-          generator = self.statement_tokens(obj.else_expr, indent)
-          # remove first and last tokens (indent, and newline)
-          tokens = list(generator)[1:-1]
-          for tok in tokens:
-            yield tok
-        else:
-          l, r = self.matching('{', '}')
-          yield l
-          yield token_character('\n')
-          for tok in self.statement_tokens(obj.else_expr, indent+1):
-            yield tok
-          yield token_character(self.indent * indent)
-          yield r
-
+      if not inline:
+        self.emit(CHARACTER, self.indent * indent)
+      self.if_statement(obj, indent)
       return
 
     if type(obj) == while_t:
 
-      yield token_character(self.indent * indent)
-      yield token_keyword('while')
-      yield token_character(' ')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.expr):
-        yield tok
-      yield r
-      yield token_character(' ')
-
-      l, r = self.matching('{', '}')
-      yield l
-      yield token_character('\n')
-      for tok in self.statement_tokens(obj.loop_container, indent+1):
-        yield tok
-      yield token_character(self.indent * indent)
-      yield r
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'while')
+      self.emit(CHARACTER, ' ')
+      self.emit(LMATCH, '(')
+      self.expression(obj.expr)
+      self.emit(RMATCH, ')')
+      self.emit(CHARACTER, ' ')
+
+      self.emit(LMATCH, '{')
+      self.emit(CHARACTER, '\n')
+      self.statement(obj.loop_container, indent+1)
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(RMATCH, '}')
 
       return
 
     if type(obj) == do_while_t:
 
-      yield token_character(self.indent * indent)
-      yield token_keyword('do')
-      yield token_character(' ')
-      l, r = self.matching('{', '}')
-      yield l
-      yield token_character('\n')
-      for tok in self.statement_tokens(obj.loop_container, indent+1):
-        yield tok
-      yield token_character(self.indent * indent)
-      yield r
-
-      yield token_character(' ')
-      yield token_keyword('while')
-      yield token_character(' ')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.expr):
-        yield tok
-      yield r
-      yield token_character(';')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'do')
+      self.emit(CHARACTER, ' ')
+      self.emit(LMATCH, '{')
+      self.emit(CHARACTER, '\n')
+      self.statement(obj.loop_container, indent+1)
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(RMATCH, '}')
+
+      self.emit(CHARACTER, ' ')
+      self.emit(KEYWORD, 'while')
+      self.emit(CHARACTER, ' ')
+      self.emit(LMATCH, '(')
+      self.expression(obj.expr)
+      self.emit(RMATCH, ')')
+      self.emit(CHARACTER, ';')
 
       return
 
     if type(obj) == goto_t:
-      yield token_character(self.indent * indent)
-      yield token_keyword('goto')
-      yield token_character(' ')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'goto')
+      self.emit(CHARACTER, ' ')
 
       if type(obj.expr) == value_t:
         ea = self.adjusted_location(obj.expr.value)
-        yield token_global('loc_%x' % (ea, ))
+        self.emit(GLOBAL, 'loc_%x' % (ea, ))
       else:
-        for tok in self.expression_tokens(obj.expr):
-          yield tok
+        self.expression(obj.expr)
 
-      yield token_character(';')
+      self.emit(CHARACTER, ';')
       return
 
     if type(obj) == branch_t:
-      yield token_character(self.indent * indent)
+      self.emit(CHARACTER, self.indent * indent)
 
-      yield token_keyword('goto')
-      yield token_character(' ')
+      self.emit(KEYWORD, 'goto')
+      self.emit(CHARACTER, ' ')
       if type(obj.true) == value_t:
         ea = self.adjusted_location(obj.true.value)
-        yield token_global('loc_%x' % (ea, ))
+        self.emit(GLOBAL, 'loc_%x' % (ea, ))
       else:
-        for tok in self.expression_tokens(obj.true):
-            yield tok
-
-      yield token_character(' ')
-      yield token_keyword('if')
-      l, r = self.matching('(', ')')
-      yield l
-      for tok in self.expression_tokens(obj.expr):
-        yield tok
-      yield r
-
-      yield token_character(' ')
-      yield token_keyword('else')
-      yield token_character(' ')
-      yield token_keyword('goto')
-      yield token_character(' ')
+        self.expression(obj.true)
+
+      self.emit(CHARACTER, ' ')
+      self.emit(KEYWORD, 'if')
+      self.emit(LMATCH, '(')
+      self.expression(obj.expr)
+      self.emit(RMATCH, ')')
+
+      self.emit(CHARACTER, ' ')
+      self.emit(KEYWORD, 'else')
+      self.emit(CHARACTER, ' ')
+      self.emit(KEYWORD, 'goto')
+      self.emit(CHARACTER, ' ')
       if type(obj.false) == value_t:
         ea = self.adjusted_location(obj.false.value)
-        yield token_global('loc_%x' % (ea, ))
+        self.emit(GLOBAL, 'loc_%x' % (ea, ))
       else:
-        for tok in self.expression_tokens(obj.false):
-          yield tok
-      yield token_character(';')
+        self.expression(obj.false)
+      self.emit(CHARACTER, ';')
       return
 
     if type(obj) == return_t:
-      yield token_character(self.indent * indent)
-      yield token_keyword('return')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'return')
       if obj.expr:
-        yield token_character(' ')
-        for tok in self.expression_tokens(obj.expr):
-          yield tok
-      yield token_character(';')
+        self.emit(CHARACTER, ' ')
+        self.expression(obj.expr)
+      self.emit(CHARACTER, ';')
       return
 
     if type(obj) == break_t:
-      yield token_character(self.indent * indent)
-      yield token_keyword('break')
-      yield token_character(';')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'break')
+      self.emit(CHARACTER, ';')
       return
 
     if type(obj) == continue_t:
-      yield token_character(self.indent * indent)
-      yield token_keyword('continue')
-      yield token_character(';')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'continue')
+      self.emit(CHARACTER, ';')
       return
 
     raise ValueError('cannot display object of type %s' % (obj.__class__.__name__, ))
+
+  def if_statement(self, obj, indent):
+    self.emit(KEYWORD, 'if')
+    self.emit(CHARACTER, ' ')
+    self.emit(LMATCH, '(')
+    self.expression(obj.expr)
+    self.emit(RMATCH, ')')
+    self.emit(CHARACTER, ' ')
+
+    self.emit(LMATCH, '{')
+    self.emit(CHARACTER, '\n')
+    self.statement(obj.then_expr, indent+1)
+    self.emit(CHARACTER, self.indent * indent)
+    self.emit(RMATCH, '}')
+
+    if obj.else_expr:
+      self.emit(CHARACTER, '\n')
+      self.emit(CHARACTER, self.indent * indent)
+      self.emit(KEYWORD, 'else')
+      self.emit(CHARACTER, ' ')
+
+      if len(obj.else_expr) == 1 and type(obj.else_expr[0]) == if_t:
+        # 'else if' on the same line, without indent.
+        self.statement(obj.else_expr[0], indent, inline=True)
+      else:
+        self.emit(LMATCH, '{')
+        self.emit(CHARACTER, '\n')
+        self.statement(obj.else_expr, indent+1)
+        self.emit(CHARACTER, self.indent * indent)
+        self.emit(RMATCH, '}')
+
+    return
@@ -1,5 +1,6 @@
 from expressions import *
 from iterators import *
+import iterators
 import filters.simplify_expressions
 
 class propagator_t(object):
@@ -72,19 +73,259 @@ class phi_propagator_t(propagator_t):
       new = propagator_t.replace(self, defn, value, use)
     return new
 
+# kinds of root a stack value is relative to.
+ROOT_LOCATION = 0 # the value of a register definition, i.e. esp@0.
+ROOT_EXPRESSION = 1 # the expression assigned by a definition, i.e. (esp@0 - 4) & -16.
+
 class stack_propagator_t(propagator_t):
-  def replace_with(self, defn, value, use):
-    if isinstance(use.parent, phi_t) or \
-        isinstance(value, phi_t) or \
-        not isinstance(value, replaceable_t):
-      return
-    if self.function.arch.is_stackreg(defn) or \
-        self.is_stack_location(value):
+  """ Stack pointer offset analysis.
+
+  Walks the blocks once in reverse postorder and computes the value of
+  each register definition which derives from the stack pointer, as a
+  root plus a constant offset. Each use of such a definition is then
+  rewritten directly into its canonical form, i.e. 'esp@0 - 8', and the
+  definitions which lose all their uses are removed.
+
+  Stack pointer definitions at merge points (phi-functions) take the
+  value of their operands when they all agree, otherwise they become
+  the root of the values which derive from them; those whose operands
+  have differing offsets from the same root are kept in `inconsistent`.
+  Phi-functions at loop headers are checked once the sweep is done.
+  """
+
+  def __init__(self, function):
+    propagator_t.__init__(self, function)
+    self.values = {} # id(definition) -> ((kind, root definition) or None, offset)
+    self.rewritten = {} # id(definition) -> definition, for which at least one use was rewritten
+    self.inconsistent = [] # stack pointer phi definitions whose operands disagree
+    self.phis = [] # (definition, phi) for stack pointer phi definitions, in the order they are found
+    self.bounds = {} # id(definition) -> (value, extra) or None, for ROOT_EXPRESSION definitions
+    return
+
+  def reverse_postorder(self):
+    successors = {}
+    for block in self.function.blocks.values():
+      successors[block] = iterators.block_successors(self.function, block)
+    order = iterators.block_postorder(self.function, successors)
+    return list(reversed(order))
+
+  def evaluate(self, expr):
+    """ return (root, offset) for an expression which is a constant
+        offset from a known root, or None. """
+    if type(expr) == value_t:
+      return (None, expr.value)
+    if type(expr) == regloc_t:
+      if expr.definition is None:
+        return
+      value = self.values.get(id(expr.definition))
+      if value is None:
+        return ((ROOT_LOCATION, expr.definition), 0)
       return value
+    if type(expr) in (add_t, sub_t) and type(expr.op2) == value_t:
+      value = self.evaluate(expr.op1)
+      if value is None:
+        return
+      root, offset = value
+      if type(expr) == add_t:
+        return (root, offset + expr.op2.value)
+      return (root, offset - expr.op2.value)
+    return
+
+  def is_stack_root(self, root):
+    return root is not None and self.function.arch.is_stackreg(root[1])
+
+  def evaluate_phi(self, defn, phi):
+    values = []
+    for op in phi:
+      if op.definition is None or id(op.definition) not in self.values:
+        return
+      values.append(self.values[id(op.definition)])
+    if len(values) == 0:
+      return
+    if any(value != values[0] for value in values):
+      if self.function.arch.is_stackreg(defn):
+        self.inconsistent.append(defn)
+      return
+    return values[0]
+
+  def evaluate_definition(self, defn, value):
+    """ find the stack value assigned to 'defn', if any. """
+    is_stackreg = self.function.arch.is_stackreg(defn)
+    if isinstance(value, phi_t):
+      if is_stackreg:
+        self.phis.append((defn, value))
+      result = self.evaluate_phi(defn, value)
+    else:
+      result = self.evaluate(value)
+      if result is None and is_stackreg and isinstance(value, replaceable_t):
+        result = ((ROOT_EXPRESSION, defn), 0)
+        self.bounds[id(defn)] = self.bound(value)
+    if result is None:
+      return
+    if is_stackreg or self.is_stack_root(result[0]):
+      self.values[id(defn)] = result
+    return
+
+  def expression(self, value):
+    """ build the canonical expression for a stack value. """
+    root, offset = value
+    if root is None:
+      return value_t(offset, self.function.arch.address_size)
+    kind, defn = root
+    if kind == ROOT_LOCATION:
+      expr = defn.copy()
+      expr.definition = defn
+    else:
+      expr = defn.parent_statement.expr.op2.copy(with_definition=True)
+    if offset > 0:
+      expr = add_t(expr, value_t(offset, self.function.arch.address_size))
+    elif offset < 0:
+      expr = sub_t(expr, value_t(-offset, self.function.arch.address_size))
+    return expr
+
+  def rewrite_uses(self, stmt):
+    """ rewrite all uses of known stack values in 'stmt'. """
+    uses = [op for op in iterators.flat_operands(stmt.expr) if type(op) == regloc_t and \
+              not op.is_def and op.definition is not None and \
+              id(op.definition) in self.values and not isinstance(op.parent, phi_t)]
+    for use in uses:
+      defn = use.definition
+      new = self.expression(self.values[id(defn)])
+      use.unlink()
+      use.replace(new)
+      self.rewritten[id(defn)] = defn
+    if len(uses) > 0:
+      filters.simplify_expressions.run(stmt.expr, deep=True)
+    return
+
+  def bound(self, expr):
+    """ return (value, extra) when 'expr' is at most 'extra' bytes below
+        a known stack value, i.e. when it aligns the stack pointer down
+        as in '(esp@0 - 4) & -16 - 32'. returns None otherwise. """
+    if type(expr) in (add_t, sub_t) and type(expr.op2) == value_t:
+      bound = self.bound(expr.op1)
+      if bound is None:
+        return
+      (root, offset), extra = bound
+      if type(expr) == add_t:
+        return ((root, offset + expr.op2.value), extra)
+      return ((root, offset - expr.op2.value), extra)
+    if type(expr) != and_t or type(expr.op2) != value_t:
+      return
+    bits = (1 << self.function.arch.address_size) - 1
+    extra = ~expr.op2.value & bits
+    if extra & (extra + 1) != 0:
+      # not a mask of the lowest bits.
+      return
+    value = self.evaluate(expr.op1)
+    if value is not None:
+      if not self.is_stack_root(value[0]):
+        return
+      return (value, extra)
+    bound = self.bound(expr.op1)
+    if bound is None:
+      return
+    return (bound[0], bound[1] + extra)
+
+  def depth(self, value, depths):
+    """ return the worst case number of bytes by which 'value' is below
+        the stack pointer at the entry of the function, or None. """
+    root, offset = value
+    if root is None or id(root[1]) not in depths:
+      return
+    return depths[id(root[1])] - offset
+
+  def operand_value(self, op):
+    """ the stack value of a phi-function operand. """
+    return self.values.get(id(op.definition), ((ROOT_LOCATION, op.definition), 0))
+
+  def root_depths(self):
+    """ return (depths, stable) where depths is a dict of id(root
+        definition) : worst case depth of the root below the stack
+        pointer at the entry of the function, for the roots which are
+        known. roots are phi-functions and aligned stack pointers; they
+        are relaxed until they stop changing, which happens unless the
+        stack grows each time around a loop. 'stable' is False then. """
+    depths = {}
+    for op in self.function.uninitialized:
+      if self.function.arch.is_stackreg(op):
+        depths[id(op)] = 0
 
-  def is_stack_location(self, expr):
-    return self.function.arch.is_stackreg(expr) or \
-      self.function.arch.is_stackvar(expr)
+    rounds = 0
+    changed = True
+    while changed:
+      if rounds > len(self.phis) + len(self.bounds):
+        return depths, False
+      rounds += 1
+      changed = False
+      for defn, phi in self.phis:
+        key = id(defn)
+        for op in phi:
+          if op.definition is None:
+            continue
+          depth = self.depth(self.operand_value(op), depths)
+          if depth is not None and (key not in depths or depth > depths[key]):
+            depths[key] = depth
+            changed = True
+      for key, bound in self.bounds.items():
+        if bound is None:
+          continue
+        value, extra = bound
+        depth = self.depth(value, depths)
+        if depth is not None and (key not in depths or depth + extra > depths[key]):
+          depths[key] = depth + extra
+          changed = True
+    return depths, True
+
+  def check_loops(self):
+    """ phi-functions at loop headers are not checked during the sweep,
+        the operands coming from back edges are not known yet. once they
+        are, all operands of a phi-function must be at the same depth. """
+    depths, stable = self.root_depths()
+    for defn, phi in self.phis:
+      if id(defn) in self.values or any(defn is other for other in self.inconsistent):
+        continue
+      found = set()
+      for op in phi:
+        if op.definition is None:
+          continue
+        depth = self.depth(self.operand_value(op), depths)
+        if depth is not None:
+          found.add(depth)
+      if len(found) > 1:
+        self.inconsistent.append(defn)
+    return
+
+  def frame_size(self):
+    """ the largest number of bytes by which the stack pointer may go
+        below its value at the entry of the function, or None if this
+        cannot be known. """
+    depths, stable = self.root_depths()
+    if not stable:
+      return
+    size = max([0] + depths.values())
+    for value in self.values.values():
+      if not self.is_stack_root(value[0]):
+        continue
+      depth = self.depth(value, depths)
+      if depth is None:
+        return
+      size = max(size, depth)
+    return size
+
+  def propagate(self):
+    for block in self.reverse_postorder():
+      for stmt in list(block.container.statements):
+        self.rewrite_uses(stmt)
+        if self.is_assignment(stmt) and type(stmt.expr.op1) == regloc_t:
+          self.evaluate_definition(stmt.expr.op1, stmt.expr.op2)
+    self.check_loops()
+
+    for defn in self.rewritten.values():
+      if len(defn.uses) == 0 and defn.parent_statement:
+        defn.parent_statement.expr.unlink()
+        defn.parent_statement.remove()
+    return
 
 class registers_propagator_t(propagator_t):
   def replace_with(self, defn, value, use):
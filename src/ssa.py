@@ -25,12 +25,25 @@ class ssa_context_t(object):
       if _loc.no_index_eq(expr):
         return _loc
 
+  def get_overlapping_definition(self, expr, overlap):
+    """ return the definition of another location overlapping `expr`,
+        i.e. a write to 'ah' when looking for 'eax', if it was made
+        after the last definition of `expr` in this context. """
+    for _loc in reversed(self.defined):
+      if _loc.no_index_eq(expr):
+        return
+      if overlap(_loc, expr):
+        return _loc
+    return
+
   def get_recursive_definition(self, expr):
-    loc = self.get_local_definition(expr)
-    if loc:
-      return loc
-    if self.parent:
-      return self.parent.get_recursive_definition(expr)
+    context = self
+    while context:
+      loc = context.get_local_definition(expr)
+      if loc:
+        return loc
+      context = context.parent
+    return
 
   def assign(self, expr):
     obj = self.get_local_definition(expr)
@@ -40,45 +53,73 @@ class ssa_context_t(object):
     return
 
 class ssa_contextual_iterator_t(object):
+  """ walks the blocks of a function depth-first, giving each block a
+      context whose parent is the context of the block it was reached
+      from. an explicit stack is used instead of recursion so that very
+      large functions do not exhaust the python stack. """
 
   def __init__(self, function, selector):
     self.function = function
     self.selector = selector
-    self.done_blocks = []
+    self.done_blocks = set()
     return
 
   def definitions(self, expr):
-    return [op for op in expr.iteroperands() if self.selector(op) and op.is_def]
+    return [op for op in iterators.flat_operands(expr) if self.selector(op) and op.is_def]
 
   def uses(self, expr):
-    return [op for op in expr.iteroperands() if self.selector(op) and not op.is_def]
+    return [op for op in iterators.flat_operands(expr) if self.selector(op) and not op.is_def]
 
   def assign_definitions(self, context, expr):
     for op in self.definitions(expr):
       context.assign(op)
     return
 
-  def traverse(self, context):
+  def targets(self, stmt):
+    """ return the blocks which are reached from `stmt`, if any. """
+    if type(stmt) == goto_t and stmt.is_known() and \
+          stmt.expr.value in self.function.blocks:
+      return [self.function.blocks[stmt.expr.value]]
+    elif type(stmt) == branch_t:
+      targets = []
+      for expr in (stmt.true, stmt.false):
+        target = self.function.blocks[expr.value]
+        if target:
+          targets.append(target)
+      return targets
+    return []
+
+  def enter(self, context, stack):
+    """ push a frame for the block in `context` unless it was seen already. """
     if context.block in self.done_blocks:
       return
-    self.done_blocks.append(context.block)
-    for stmt in list(context.block.container.statements):
+    self.done_blocks.add(context.block)
+    stmts = list(context.block.container.statements)
+    stack.append((context, iter(stmts), []))
+    return
+
+  def traverse(self, context):
+    stack = []
+    self.enter(context, stack)
+    while len(stack) > 0:
+      context, stmts, pending = stack[-1]
+      if len(pending) > 0:
+        # finish walking the blocks reached from the last statement
+        # before going on with the rest of this block.
+        target = pending.pop(0)
+        self.enter(ssa_context_t(target, context), stack)
+        continue
+      stmt = next(stmts, None)
+      if stmt is None:
+        stack.pop()
+        continue
       self.statement(context, stmt)
+      pending.extend(self.targets(stmt))
     return
 
   def statement(self, context, stmt):
     for expr in stmt.expressions:
       self.assign_definitions(context, expr)
-
-    if type(stmt) == goto_t and stmt.is_known() and \
-          stmt.expr.value in self.function.blocks:
-      target = self.function.blocks[stmt.expr.value]
-      self.traverse(ssa_context_t(target, context))
-    elif type(stmt) == branch_t:
-      for expr in (stmt.true, stmt.false):
-        target = self.function.blocks[expr.value]
-        if target:
-          self.traverse(ssa_context_t(target, context))
     return
 
 class ssa_phase1_t(ssa_contextual_iterator_t):
@@ -89,22 +130,37 @@ class ssa_phase1_t(ssa_contextual_iterator_t):
     self.exit_contexts = {}
     return
 
-  def traverse(self, context):
-    seen = context.block in self.done_blocks
-    ssa_contextual_iterator_t.traverse(self, context)
-    if not seen:
+  def enter(self, context, stack):
+    if context.block not in self.done_blocks:
       self.exit_contexts[context.block] = context
+    ssa_contextual_iterator_t.enter(self, context, stack)
     return
 
 class ssa_phase2_t(ssa_contextual_iterator_t):
   """ phase 2: for each start of block, add phi statements where necessary """
 
-  def __init__(self, function, selector, exit_contexts):
+  def __init__(self, function, selector, exit_contexts, warnings):
     ssa_contextual_iterator_t.__init__(self, function, selector)
     self.exit_contexts = exit_contexts
+    self.warnings = warnings
     self.index = 0
     return
 
+  def check_overlap(self, context, use):
+    """ the tagger binds each register to its own definitions only: warn
+        when `use` also reads a more recent write to an overlapping
+        register, which is not taken into account. """
+    if not isinstance(use, regloc_t):
+      return
+    _def = context.get_overlapping_definition(use, self.function.arch.registers_overlap)
+    if _def is None:
+      return
+    warning = '%x: %s is read after a write to the overlapping register %s' % (
+      use.parent_statement.ea, use.name, _def.name)
+    if warning not in self.warnings:
+      self.warnings.append(warning)
+    return
+
   def entry_contexts(self, block):
     return [self.exit_contexts[_from] for _from in block.jump_from]
 
@@ -170,6 +226,7 @@ class ssa_phase2_t(ssa_contextual_iterator_t):
 
   def fetch_recursive_definition(self, context, use):
 
+    self.check_overlap(context, use)
     _def = context.get_local_definition(use)
     if _def:
       return _def
@@ -365,8 +422,9 @@ class ssa_tagger_t(object):
       it becomes trivial to determine which locations in the flow are
       uninitialized, restored, etc. """
 
-  def __init__(self, function):
+  def __init__(self, function, warnings=None):
     self.function = function
+    self.warnings = warnings if warnings is not None else []
 
     self.tagger_step = SSA_STEP_NONE
 
@@ -390,7 +448,7 @@ class ssa_tagger_t(object):
     p1.traverse(ssa_context_t(self.function.entry_block))
     self.exit_contexts[self.tagger_step] = p1.exit_contexts
 
-    p2 = ssa_phase2_t(self.function, selector, p1.exit_contexts)
+    p2 = ssa_phase2_t(self.function, selector, p1.exit_contexts, self.warnings)
     p2.index = self.index
     p2.traverse(ssa_context_t(self.function.entry_block))
     #self.__uninitialized += p2.uninitialized
@@ -517,26 +575,31 @@ class ssa_tagger_t(object):
 
   def verify(self):
     """ verify that the ssa form is coherent. """
-    for op in iterators.operand_iterator_t(self.function):
-      if not isinstance(op, assignable_t):
-        continue
-
-      if op.definition:
-        assert op.is_def is False, "%s: expected is_def=False" % (repr(op), )
-        self.verify_definition_has_use(op.definition, op)
-        if not op.definition.is_uninitialized:
-          stmt = op.definition.parent_statement
-          assert stmt, "%s: has a definition which is unlinked from the tree\n  def: %s" % (repr(op), repr(op.definition))
-          assert stmt is self.function.uninitialized_stmt or stmt.container, "%s: has a definition which is unlinked from the tree" % (repr(op), )
-        assert op.definition.index == op.index, "%s: expected to have the same index as its definition: %s" % (op, op.definition)
-
-      for use in op.uses:
-        assert use.definition, '%s: has a use without definition'
-        assert use.definition is op, '%s: has a use that points to another definition\n  use: %s\n  wrong def: %s\n  should be: %s' % (repr(op), repr(use.parent_statement), repr(use.definition.parent_statement), repr(op.parent_statement))
-        stmt = use.parent_statement
-        assert stmt, "%s: has a use (%s) which is unlinked from the tree" % (repr(op), repr(use))
-        assert stmt is self.function.uninitialized_stmt or use.parent_statement.container, "%s: has a use (%s) which is unlinked from the tree" % (repr(op), repr(use))
-        assert use.definition.index == use.index, "%s: expected to have the same index as its definition: %s" % (use.parent_statement, use.definition.parent_statement)
+    for stmt in iterators.statement_iterator_t(self.function):
+      for op, parent, key in iterators.statement_operands(stmt):
+        if isinstance(op, assignable_t):
+          assert op.parent is parent and parent[key] is op, "%s: parent link is broken" % (repr(op), )
+          self.verify_operand(op)
+    return
+
+  def verify_operand(self, op):
+    """ verify that the definition and uses of an operand are coherent. """
+    if op.definition:
+      assert op.is_def is False, "%s: expected is_def=False" % (repr(op), )
+      self.verify_definition_has_use(op.definition, op)
+      if not op.definition.is_uninitialized:
+        stmt = op.definition.parent_statement
+        assert stmt, "%s: has a definition which is unlinked from the tree\n  def: %s" % (repr(op), repr(op.definition))
+        assert stmt is self.function.uninitialized_stmt or stmt.container, "%s: has a definition which is unlinked from the tree" % (repr(op), )
+      assert op.definition.index == op.index, "%s: expected to have the same index as its definition: %s" % (op, op.definition)
+
+    for use in op.uses:
+      assert use.definition, '%s: has a use without definition'
+      assert use.definition is op, '%s: has a use that points to another definition\n  use: %s\n  wrong def: %s\n  should be: %s' % (repr(op), repr(use.parent_statement), repr(use.definition.parent_statement), repr(op.parent_statement))
+      stmt = use.parent_statement
+      assert stmt, "%s: has a use (%s) which is unlinked from the tree" % (repr(op), repr(use))
+      assert stmt is self.function.uninitialized_stmt or use.parent_statement.container, "%s: has a use (%s) which is unlinked from the tree" % (repr(op), repr(use))
+      assert use.definition.index == use.index, "%s: expected to have the same index as its definition: %s" % (use.parent_statement, use.definition.parent_statement)
     return
 
 class ssa_chained_phi_propagator(object):
@@ -703,9 +766,7 @@ class ssa_back_transformer_t(object):
           self.replace_uses(_expr.definition, var)
       phi.unlink()
     else:
-      print 'more than one group'
-      print '   ', repr(groups)
-      raise 'not implemented'
+      raise RuntimeError('more than one group, not implemented: %s' % (repr(groups), ))
 
     return
 
@@ -6,8 +6,9 @@ class statement_t(object):
 
   def __init__(self, ea, expr):
     self.ea = ea
-    self.expr = expr
     self.container = None
+    self.__expr = None
+    self.expr = expr
     return
 
   def copy(self):
@@ -33,10 +34,15 @@ class statement_t(object):
 
   @expr.setter
   def expr(self, value):
+    old = self.__expr
     if value is not None:
       assert isinstance(value, replaceable_t), 'expr is not replaceable'
       value.parent = (self, 'expr')
     self.__expr = value
+    if old is not None and old is not value and old.parent is self and self.container:
+      self.container.block.function.operand_index.detach(old)
+    if value is not None and self.container:
+      self.container.block.function.operand_index.attach(value)
     return
 
   def __getitem__(self, key):
@@ -86,10 +92,37 @@ class container_t(object):
     assert type(block).__name__ == 'function_block_t', 'block must be function_block_t, not %s' % (type(block), )
     self.__block = block
     self.__list = __list or []
+    self.__ordinals = {}
     for item in self.__list:
       item.container = self
+      self.attach(item)
+    self.renumber()
+    return
+
+  def attach(self, stmt):
+    """ add the operands of a statement newly placed in this container
+        to the function's operand index. """
+    self.__block.function.operand_index.attach_statement(stmt)
+    return
+
+  def detach(self, stmt):
+    """ take the operands of a statement leaving this container
+        out of the function's operand index. """
+    if stmt.container is self:
+      stmt.container = None
+      self.__block.function.operand_index.detach_statement(stmt)
+    return
+
+  def renumber(self, start=0):
+    """ update the ordinals of the statements from `start` onwards. """
+    for i in range(start, len(self.__list)):
+      self.__ordinals[id(self.__list[i])] = i
     return
 
+  def ordinal(self, stmt):
+    """ return the index of `stmt` in this container without searching for it. """
+    return self.__ordinals.get(id(stmt))
+
   def __repr__(self):
     return repr(self.__list)
 
@@ -101,13 +134,25 @@ class container_t(object):
 
   def __setitem__(self, key, value):
     if type(key) == slice:
+      for item in self.__list[key]:
+        self.detach(item)
+        self.__ordinals.pop(id(item), None)
       for item in value:
         assert isinstance(item, statement_t), 'cannot set non-statement to container'
         item.container = self
+        self.attach(item)
+      self.__list.__setitem__(key, value)
+      self.renumber()
     else:
       assert isinstance(value, statement_t), 'cannot set non-statement to container'
+      old = self.__list[key]
+      if old is not value:
+        self.detach(old)
+        self.__ordinals.pop(id(old), None)
       value.container = self
-    self.__list.__setitem__(key, value)
+      self.attach(value)
+      self.__list.__setitem__(key, value)
+      self.__ordinals[id(value)] = key if key >= 0 else len(self.__list) + key
     return
 
   def __hash__(self):
@@ -135,7 +180,9 @@ class container_t(object):
   def add(self, stmt):
     assert isinstance(stmt, statement_t), 'cannot add non-statement: %s' % (repr(stmt), )
     self.__list.append(stmt)
+    self.__ordinals[id(stmt)] = len(self.__list) - 1
     stmt.container = self
+    self.attach(stmt)
     return
 
   def extend(self, _new):
@@ -143,17 +190,29 @@ class container_t(object):
       assert isinstance(stmt, statement_t), 'cannot add non-statement to container'
       stmt.container = self
       self.__list.append(stmt)
+      self.__ordinals[id(stmt)] = len(self.__list) - 1
+      self.attach(stmt)
     return
 
   def insert(self, key, _new):
     assert isinstance(_new, statement_t), 'cannot add non-statement: %s' % (repr(_new), )
+    if key < 0:
+      key = max(len(self.__list) + key, 0)
+    key = min(key, len(self.__list))
     self.__list.insert(key, _new)
+    self.renumber(key)
     _new.container = self
+    self.attach(_new)
     return
 
   def pop(self, key=-1):
+    if key < 0:
+      key += len(self.__list)
     stmt = self.__list.pop(key)
+    self.__ordinals.pop(id(stmt), None)
+    self.renumber(key)
     if stmt:
+      self.detach(stmt)
       stmt.container = None
     return stmt
 
@@ -166,9 +225,13 @@ class container_t(object):
     return
 
   def remove(self, stmt):
-    if stmt in self.__list:
-      stmt.container = None
-    return self.__list.remove(stmt)
+    key = self.__list.index(stmt)
+    self.detach(stmt)
+    stmt.container = None
+    del self.__list[key]
+    self.__ordinals.pop(id(stmt), None)
+    self.renumber(key)
+    return
 
 class if_t(statement_t):
   """ if_t is a statement containing an expression and a then-side,
@@ -0,0 +1,176 @@
+""" Callee summaries.
+
+A summary records what a function does that matters to its callers:
+how many stack parameters it takes, which registers it reads and
+spoils, how many bytes it pops off the stack when it returns and
+whether it returns at all. Summaries are computed when a function is
+decompiled and kept in a store. Callers use them twice: once in the
+intermediate form, see apply_summaries(), and again when the calling
+convention resolves the arguments of their calls.
+"""
+
+import os
+import json
+
+import iterators
+
+from expressions import *
+from statements import *
+
+class summary_t(object):
+
+  def __init__(self, ea, params=0, reads=None, spoils=None, cleanup=0, noreturn=False):
+    self.ea = ea
+    self.params = params # number of stack parameters
+    self.reads = reads or [] # names of the registers read before being assigned
+    self.spoils = spoils or [] # names of the registers assigned and not restored
+    self.cleanup = cleanup # number of bytes popped off the stack on return
+    self.noreturn = noreturn # True if the function never returns
+    return
+
+  def __repr__(self):
+    return '<%s %x params=%u reads=%s spoils=%s cleanup=%u noreturn=%s>' % (self.__class__.__name__,
+      self.ea, self.params, repr(self.reads), repr(self.spoils), self.cleanup, repr(self.noreturn))
+
+  def as_dict(self):
+    return {
+      'ea': self.ea,
+      'params': self.params,
+      'reads': self.reads,
+      'spoils': self.spoils,
+      'cleanup': self.cleanup,
+      'noreturn': self.noreturn,
+    }
+
+  @staticmethod
+  def from_dict(d):
+    return summary_t(d['ea'], d['params'], [str(r) for r in d['reads']],
+      [str(r) for r in d['spoils']], d['cleanup'], d['noreturn'])
+
+class summary_store_t(object):
+  """ summaries by function address. when given a file name, the
+      store is loaded from that file if it exists and may be saved
+      back to it. """
+
+  def __init__(self, filename=None):
+    self.filename = filename
+    self.summaries = {}
+    if filename and os.path.exists(filename):
+      self.load()
+    return
+
+  def __len__(self):
+    return len(self.summaries)
+
+  def __contains__(self, ea):
+    return ea in self.summaries
+
+  def get(self, ea):
+    """ return the summary for the function at 'ea', or None. """
+    return self.summaries.get(ea)
+
+  def add(self, summary):
+    self.summaries[summary.ea] = summary
+    return
+
+  def load(self):
+    with open(self.filename, 'rb') as f:
+      for d in json.load(f):
+        self.add(summary_t.from_dict(d))
+    return
+
+  def save(self):
+    summaries = [self.summaries[ea].as_dict() for ea in sorted(self.summaries.keys())]
+    with open(self.filename, 'wb') as f:
+      json.dump(summaries, f, indent=2)
+    return
+
+def call_expression(stmt):
+  """ return the call_t made by 'stmt', or None. """
+  if type(stmt.expr) == call_t:
+    return stmt.expr
+  if type(stmt.expr) == assign_t and type(stmt.expr.op2) == call_t:
+    return stmt.expr.op2
+  return
+
+def apply_summaries(graph, summaries):
+  """ adjust the call sites of known callees in the intermediate form,
+      before it is put in ssa form:
+
+      - the result register is assigned only if the callee spoils it and
+        returns at all.
+      - the bytes popped by a callee on return (stdcall) are added back
+        to the stack register after the call.
+      - nothing follows a call to a function which never returns, the
+        nodes only reached from there are removed. """
+
+  truncated = False
+  for node in graph.nodes.values():
+    statements = []
+    for stmt in node.statements:
+      statements.append(stmt)
+      call = call_expression(stmt)
+      if call is None or type(call.fct) != value_t or call.fct.value not in summaries:
+        continue
+      summary = summaries.get(call.fct.value)
+
+      if type(stmt.expr) == assign_t and type(stmt.expr.op1) == regloc_t and \
+          (summary.noreturn or stmt.expr.op1.name not in summary.spoils):
+        stmt.expr = call
+
+      if summary.noreturn:
+        node.falls_into = None
+        truncated = True
+        break
+
+      if summary.cleanup > 0 and type(call.stack) == regloc_t:
+        size = call.stack.size
+        expr = assign_t(call.stack.copy(), add_t(call.stack.copy(), value_t(summary.cleanup, size)))
+        statements.append(graph.make_statement(stmt.ea, expr))
+
+    node.statements = statements
+
+  if truncated:
+    graph.remove_unreachable_nodes()
+  return
+
+def summarize(dec):
+  """ compute the summary of the function being decompiled by 'dec',
+      once its arguments are renamed. """
+
+  function = dec.function
+  arch = function.arch
+
+  params = 0
+  reads = []
+  for arg in function.arguments:
+    if type(arg.where) == regloc_t:
+      if arg.where.name not in reads:
+        reads.append(arg.where.name)
+    elif type(arg.where) == deref_t and type(arg.where.op) == add_t and \
+        type(arg.where.op.op2) == value_t:
+      # *(esp + 4) is the first parameter, the return address is at *(esp).
+      params = max(params, arg.where.op.op2.value / (arch.address_size / 8))
+
+  restored = [loc.name for loc in dec.restored_locations.values() if type(loc) == regloc_t]
+  spoils = []
+  for op in iterators.operand_iterator_t(function, klass=regloc_t):
+    if type(op) != regloc_t or not op.is_def or arch.is_stackreg(op):
+      continue
+    if op.name not in restored and op.name not in spoils:
+      spoils.append(op.name)
+
+  cleanup = 0
+  returns = 0
+  for block in function.return_blocks:
+    for stmt in block.container:
+      if type(stmt) == return_t:
+        cleanup = max(cleanup, arch.stack_cleanup(stmt.ea))
+        returns += 1
+
+  # a jump out of the function (a tail call, or an indirect jump which
+  # could not be followed) may return to the caller as well.
+  exits = [node for node in function.graph.nodes.values() if node.leaves_function]
+  noreturn = returns == 0 and len(exits) == 0
+
+  return summary_t(function.ea, params, sorted(reads), sorted(spoils), cleanup, noreturn)
@@ -0,0 +1,67 @@
+# coding=utf-8
+
+""" startup benchmark: time 'import decompiler' and the first decompilation
+in fresh interpreters, which is what each worker process pays. run from
+the repository root:
+
+  python tests/bench_startup.py [runs]
+"""
+
+import os
+import re
+import sys
+import json
+import binascii
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'tests', 'data', 'fib-x86-objdump')
+
+# executed by each fresh interpreter, from the src directory.
+CHILD = r'''
+import sys, time, json, binascii
+start = time.time()
+import decompiler
+imported = time.time()
+import capstone
+import host.dis
+import output.c
+code, ea = binascii.unhexlify(sys.argv[1]), int(sys.argv[2])
+md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+dis = host.dis.available_disassemblers['capstone'].create(md, code, ea)
+dec = decompiler.decompiler_t(dis, ea)
+dec.calling_convention = 'cdecl'
+dec.step_until(decompiler.step_decompiled)
+output.c.tokenizer(dec.function).text()
+done = time.time()
+print json.dumps([imported - start, done - imported])
+'''
+
+def first_function():
+  """ return the code and address of the first function in the test data. """
+  with open(DATA) as f:
+    data = f.read()
+  address, body = re.search(r'([a-f0-9]+) <[^>]+>:\n((?:\s+[a-f0-9]+:(?:[\s\t][a-f0-9]{2})+[^\n]*\n)*)', data).groups()
+  hex = ''.join(re.findall(r'^\s*[a-f0-9]*:((?:[\s\t][a-f0-9]{2})*)', body, flags=re.MULTILINE))
+  return hex.replace(' ', '').replace('\t', ''), int(address, 16)
+
+def run_once(hex, ea):
+  output = subprocess.check_output([sys.executable, '-c', CHILD, hex, str(ea)], cwd=os.path.join(ROOT, 'src'))
+  return json.loads(output.splitlines()[-1])
+
+def report(name, times):
+  times = sorted(times)
+  print '%-30s min %7.1f ms  median %7.1f ms' % (name, times[0] * 1000, times[len(times) / 2] * 1000)
+  return
+
+def main():
+  runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+  hex, ea = first_function()
+  results = [run_once(hex, ea) for i in range(runs)]
+  report('import decompiler', [r[0] for r in results])
+  report('first decompilation', [r[1] for r in results])
+  report('total', [r[0] + r[1] for r in results])
+  return
+
+if __name__ == '__main__':
+  main()
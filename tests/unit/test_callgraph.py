@@ -0,0 +1,80 @@
+# coding=utf-8
+
+import unittest
+import threading
+from multiprocessing.pool import ThreadPool
+
+import test_helper
+import callgraph
+
+class TestCallGraph(test_helper.TestHelper):
+
+  graph = {
+    'main': ['parse', 'print'],
+    'parse': ['token', 'expr'],
+    'expr': ['term', 'token'],
+    'term': ['expr', 'token'], # expr and term call each other
+    'token': [],
+    'print': ['print'], # calls itself
+  }
+  order = ['main', 'parse', 'expr', 'term', 'token', 'print']
+
+  def components(self):
+    return callgraph.strongly_connected_components(self.graph, key=self.order.index)
+
+  def test_components(self):
+    """ callees come before their callers, functions calling each other share a component. """
+
+    components = self.components()
+    self.assertEqual(components, [['token'], ['expr', 'term'], ['parse'], ['print'], ['main']])
+
+    position = {name: i for i, component in enumerate(components) for name in component}
+    for name, callees in self.graph.items():
+      for callee in callees:
+        self.assertTrue(position[callee] <= position[name])
+    return
+
+  def test_schedule(self):
+    """ a component starts once all its callees are done, even if one of them failed. """
+
+    components = self.components()
+    lock = threading.Lock()
+    started = []
+    finished = []
+
+    def work(i):
+      with lock:
+        started.append(i)
+        # every component called by this one is already finished.
+        callees = set(callee for name in components[i] for callee in self.graph[name])
+        for j, component in enumerate(components):
+          if j != i and callees.intersection(component):
+            assert j in finished, '%s started before %s' % (components[i], component)
+      if components[i] == ['expr', 'term']:
+        raise ValueError('cannot decompile')
+      return 'ok'
+
+    pool = ThreadPool(3)
+    scheduler = callgraph.scheduler_t(self.graph, components)
+    results = {}
+    for i, result in scheduler.run(pool, work, lambda i: (i, ), lambda i, e: repr(e)):
+      with lock:
+        finished.append(i)
+      results[i] = result
+    pool.close()
+    pool.join()
+
+    self.assertEqual(sorted(started), range(len(components)))
+    self.assertEqual(results, {
+      0: 'ok',
+      1: "ValueError('cannot decompile',)",
+      2: 'ok',
+      3: 'ok',
+      4: 'ok',
+    })
+    self.assertTrue(started.index(2) > finished.index(1))
+    self.assertEqual(finished[-1], 4)
+    return
+
+if __name__ == '__main__':
+  unittest.main()
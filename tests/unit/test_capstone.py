@@ -8,6 +8,7 @@ sys.path.append('./src')
 import capstone
 
 import ssa
+import ir.intel
 import host.dis
 from test_helper import *
 import decompiler
@@ -31,29 +32,10 @@ class TestCapstone(TestHelper):
     expected = """
     func() {
       ecx = edx + esi + 8;
-      %eflags.expr = eax + ebx;
-      %eflags.cf = %eflags.expr < 0;
-      %eflags.pf = PARITY(%eflags.expr);
-      %eflags.af = ADJUST(%eflags.expr);
-      %eflags.zf = !%eflags.expr;
-      %eflags.sf = SIGN(%eflags.expr);
-      %eflags.of = OVERFLOW(%eflags.expr);
       eax = eax + ebx;
-      %eflags.expr = esi + 4660;
-      %eflags.cf = %eflags.expr < 0;
-      %eflags.pf = PARITY(%eflags.expr);
-      %eflags.af = ADJUST(%eflags.expr);
-      %eflags.zf = !%eflags.expr;
-      %eflags.sf = SIGN(%eflags.expr);
-      %eflags.of = OVERFLOW(%eflags.expr);
       esi = esi + 4660;
       %eflags.expr = eax + 291;
       %eflags.cf = %eflags.expr < 0;
-      %eflags.pf = PARITY(%eflags.expr);
-      %eflags.af = ADJUST(%eflags.expr);
-      %eflags.zf = !%eflags.expr;
-      %eflags.sf = SIGN(%eflags.expr);
-      %eflags.of = OVERFLOW(%eflags.expr);
       eax = eax + 291;
       eax = *(ecx + edx * 4 + 291);
       %eflags.expr = ecx + 1;
@@ -72,6 +54,123 @@ class TestCapstone(TestHelper):
     self.assert_ir(self.code32, expected)
     return
 
+  def test_classify(self):
+    """ instructions are classified from capstone's instruction groups. """
+    # je 4; jmp 4; call 9; jmp eax; ret
+    code = "\x74\x02\xeb\x00\xe8\x00\x00\x00\x00\xff\xe0\xc3"
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, code)
+
+    self.assertEqual(dis.get_class(0), ir.intel.insn_class_t(ir.intel.FLOW_CONDITIONAL_JUMP, (4, 2), 2, 2))
+    self.assertEqual(dis.get_class(2), ir.intel.insn_class_t(ir.intel.FLOW_JUMP, (4, ), 4, 2))
+    self.assertEqual(dis.get_class(4), ir.intel.insn_class_t(ir.intel.FLOW_CALL, (), 9, 5))
+    self.assertEqual(dis.get_class(9), ir.intel.insn_class_t(ir.intel.FLOW_JUMP, (None, ), 11, 2))
+    self.assertEqual(dis.get_class(11), ir.intel.insn_class_t(ir.intel.FLOW_RETURN, (), 12, 1))
+
+    self.assertTrue(dis.is_conditional_jump(0))
+    self.assertTrue(dis.has_jump(9))
+    self.assertTrue(dis.is_return(11))
+    self.assertEqual(len(dis.insn_classes), 5)
+    self.assertEqual(dis.get_class(0), dis.insn_classes[dis.insn_ordinals[0]])
+
+    # loop 0; jecxz 4; ljmp 8:0x12345678
+    code = "\xe2\xfe\xe3\x00\xea\x78\x56\x34\x12\x08\x00"
+    dis = host.dis.available_disassemblers['capstone'].create(md, code)
+    self.assertEqual(dis.get_class(0), ir.intel.insn_class_t(ir.intel.FLOW_NORMAL, (), 2, 2))
+    self.assertEqual(dis.get_class(2), ir.intel.insn_class_t(ir.intel.FLOW_NORMAL, (), 4, 2))
+    self.assertEqual(dis.get_class(4), ir.intel.insn_class_t(ir.intel.FLOW_JUMP, (0x12345678, ), 11, 7))
+    return
+
+  def test_operand_cache(self):
+    """ decoded operands are cached, each caller gets its own copy. """
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, self.code32)
+    other = host.dis.available_disassemblers['capstone'].create(md, self.code32)
+    self.assertIs(dis.registers, other.registers)
+
+    op = dis.get_operand_expression(0x11, 1)
+    self.assertEqual(repr(op), '<deref_t * <add_t <reg ecx> + <add_t <mul_t <reg edx> * <value 4>> + <value 291>>>>')
+    again = dis.get_operand_expression(0x11, 1)
+    self.assertEqual(op, again)
+    self.assertIsNot(op, again)
+    self.assertIsNot(op.op, again.op)
+    return
+
+  def test_register_file(self):
+    """ sub-registers overlap their parents but not their siblings. """
+    rf = ir.intel.register_file
+    self.assertEqual(rf.names[:5], ['rax', 'eax', 'ax', 'ah', 'al'])
+    self.assertEqual(rf.parents[ir.intel.AL], ir.intel.AX)
+    self.assertEqual(rf.parents[ir.intel.AH], ir.intel.AX)
+    self.assertEqual(rf.parents[ir.intel.RAX], None)
+    self.assertEqual(rf.subregisters[ir.intel.EAX], [ir.intel.AX, ir.intel.AH, ir.intel.AL])
+    self.assertEqual(rf.full_register(ir.intel.R8B), ir.intel.R8)
+    self.assertTrue(rf.overlaps(ir.intel.AL, ir.intel.RAX))
+    self.assertTrue(rf.overlaps(ir.intel.RAX, ir.intel.AH))
+    self.assertFalse(rf.overlaps(ir.intel.AL, ir.intel.AH))
+    self.assertFalse(rf.overlaps(ir.intel.EAX, ir.intel.EBX))
+
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, self.code32)
+    self.assertEqual(dis.get_regindex('ESP'), ir.intel.ESP)
+    self.assertEqual(dis.get_regname(ir.intel.ESP), 'esp')
+    eax = dis.get_operand_expression(0x4, 0)
+    ah = dis.get_operand_expression(0x27, 0)
+    self.assertEqual((eax.name, ah.name), ('eax', 'ah'))
+    self.assertTrue(dis.registers_overlap(eax, ah))
+    self.assertFalse(dis.registers_overlap(ah, dis.stackreg))
+    return
+
+  @disasm('capstone-x86')
+  def test_partial_register_write(self):
+    """ reading a register after a write to one of its parts is reported. """
+    # mov eax, 1; mov ah, 2; mov ecx, eax; ret
+    d = self.decompile_until("\xb8\x01\x00\x00\x00\xb4\x02\x89\xc1\xc3", decompiler.step_ssa_form_registers)
+    self.assertEqual(d.warnings, [
+      '7: eax is read after a write to the overlapping register ah',
+      '9: eax is read after a write to the overlapping register ah',
+    ])
+
+    # mov al, 1; mov eax, 2; mov ecx, eax; ret
+    d = self.decompile_until("\xb0\x01\xb8\x02\x00\x00\x00\x89\xc1\xc3", decompiler.step_ssa_form_registers)
+    self.assertEqual(d.warnings, [])
+    return
+
+  def test_reset(self):
+    """ disassemblers share their class and tables, and can be reused for another function. """
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, self.code32)
+    other = host.dis.available_disassemblers['capstone'].create(md, self.code64)
+    self.assertIs(type(dis), type(other))
+    self.assertIs(dis.stackreg, other.stackreg)
+    self.assertIs(dis.cf, other.cf)
+
+    def ir_form(dis, ea):
+      d = decompiler.decompiler_t(dis, ea)
+      d.step_until(decompiler.step_ir_form)
+      return self.tokenize(d.function)
+
+    # je 4; ret; ret
+    code = "\x74\x01\xc3\xc3"
+    expected = ir_form(host.dis.available_disassemblers['capstone'].create(md, code, 0x100), 0x100)
+    ir_form(dis, 0)
+    dis.reset(code, 0x100)
+    self.assertEqual(dis.get_function_items(0x100), [0x100, 0x102, 0x103])
+    self.assertMultiLineEqual(ir_form(dis, 0x100), expected)
+    return
+
+  def test_backends(self):
+    """ backends are imported on first use, missing ones are not errors until used. """
+    backends = host.dis.backends_t({'capstone': 'host.capstone.dis', 'missing': 'host.missing.dis'})
+    self.assertEqual(len(backends), 0)
+    self.assertIs(backends['capstone'], host.dis.available_disassemblers['capstone'])
+    self.assertTrue('capstone' in backends)
+    self.assertFalse('missing' in backends)
+    self.assertFalse('unknown' in backends)
+    self.assertRaises(ImportError, lambda: backends['missing'])
+    self.assertEqual(backends.names(), ['capstone'])
+    return
+
 if __name__ == '__main__':
   unittest.main()
 
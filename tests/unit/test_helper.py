@@ -52,6 +52,7 @@ class TestHelper(unittest.TestCase):
   def setUp(self):
     self.disasm = None
     self.calling_convention = None
+    self.summaries = None
     return
 
   def unindent(self, text):
@@ -89,8 +90,6 @@ class TestHelper(unittest.TestCase):
 
   def decompile_until(self, input, last_step):
 
-    ssa.ssa_context_t.index = 0
-
     if self.disasm is None or self.disasm == 'ir-parser':
       dis = parser_disassembler(input)
       dis.stackreg = 'esp'
@@ -104,6 +103,7 @@ class TestHelper(unittest.TestCase):
     dec = decompiler.decompiler_t(dis, 0)
     if self.calling_convention:
       dec.calling_convention = self.calling_convention
+    dec.summaries = self.summaries
     dec.step_until(last_step)
 
     return dec
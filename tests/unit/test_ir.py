@@ -4,6 +4,7 @@ import unittest
 
 import test_helper
 import decompiler
+import iterators
 
 class TestIR(test_helper.TestHelper):
 
@@ -91,5 +92,57 @@ class TestIR(test_helper.TestHelper):
     self.assert_step(decompiler.step_ir_form, input, expected)
     return
 
+  def test_simplify_nested(self):
+    """ Test that nested expressions are simplified from the inside out. """
+
+    input = """
+      a = ((b - 4) + 4) + (c ^ c);
+      if (!(!(a == 0))) goto 100;
+      d = !((a - 1) == 2);
+    100:
+      return d;
+    """
+
+    expected = """
+    func() {
+      a = b;
+      goto loc_3 if(!a) else goto loc_2;
+    loc_2:
+      d = a != 3;
+      goto loc_3;
+    loc_3:
+      return d;
+    }
+    """
+
+    self.assert_step(decompiler.step_ir_form, input, expected)
+    return
+
+  def test_flat_operands(self):
+    """ Test that flat operand lists follow iteroperands. """
+
+    input = """
+      a = *(b + 4) + c * 2;
+      if (a == (b & 1)) goto 100;
+      c = -a;
+    100:
+      return c;
+    """
+
+    dec = self.decompile_until(input, decompiler.step_ir_form)
+    for stmt in iterators.statement_iterator_t(dec.function):
+      triples = iterators.statement_operands(stmt)
+      ops = []
+      for expr in stmt.expressions:
+        for kwargs in ({}, {'depth_first': True}, {'ltr': False}):
+          expected = [id(op) for op in expr.iteroperands(**kwargs)]
+          actual = [id(op) for op in iterators.flat_operands(expr, **kwargs)]
+          self.assertEqual(expected, actual)
+        ops += [id(op) for op in expr.iteroperands()]
+      self.assertEqual(ops, [id(op) for op, parent, key in triples])
+      for op, parent, key in triples:
+        self.assertIs(parent, op.parent)
+    return
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+import unittest
+import StringIO
+
+import test_helper
+from test_helper import disasm
+import decompiler
+from output import c
+
+class TestOutput(test_helper.TestHelper):
+
+  input = """
+        if (a > 1) goto 300;
+        b = 1;
+        if (c > 2) goto 400;
+        b = callee(a, c);
+        goto 400;
+  300:  b = 2;
+  400:  return b;
+  """
+
+  def test_sinks(self):
+    """ the compact buffer and the writer render the same text as the rich tokens. """
+
+    d = self.decompile_until(self.input, decompiler.step_decompiled)
+    t = c.tokenizer(d.function)
+    text = ''.join([str(tok) for tok in t.tokens])
+
+    buf = t.buffer()
+    self.assertEqual(buf.text, text)
+    self.assertEqual(buf.offsets[-1], len(text))
+    for i in range(len(buf)):
+      kind, part, ea = buf.token(i)
+      self.assertEqual(text[buf.offsets[i]:buf.offsets[i+1]], part)
+
+    stream = StringIO.StringIO()
+    t.write(stream, chunk_size=8)
+    self.assertEqual(stream.getvalue(), text)
+    return
+
+  def test_rich_tokens(self):
+    """ matching tokens are linked and tokens know their statement. """
+
+    d = self.decompile_until(self.input, decompiler.step_decompiled)
+    tokens = list(c.tokenizer(d.function).tokens)
+
+    for tok in tokens:
+      if tok.id == c.LMATCH:
+        self.assertEqual(tok.rmatch.lmatch, tok)
+    call = [tok for tok in tokens if str(tok) == 'callee'][0]
+    self.assertEqual(call.ea, 3)
+    return
+
+  def test_else_if(self):
+    """ the nested if of an 'else if' keeps its own address and label. """
+
+    d = self.decompile_until("""
+          if (a == 1) goto 300;
+          if (a == 2) goto 400;
+          b = 3;
+          goto 500;
+    300:  b = 1;
+          goto 500;
+    400:  b = 2;
+    500:  return b;
+    """, decompiler.step_decompiled)
+
+    t = c.tokenizer(d.function)
+    tokens = list(t.tokens)
+    self.assertIn('\n   else if (a0 == 2) {\n', ''.join([str(tok) for tok in tokens]))
+    ifs = [tok for tok in tokens if str(tok) == 'if']
+    self.assertEqual([tok.ea for tok in ifs], [0, 1])
+
+    t = c.tokenizer(d.function)
+    t.display_labels.add(1)
+    text = ''.join([str(tok) for tok in t.tokens])
+    self.assertIn('\n   else loc_1:\n   if (a0 == 2) {\n', text)
+    self.assertEqual(t.buffer().text, text)
+    return
+
+  @disasm('capstone-x86')
+  def test_rename(self):
+    """ a rename only binds the affected tokens again. """
+    # mov eax, [0x1000]; call 0x10; ret
+    code = "\xa1\x00\x10\x00\x00\xe8\x06\x00\x00\x00\xc3"
+
+    d = self.decompile_until(code, decompiler.step_ir_form)
+    t = c.tokenizer(d.function)
+    buf = t.buffer()
+    self.assertIn('eax = *4096;', buf.text)
+    self.assertIn('16();', buf.text)
+
+    self.assertEqual(t.symbols.add_name(0x1000, 'counter'), [buf])
+    self.assertIn('eax = *counter;', buf.text)
+    self.assertEqual(t.symbols.renamed(0x1000), [])
+    self.assertEqual(buf.offsets[-1], len(buf.text))
+
+    t.symbols.add_name(0x10, 'callee')
+    t.symbols.add_name(0, 'main')
+    self.assertTrue(buf.text.startswith('main() {'))
+    self.assertIn('callee();', buf.text)
+    self.assertEqual(buf.text, ''.join([str(tok) for tok in t.tokens]))
+    return
+
+if __name__ == '__main__':
+  unittest.main()
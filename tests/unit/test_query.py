@@ -0,0 +1,60 @@
+# coding=utf-8
+
+import unittest
+
+import test_helper
+import decompiler
+from common.ply import ir_parser
+
+class TestQuery(test_helper.TestHelper):
+
+  input = """
+        esp = esp - 4;
+        *(esp) = ebp;
+        ebp = esp;
+        esp = esp - 24;
+        eax = *(134520864);
+        if (eax > 1) goto 300;
+        eax = callee();
+        *(134520864) = eax;
+  300:  ecx = 134520864;
+        esp = ebp;
+        ebp = *(esp);
+        esp = esp + 4;
+        return eax;
+  """
+
+  def test_lazy(self):
+    """ a query only runs the steps it needs. """
+
+    dec = self.decompile_until(self.input, decompiler.step_nothing_done)
+
+    self.assertEqual(dec.query(decompiler.query_block_count), 3)
+    self.assertEqual(type(dec.current_step), decompiler.step_basic_blocks)
+
+    calls = dec.query(decompiler.query_call_targets)
+    self.assertEqual(calls, [decompiler.call_target_t(6, ir_parser.methods['callee'])])
+    self.assertEqual(type(dec.current_step), decompiler.step_ir_form)
+
+    self.assertEqual(dec.query(decompiler.query_frame_size), 28)
+    self.assertEqual(type(dec.current_step), decompiler.step_stack_propagated)
+
+    # asking again does not go any further.
+    self.assertEqual(dec.query(decompiler.query_block_count), 3)
+    self.assertEqual(type(dec.current_step), decompiler.step_stack_propagated)
+    return
+
+  def test_global_uses(self):
+
+    dec = self.decompile_until(self.input, decompiler.step_nothing_done)
+
+    uses = dec.query(decompiler.query_global_uses, 134520864)
+    self.assertEqual(uses, [
+      decompiler.global_use_t(4, 'read'),
+      decompiler.global_use_t(7, 'write'),
+      decompiler.global_use_t(8, 'address'),
+    ])
+    return
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,75 @@
+# coding=utf-8
+
+import unittest
+import threading
+
+from test_helper import *
+import decompiler
+import host.dis
+
+class TestSessions(TestHelper):
+  """ decompilers keep their state to themselves: many of them can be
+      stepped in turn, or run from different threads, in one process. """
+
+  samples = ['../data/fib-x86-objdump', '../data/loops-x86-objdump', '../data/conditionals-x86-objdump']
+
+  def setUp(self):
+    TestHelper.setUp(self)
+    self.functions = []
+    for sample in self.samples:
+      functions = self.objdump_load(sample)
+      self.functions += [functions[name] for name in sorted(functions.keys())]
+    return
+
+  def create(self, fct):
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, fct.hex, fct.address)
+    dec = decompiler.decompiler_t(dis, fct.address)
+    dec.calling_convention = 'cdecl'
+    return dec
+
+  def decompile(self, fct):
+    dec = self.create(fct)
+    dec.step_until(decompiler.step_decompiled)
+    return self.tokenize(dec.function)
+
+  def test_interleaved(self):
+    """ stepping many decompilers in turn gives the same results as one at a time. """
+
+    expected = [self.decompile(fct) for fct in self.functions]
+
+    sessions = [self.create(fct) for fct in self.functions * 3]
+    pending = [(i, dec.steps()) for i, dec in enumerate(sessions)]
+    while len(pending) > 0:
+      # the most recently started decompilers step first.
+      pending = [(i, steps) for i, steps in reversed(pending) if next(steps, None) is not None]
+
+    for i, dec in enumerate(sessions):
+      self.assertEqual(type(dec.current_step), decompiler.step_decompiled)
+      self.assertMultiLineEqual(self.tokenize(dec.function), expected[i % len(self.functions)])
+      self.assertEqual(dec.warnings, [])
+    return
+
+  def test_threads(self):
+    """ decompilers run from several threads give the same results. """
+
+    expected = [self.decompile(fct) for fct in self.functions]
+
+    results = {}
+    def run(n):
+      results[n] = [self.decompile(fct) for fct in reversed(self.functions)][::-1]
+      return
+
+    threads = [threading.Thread(target=run, args=(n, )) for n in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(sorted(results.keys()), range(4))
+    for n in range(4):
+      self.assertEqual(results[n], expected)
+    return
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,61 @@
+# coding=utf-8
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from test_helper import *
+import decompiler
+import ssa
+import host.dis
+from host.snapshot import snapshot_t, function_t, instruction_record
+
+class TestSnapshot(TestHelper):
+
+  def setUp(self):
+    TestHelper.setUp(self)
+    self.functions_x86 = self.objdump_load('../data/fib-x86-objdump')
+    self.tmpdir = tempfile.mkdtemp()
+    return
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+    return
+
+  def decompile(self, dis, ea):
+    dec = decompiler.decompiler_t(dis, ea)
+    dec.calling_convention = 'cdecl'
+    dec.step_until(decompiler.step_decompiled)
+    return self.tokenize(dec.function)
+
+  def test_offline_host(self):
+    """ a function served from a snapshot decompiles like the live host. """
+
+    fct = self.functions_x86['Fibonacci']
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+    dis = host.dis.available_disassemblers['capstone'].create(md, fct.hex, fct.address)
+
+    snapshot = snapshot_t('x86')
+    items = dis.get_function_items(fct.address)
+    snapshot.add_function(function_t(fct.address, 'Fibonacci', items, False, False))
+    for ea in items:
+      snapshot.instructions[ea] = instruction_record(dis, ea)
+    snapshot.names[fct.address] = 'Fibonacci'
+    snapshot.strings[0x1000] = 'caf\xe9\n'
+
+    filename = os.path.join(self.tmpdir, 'fib.snapshot')
+    snapshot.save(filename)
+    loaded = snapshot_t.load(filename)
+    self.assertEqual(loaded.strings, snapshot.strings)
+    self.assertEqual(loaded.instructions, snapshot.instructions)
+
+    dis.add_name(fct.address, 'Fibonacci')
+    expected = self.decompile(dis, fct.address)
+    offline = host.dis.available_disassemblers['snapshot'].create(loaded, fct.address)
+    self.assertMultiLineEqual(self.decompile(offline, fct.address), expected)
+    self.assertTrue(expected.startswith('Fibonacci('))
+    return
+
+if __name__ == '__main__':
+  unittest.main()
@@ -707,5 +707,57 @@ class TestSSA(test_helper.TestHelper):
     self.assert_step(decompiler.step_ssa_form_derefs, input, expected)
     return
 
+  def test_operand_index(self):
+    """ Test that the operand index follows changes to the tree. """
+
+    input = """
+          a = 1;
+          if (b != 0) goto 300;
+          a = 2;
+    300:  return a;
+    """
+
+    dec = self.decompile_until(input, decompiler.step_ssa_form_registers)
+    index = dec.function.operand_index
+    walk = list(iterators.operand_iterator_t(dec.function, filter=lambda op: isinstance(op, regloc_t)))
+    self.assertEqual([id(op) for op in walk], [id(op) for op in index.find(regloc_t)])
+
+    phis = index.find(phi_t)
+    self.assertEqual(1, len(phis))
+    stmt = phis[0].parent_statement
+    phis[0].pluck()
+    self.assertEqual([], index.find(phi_t))
+
+    stmt.expr.op2 = phi_t()
+    self.assertEqual(0, len(index.find(phi_t)))
+    stmt.expr.op2.append(regloc_t(0, 32, name='a'))
+    self.assertEqual([stmt.expr.op2], index.find(phi_t))
+
+    container = stmt.container
+    stmt.remove()
+    self.assertEqual([], index.find(phi_t))
+    self.assertEqual({}, index.operands[phi_t])
+
+    container.insert(0, stmt)
+    self.assertEqual([stmt.expr.op2], index.find(phi_t))
+    self.assertEqual([0, 1], [container.ordinal(_stmt) for _stmt in container[:2]])
+    container.pop(0)
+    self.assertEqual({}, index.operands[phi_t])
+    return
+
+  def test_many_blocks(self):
+    """ Test that a long chain of blocks does not exhaust the stack. """
+
+    lines = ['a = 0;']
+    for i in range(500):
+      lines.append('if (a == %u) goto 9000;' % (i, ))
+      lines.append('a = a + 1;')
+    lines.append('9000: return a;')
+    input = "\n".join(lines)
+
+    dec = self.decompile_until(input, decompiler.step_ssa_form_registers)
+    self.assertEqual(502, len(dec.function.blocks))
+    return
+
 if __name__ == '__main__':
   unittest.main()
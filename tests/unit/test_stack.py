@@ -5,6 +5,7 @@ import unittest
 import test_helper
 import decompiler
 import ssa
+import propagator
 
 class TestStack(test_helper.TestHelper):
 
@@ -165,5 +166,144 @@ class TestStack(test_helper.TestHelper):
     """)
     return
 
+  def test_stack_merge_agree(self):
+
+    input = """
+          esp = esp - 4;
+          if(a > 1) goto 200;
+    100:  esp = esp - 4;
+          *(esp) = 1;
+          esp = esp + 4;
+          goto 300;
+    200:  esp = esp - 8;
+          *(esp) = 2;
+          esp = esp + 8;
+    300:  return *(esp);
+    """
+
+    self.assert_step(decompiler.step_stack_propagated, input, """
+    func() {
+      goto loc_7 if(a@2 > 1) else goto loc_3;
+    loc_3:
+      *(esp@0 - 8) = 1;
+      esp@7 = esp@0 - 4;
+      goto loc_9;
+    loc_7:
+      *(esp@0 - 12) = 2;
+      esp@5 = esp@0 - 4;
+      goto loc_9;
+    loc_9:
+      return *(esp@0 - 4);
+    }
+    """)
+    return
+
+  def test_stack_merge_disagree(self):
+
+    input = """
+          if(a > 1) goto 200;
+    100:  esp = esp - 4;
+          goto 300;
+    200:  esp = esp - 8;
+    300:  return *(esp + 4);
+    """
+
+    d = self.decompile_until(input, decompiler.step_ssa_form_registers)
+    p = propagator.stack_propagator_t(d.function)
+    p.propagate()
+
+    self.assertEqual([repr(defn) for defn in p.inconsistent], ['<reg esp@4>'])
+    self.assertMultiLineEqual(self.tokenize(d.function), self.unindent("""
+    func() {
+      goto loc_3 if(a@0 > 1) else goto loc_1;
+    loc_1:
+      esp@5 = esp@2 - 4;
+      goto loc_4;
+    loc_3:
+      esp@3 = esp@2 - 8;
+      goto loc_4;
+    loc_4:
+      esp@4 = Φ(esp@5, esp@3, );
+      return *(esp@4 + 4);
+    }
+    """))
+    return
+
+  def test_stack_loop_unbalanced(self):
+    """ a loop which pushes more than it pops is flagged at its header. """
+
+    input = """
+          esp = esp - 8;
+    100:  esp = esp - 4;
+          *(esp) = a;
+          if (a > 1) goto 100;
+          return 0;
+    """
+
+    d = self.decompile_until(input, decompiler.step_stack_propagated)
+    self.assertEqual(d.warnings, ['1: stack pointer esp@2 differs between the paths reaching it'])
+
+    input = """
+          esp = esp - 8;
+    100:  esp = esp - 4;
+          *(esp) = a;
+          esp = esp + 4;
+          if (a > 1) goto 100;
+          return 0;
+    """
+
+    d = self.decompile_until(input, decompiler.step_stack_propagated)
+    self.assertEqual(d.warnings, [])
+    return
+
+  def frame_size(self, input):
+    d = self.decompile_until(input, decompiler.step_stack_propagated)
+    return d.frame_size
+
+  def test_frame_size_realigned(self):
+    """ aligning the stack down may take up to the alignment mask more bytes. """
+
+    input = """
+      esp = esp - 4;
+      *(esp) = ebp;
+      ebp = esp;
+      esp = esp & 4294967280;
+      esp = esp - 32;
+      *(esp + 24) = 0;
+      esp = ebp;
+      ebp = *(esp);
+      esp = esp + 4;
+      return 0;
+    """
+
+    self.assertEqual(self.frame_size(input), 4 + 15 + 32)
+    return
+
+  def test_frame_size_loops(self):
+    """ the stack pointer is followed around loops, unless it keeps going down. """
+
+    input = """
+          esp = esp - 8;
+    100:  esp = esp - 4;
+          *(esp) = a;
+          esp = esp + 4;
+          if (a > 1) goto 100;
+          esp = esp + 8;
+          return 0;
+    """
+
+    self.assertEqual(self.frame_size(input), 12)
+
+    input = """
+          esp = esp - 8;
+    100:  esp = esp - 4;
+          *(esp) = a;
+          if (a > 1) goto 100;
+          return 0;
+    """
+
+    self.assertEqual(self.frame_size(input), None)
+    return
+
 if __name__ == '__main__':
   unittest.main()
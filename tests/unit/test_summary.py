@@ -0,0 +1,149 @@
+# coding=utf-8
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import test_helper
+import decompiler
+import summary
+import host.dis
+from common.ply import ir_parser
+
+class TestSummary(test_helper.TestHelper):
+
+  def setUp(self):
+    test_helper.TestHelper.setUp(self)
+    self.summaries = summary.summary_store_t()
+    return
+
+  def test_summarize(self):
+    """ the summary of a function is added to the store once it is decompiled. """
+
+    input = """
+      eax = *(esp + 4) + *(esp + 8) + ebx;
+      ecx = 1;
+      return eax;
+    """
+
+    self.decompile_until(input, decompiler.step_decompiled)
+
+    s = self.summaries.get(0)
+    self.assertEqual(s.params, 2)
+    self.assertEqual(s.reads, ['ebx'])
+    self.assertEqual(s.spoils, ['eax', 'ecx'])
+    self.assertEqual(s.cleanup, 0)
+    self.assertFalse(s.noreturn)
+    return
+
+  def test_call_uses_summary(self):
+    """ only the registers read by the callee are passed to it. """
+
+    input = """
+      ebx = 1;
+      ecx = 2;
+      eax = callee();
+      return eax;
+    """
+
+    self.assert_step(decompiler.step_calls, input, """
+    func() {
+      ebx@0 = 1;
+      ecx@1 = 2;
+      eax@3 = callee(ebx@0, ecx@1);
+      return eax@3;
+    }
+    """)
+
+    self.summaries.add(summary.summary_t(ir_parser.methods['callee'], reads=['ecx'], spoils=['eax']))
+
+    self.assert_step(decompiler.step_calls, input, """
+    func() {
+      ebx@0 = 1;
+      ecx@1 = 2;
+      eax@3 = callee(ecx@1);
+      return eax@3;
+    }
+    """)
+    return
+
+  def test_call_sites(self):
+    """ the result, stack cleanup and fall-through of calls follow the callee's summary. """
+
+    input = """
+          eax = 5;
+          eax = keep();
+          eax = stdcall();
+          if (eax > 1) goto 300;
+          eax = abort();
+          eax = 2;
+    300:  return eax;
+    """
+
+    self.decompile_until(input, decompiler.step_nothing_done)
+    self.summaries.add(summary.summary_t(ir_parser.methods['keep']))
+    self.summaries.add(summary.summary_t(ir_parser.methods['stdcall'], params=2, spoils=['eax'], cleanup=8))
+    self.summaries.add(summary.summary_t(ir_parser.methods['abort'], noreturn=True))
+
+    self.assert_step(decompiler.step_ir_form, input, """
+    func() {
+      eax = 5;
+      keep();
+      eax = stdcall();
+      esp = esp + 8;
+      goto loc_6 if(eax > 1) else goto loc_4;
+    loc_4:
+      abort();
+    loc_6:
+      return eax;
+    }
+    """)
+    return
+
+  def test_tail_jump(self):
+    """ a function which leaves through a jump to another function may return. """
+
+    md = test_helper.capstone.Cs(test_helper.capstone.CS_ARCH_X86, test_helper.capstone.CS_MODE_32)
+    def decompile(code, ea):
+      dis = host.dis.available_disassemblers['capstone'].create(md, code, ea)
+      dec = decompiler.decompiler_t(dis, ea)
+      dec.summaries = self.summaries
+      dec.step_until(decompiler.step_decompiled)
+      return dec
+
+    # push 1; call 0x3000; add esp, 4; jmp 0x4000
+    decompile("\x6a\x01\xe8\xf9\x0f\x00\x00\x83\xc4\x04\xe9\xf1\x1f\x00\x00", 0x2000)
+    self.assertFalse(self.summaries.get(0x2000).noreturn)
+
+    # call 0x2000; mov eax, 5; ret
+    dec = decompile("\xe8\xfb\x0f\x00\x00\xb8\x05\x00\x00\x00\xc3", 0x1000)
+    self.assertTrue('return 5;' in self.tokenize(dec.function))
+
+    # jmp $
+    decompile("\xeb\xfe", 0x5000)
+    self.assertTrue(self.summaries.get(0x5000).noreturn)
+    return
+
+  def test_store_save_load(self):
+    """ summaries survive a round trip through the store file. """
+
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'summaries.json')
+    try:
+      store = summary.summary_store_t(filename)
+      store.add(summary.summary_t(0x1000, 2, ['ecx'], ['eax', 'edx'], 8, False))
+      store.add(summary.summary_t(0x2000, noreturn=True))
+      store.save()
+
+      store = summary.summary_store_t(filename)
+      self.assertEqual(len(store), 2)
+      s = store.get(0x1000)
+      self.assertEqual((s.params, s.reads, s.spoils, s.cleanup, s.noreturn), (2, ['ecx'], ['eax', 'edx'], 8, False))
+      self.assertTrue(store.get(0x2000).noreturn)
+    finally:
+      shutil.rmtree(directory)
+    return
+
+if __name__ == '__main__':
+  unittest.main()